@@ -29,8 +29,8 @@ SQL:
     return resp.text.strip("` ")
 
 
-def create_report(question, data):
-    prompt = f"""
+def _report_prompt(question, data):
+    return f"""
 You are a reporting AI. Summarize the following data in a clear business-style report.
 
 User Question: {question}
@@ -41,5 +41,29 @@ Data:
 Write a short report:
 """
 
-    resp = genai.GenerativeModel(MODEL).generate_content(prompt)
+
+def create_report(question, data):
+    resp = genai.GenerativeModel(MODEL).generate_content(_report_prompt(question, data))
     return resp.text
+
+
+def _chunk_text(chunk):
+    # chunk.text raises on chunks without text parts (empty / safety-blocked /
+    # finish-only), so read the parts directly
+    parts = []
+    for candidate in chunk.candidates or []:
+        content = getattr(candidate, "content", None)
+        for part in getattr(content, "parts", None) or []:
+            parts.append(getattr(part, "text", "") or "")
+    return "".join(parts)
+
+
+def create_report_stream(question, data):
+    """Yields the report text chunk by chunk as Gemini generates it."""
+    resp = genai.GenerativeModel(MODEL).generate_content(
+        _report_prompt(question, data), stream=True
+    )
+    for chunk in resp:
+        text = _chunk_text(chunk)
+        if text:
+            yield text
@@ -1,3 +1,5 @@
+import json
+
 import requests
 
 OLLAMA_URL = "http://localhost:11434/api/generate"
@@ -14,6 +16,23 @@ def call_llm(prompt):
     return data.get("response", "")
 
 
+def call_llm_stream(prompt):
+    """Yields the response piece by piece (Ollama streams NDJSON lines)."""
+    payload = {"model": MODEL, "prompt": prompt, "stream": True}
+
+    with requests.post(OLLAMA_URL, json=payload, stream=True) as resp:
+        resp.raise_for_status()
+        for line in resp.iter_lines():
+            if not line:
+                continue
+            data = json.loads(line)
+            piece = data.get("response", "")
+            if piece:
+                yield piece
+            if data.get("done"):
+                break
+
+
 def nl_to_sql(question, table_schema):
     prompt = f"""
 You are an SQL generator. Convert the question into a safe SELECT SQL query.
@@ -30,8 +49,8 @@ SQL:
     return call_llm(prompt).strip()
 
 
-def create_report(question, data):
-    prompt = f"""
+def _report_prompt(question, data):
+    return f"""
 Create a clear and short business-style report.
 
 Question: {question}
@@ -41,4 +60,11 @@ Data:
 
 Report:
 """
-    return call_llm(prompt)
+
+
+def create_report(question, data):
+    return call_llm(_report_prompt(question, data))
+
+
+def create_report_stream(question, data):
+    return call_llm_stream(_report_prompt(question, data))
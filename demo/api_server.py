@@ -0,0 +1,400 @@
+# api_server.py
+"""
+Async HTTP API next to the Streamlit app: question -> SQL -> rows ->
+report + chart spec, for many concurrent users and other services.
+
+    python api_server.py            # http://0.0.0.0:8600
+
+    POST /api/ask   {"question": "...", "report": true, "chart": true, "rows": 1000}
+    POST /api/sql   {"question": "..."}
+    GET  /api/health
+
+One asyncio event loop (tornado) serves every request:
+
+- LLM calls are awaited on ollama's AsyncClient, at most API_MAX_LLM_CALLS
+  at a time;
+- blocking work runs in two bounded thread pools: queries in
+  API_DB_WORKERS threads, sized like the DB connection pool, and
+  embeddings / summaries / charts in API_WORKERS. SQL repairs that need
+  the model are LLM calls like any other (async, within API_MAX_LLM_CALLS),
+  so they never hold a DB thread;
+- at most API_MAX_CONCURRENT requests run at once. Up to API_MAX_WAITING
+  more wait (for API_QUEUE_TIMEOUT seconds at most); anything beyond that
+  gets 503 with Retry-After right away, so a burst can't pile up unbounded
+  work behind the database or the model.
+
+The pipeline steps are plain callables (see real_steps), so
+benchmarks/load_test_api.py can run the same server on local stand-ins.
+"""
+
+import asyncio
+import contextlib
+import json
+import math
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import tornado.web
+
+from utils.timing import StageTimer
+
+API_HOST = os.getenv("API_HOST", "0.0.0.0")
+API_PORT = int(os.getenv("API_PORT", "8600"))
+API_MAX_CONCURRENT = int(os.getenv("API_MAX_CONCURRENT", "32"))
+API_MAX_WAITING = int(os.getenv("API_MAX_WAITING", "128"))
+API_QUEUE_TIMEOUT = float(os.getenv("API_QUEUE_TIMEOUT", "10"))
+API_MAX_LLM_CALLS = int(os.getenv("API_MAX_LLM_CALLS", "16"))
+API_DB_WORKERS = int(os.getenv("API_DB_WORKERS", os.getenv("DB_POOL_MAX_SIZE", "10")))
+API_WORKERS = int(os.getenv("API_WORKERS", "8"))
+API_MAX_RESPONSE_ROWS = int(os.getenv("API_MAX_RESPONSE_ROWS", "1000"))
+
+
+class Overloaded(Exception):
+    pass
+
+
+class QueryFailed(Exception):
+    """The SQL could not be run (or repaired); .attempts lists (sql, error)."""
+
+    def __init__(self, message: str, attempts=()):
+        self.attempts = list(attempts)
+        super().__init__(message)
+
+
+class AdmissionControl:
+    """
+    At most max_concurrent requests run; up to max_waiting wait for a slot
+    (queue_timeout seconds at most); the rest are turned away at once.
+    """
+
+    def __init__(self, max_concurrent: int, max_waiting: int, queue_timeout: float):
+        self.max_waiting = max_waiting
+        self.queue_timeout = queue_timeout
+        self._slots = asyncio.Semaphore(max_concurrent)
+        self.running = 0
+        self.waiting = 0
+        self.rejected = 0
+        self.served = 0
+
+    @contextlib.asynccontextmanager
+    async def admit(self):
+        if self._slots.locked() and self.waiting >= self.max_waiting:
+            self.rejected += 1
+            raise Overloaded("too many requests waiting")
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise Overloaded("no free slot within the queue timeout")
+        finally:
+            self.waiting -= 1
+
+        self.running += 1
+        try:
+            yield
+        finally:
+            self.running -= 1
+            self.served += 1
+            self._slots.release()
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "waiting": self.waiting,
+            "served": self.served,
+            "rejected": self.rejected,
+        }
+
+
+class CountingPool(ThreadPoolExecutor):
+    """ThreadPoolExecutor that knows how many jobs it has queued / running."""
+
+    def __init__(self, max_workers: int, thread_name_prefix: str = ""):
+        super().__init__(max_workers=max_workers, thread_name_prefix=thread_name_prefix)
+        self.workers = max_workers
+        self.pending = 0
+        self._pending_lock = threading.Lock()
+
+    def submit(self, fn, *args, **kwargs):
+        with self._pending_lock:
+            self.pending += 1
+        try:
+            future = super().submit(fn, *args, **kwargs)
+        except BaseException:
+            self._finished(None)
+            raise
+        future.add_done_callback(self._finished)
+        return future
+
+    def _finished(self, future):
+        with self._pending_lock:
+            self.pending -= 1
+
+    def stats(self) -> dict:
+        pending = self.pending
+        return {"running": min(pending, self.workers), "queued": max(0, pending - self.workers)}
+
+
+def _json_safe(value):
+    """NaN / inf (e.g. in float result columns) -> None, which JSON can carry."""
+    if isinstance(value, float):
+        return value if math.isfinite(value) else None
+    if isinstance(value, dict):
+        return {k: _json_safe(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_json_safe(v) for v in value]
+    return value
+
+
+def real_steps() -> dict:
+    """
+    The pipeline on the real database and model. Imported here, not at the
+    top, so the load test can start the server without either.
+
+        generate_sql(question, executor, timer)          -> awaitable SQL
+        execute(question, sql, db_pool, llm_slots, timer) -> awaitable dict (QueryFailed)
+        write_report(question, df, executor)             -> awaitable text
+        make_chart(df, question)                         -> (spec dict, message) (blocking)
+    """
+    from db import arrow_to_df
+    from llm_ollama_cloud import create_report_async, forget_sql, nl_to_sql_async, remember_sql
+    from model_registry import warm_up
+    from result_cache import cached_sql_arrow
+    from services.char_service import generate_chart
+    from db_pool import PoolTimeout
+    from sql_repair import SQLRepairError, error_message, llm_fix_async, run_with_repair_async
+    from sql_validator import get_catalog
+
+    warm_up()
+
+    async def generate_sql(question, executor, timer):
+        return await nl_to_sql_async(question, executor=executor, timer=timer)
+
+    async def execute(question, sql, db_pool, llm_slots, timer):
+        loop = asyncio.get_running_loop()
+
+        async def run_query(checked):
+            return await loop.run_in_executor(db_pool, cached_sql_arrow, checked)
+
+        async def llm_fix(prompt, deadline):
+            async with llm_slots:
+                return await llm_fix_async(prompt, deadline)
+
+        catalog = await loop.run_in_executor(db_pool, get_catalog)
+        try:
+            sql, (table, truncated), repairs = await run_with_repair_async(
+                question, sql, run_query, llm_fix, timer=timer, catalog=catalog
+            )
+        except SQLRepairError as e:
+            await loop.run_in_executor(db_pool, forget_sql, question, sql)
+            raise QueryFailed(str(e), e.history) from e
+        except PoolTimeout as e:
+            raise Overloaded(str(e)) from e
+        except Exception as e:
+            # timeout / connection / permission: not retried, SQL stays cached
+            raise QueryFailed(error_message(e), [(sql, error_message(e))]) from e
+
+        def finish():
+            # cached only once it has run, as repaired
+            remember_sql(question, sql)
+            return arrow_to_df(table)
+
+        return {
+            "sql": sql,
+            "table": table,
+            "df": await loop.run_in_executor(db_pool, finish),
+            "truncated": truncated,
+            "repairs": repairs,
+        }
+
+    async def write_report(question, df, executor):
+        return await create_report_async(question, df, executor=executor)
+
+    def make_chart(df, question):
+        fig, msg = generate_chart(df, question)
+        return (json.loads(fig.to_json()) if fig else None), msg
+
+    return {
+        "generate_sql": generate_sql,
+        "execute": execute,
+        "write_report": write_report,
+        "make_chart": make_chart,
+    }
+
+
+class ReportingAPI:
+    def __init__(
+        self,
+        steps: dict,
+        max_concurrent: int = API_MAX_CONCURRENT,
+        max_waiting: int = API_MAX_WAITING,
+        queue_timeout: float = API_QUEUE_TIMEOUT,
+        max_llm_calls: int = API_MAX_LLM_CALLS,
+        db_workers: int = API_DB_WORKERS,
+        workers: int = API_WORKERS,
+    ):
+        self.steps = steps
+        self.admission = AdmissionControl(max_concurrent, max_waiting, queue_timeout)
+        self.llm_slots = asyncio.Semaphore(max_llm_calls)
+        self.db_pool = CountingPool(db_workers, thread_name_prefix="api-db")
+        self.work_pool = CountingPool(workers, thread_name_prefix="api-work")
+
+    async def sql(self, question: str, timer: StageTimer) -> str:
+        async with self.llm_slots:
+            return await self.steps["generate_sql"](question, self.work_pool, timer)
+
+    async def ask(
+        self, question: str, report: bool = True, chart: bool = True, rows: int = API_MAX_RESPONSE_ROWS
+    ) -> dict:
+        loop = asyncio.get_running_loop()
+        timer = StageTimer()
+
+        sql = await self.sql(question, timer)
+        result = await self.steps["execute"](question, sql, self.db_pool, self.llm_slots, timer)
+        table, df = result["table"], result["df"]
+
+        # report (LLM) and chart (CPU) only need the data: run them side by side
+        async def report_job():
+            if not report:
+                return None
+            async with self.llm_slots:
+                with timer.stage("report"):
+                    return await self.steps["write_report"](question, df, self.work_pool)
+
+        async def chart_job():
+            if not chart:
+                return None, None
+            return await loop.run_in_executor(
+                self.work_pool, timer.timed("chart", self.steps["make_chart"]), df, question
+            )
+
+        report_text, (chart_spec, chart_msg) = await asyncio.gather(report_job(), chart_job())
+
+        rows = max(0, min(rows, API_MAX_RESPONSE_ROWS))
+        return {
+            "question": question,
+            "sql": result["sql"],
+            "repairs": result["repairs"],
+            "columns": table.column_names,
+            "rows": table.slice(0, rows).to_pylist(),
+            "row_count": table.num_rows,
+            "truncated": result["truncated"],
+            "report": report_text,
+            "chart": chart_spec,
+            "chart_message": chart_msg,
+            "timings": {**timer.stages, "total": timer.total()},
+        }
+
+    def stats(self) -> dict:
+        return {
+            **self.admission.stats(),
+            "db_queue": self.db_pool.stats()["queued"],
+            "work_queue": self.work_pool.stats()["queued"],
+        }
+
+
+class BaseHandler(tornado.web.RequestHandler):
+    def initialize(self, api: ReportingAPI):
+        self.api = api
+
+    def write_json(self, payload, status: int = 200):
+        self.set_status(status)
+        self.set_header("Content-Type", "application/json; charset=utf-8")
+        # dates, decimals and the like come back as text; NaN (not valid
+        # JSON) as null
+        try:
+            body = json.dumps(payload, default=str, allow_nan=False)
+        except ValueError:
+            body = json.dumps(_json_safe(payload), default=str, allow_nan=False)
+        self.finish(body)
+
+    def read_question(self) -> Optional[dict]:
+        try:
+            body = json.loads(self.request.body or b"{}")
+        except ValueError:
+            body = None
+        if not isinstance(body, dict) or not str(body.get("question", "")).strip():
+            self.write_json({"error": "JSON body with a non-empty 'question' is required"}, 400)
+            return None
+        body["question"] = str(body["question"]).strip()
+        return body
+
+    async def run(self, fn):
+        try:
+            async with self.api.admission.admit():
+                payload = await fn()
+        except Overloaded as e:
+            self.set_header("Retry-After", "5")
+            self.write_json({"error": f"server busy: {e}"}, 503)
+            return
+        except QueryFailed as e:
+            self.write_json({"error": f"SQL Execution Error: {e}", "attempts": e.attempts}, 422)
+            return
+        self.write_json(payload)
+
+
+class AskHandler(BaseHandler):
+    async def post(self):
+        body = self.read_question()
+        if body is None:
+            return
+        try:
+            rows = int(body.get("rows", API_MAX_RESPONSE_ROWS))
+        except (TypeError, ValueError):
+            self.write_json({"error": "'rows' must be an integer"}, 400)
+            return
+        await self.run(
+            lambda: self.api.ask(
+                body["question"],
+                report=bool(body.get("report", True)),
+                chart=bool(body.get("chart", True)),
+                rows=rows,
+            )
+        )
+
+
+class SQLHandler(BaseHandler):
+    async def post(self):
+        body = self.read_question()
+        if body is None:
+            return
+
+        async def generate():
+            timer = StageTimer()
+            sql = await self.api.sql(body["question"], timer)
+            return {"question": body["question"], "sql": sql, "timings": timer.stages}
+
+        await self.run(generate)
+
+
+class HealthHandler(BaseHandler):
+    def get(self):
+        self.write_json({"status": "ok", **self.api.stats()})
+
+
+def make_app(steps: Optional[dict] = None, **limits) -> tornado.web.Application:
+    api = ReportingAPI(steps or real_steps(), **limits)
+    return tornado.web.Application(
+        [
+            (r"/api/ask", AskHandler, {"api": api}),
+            (r"/api/sql", SQLHandler, {"api": api}),
+            (r"/api/health", HealthHandler, {"api": api}),
+        ]
+    )
+
+
+async def main():
+    app = make_app()
+    app.listen(API_PORT, address=API_HOST)
+    print(
+        f"- Reporting API on http://{API_HOST}:{API_PORT} "
+        f"(max {API_MAX_CONCURRENT} concurrent, {API_MAX_WAITING} waiting)"
+    )
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,18 +1,31 @@
 # app.py
 import streamlit as st
-from db import run_sql
-from llm_ollama_cloud import nl_to_sql, create_report
+from concurrent.futures import ThreadPoolExecutor
+from db import arrow_to_df
+from result_cache import cached_sql_arrow
+from sql_repair import SQLRepairError, error_message, run_with_repair
+from llm_ollama_cloud import nl_to_sql, create_report_stream, forget_sql, remember_sql
+from model_registry import warm_up
 
 # ? replace the  OG chart generation with the services module
 # from chart_generator import generate_chart
 
-import pandas as pd
 from services.char_service import generate_chart
+from utils.timing import StageTimer
+
+
+@st.cache_resource
+def get_executor() -> ThreadPoolExecutor:
+    # one pool per server process (Streamlit reruns this script per interaction)
+    return ThreadPoolExecutor(max_workers=8, thread_name_prefix="pipeline")
 
 
 st.set_page_config(page_title="AI Database Reporting", layout="wide")
 st.title("AI Database Reporting")
 
+# load the embedding model in the background while the user types
+warm_up()
+
 question = st.text_input("Ask a question about your database:")
 
 if st.button("Generate Report"):
@@ -21,31 +34,66 @@ if st.button("Generate Report"):
         st.error("Please enter a question.")
         st.stop()
 
+    timer = StageTimer()
+
     st.info("Generating SQL...")
-    sql = nl_to_sql(question)
-    st.code(sql, language="sql")
+    # tokens are shown as they arrive; nl_to_sql returns as soon as the SQL
+    # block is complete, so execution starts without waiting for the rest
+    sql_box = st.empty()
+    sql = nl_to_sql(
+        question,
+        on_partial=lambda text: sql_box.code(text, language="sql"),
+        timer=timer,
+    )
+    sql_box.code(sql, language="sql")
+
+    # validated locally, then executed (or served from the result cache);
+    # unknown names are fixed against the schema catalog, other errors go
+    # back to the LLM (bounded attempts / time)
+    def show_repair(new_sql, error, how):
+        st.warning(f"{error} ({how})")
+        sql_box.code(new_sql, language="sql")
 
     try:
-        columns, rows = run_sql(sql)
-    except Exception as e:
+        sql, (table, truncated), repairs = run_with_repair(
+            question, sql, cached_sql_arrow, on_repair=show_repair, timer=timer
+        )
+    except SQLRepairError as e:
+        forget_sql(question, sql)
         st.error(f"SQL Execution Error: {e}")
         st.stop()
+    except Exception as e:
+        # timeout / connection / permission: not the SQL's fault, it stays cached
+        st.error(f"SQL Execution Error: {error_message(e)}")
+        st.stop()
+    # cached only once it has run, as repaired
+    remember_sql(question, sql)
 
-    data = [dict(zip(columns, r)) for r in rows]
+    # zero-copy view for numeric columns; the Arrow table itself feeds st.dataframe
+    df = arrow_to_df(table)
 
-    st.subheader("Raw Data")
-    st.dataframe(data, use_container_width=True)
+    # report, chart and table are independent once the data is here: the chart
+    # (column classification + Plotly build) runs in a worker thread while this
+    # thread renders the table and streams the report. Streamlit elements are
+    # only ever written from this thread.
+    chart_job = get_executor().submit(timer.timed("chart", generate_chart), df, question)
 
-    st.info("Generating report...")
-    report = create_report(question, data)
+    st.subheader("Raw Data")
+    if truncated:
+        st.warning(f"Result truncated to the first {table.num_rows:,} rows.")
+    st.dataframe(table, use_container_width=True)
 
     st.subheader("Report")
-    st.write(report)
+    # rendered incrementally while the model writes it
+    with timer.stage("report"):
+        report = st.write_stream(create_report_stream(question, df))
 
     st.subheader("Charts")
     # fig, msg = generate_chart(pd.DataFrame(data))
-    fig, msg = generate_chart(pd.DataFrame(data), question)
+    fig, msg = chart_job.result()
     if fig:
         st.plotly_chart(fig, use_container_width=True)
     else:
         st.info(msg)
+
+    st.caption(f"Timings: {timer.summary()}")
@@ -0,0 +1,116 @@
+# benchmarks/bench_arrow.py
+"""
+Result pipeline on a 1M-row result: the old list-of-dicts path vs. the
+Arrow columnar path used by app.py.
+
+  old: rows -> [dict per row] -> pd.DataFrame -> deep-copy clean -> groupby
+  new: row batches -> Arrow table -> zero-copy pandas -> clean -> groupby
+
+Rows are generated in memory to look like pyodbc output (int, str,
+Decimal, datetime), so no database is needed. Run from the demo/ folder:
+
+    python -m benchmarks.bench_arrow            # 1,000,000 rows
+    python -m benchmarks.bench_arrow 200000
+"""
+
+import sys
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import pandas as pd
+
+from db import FETCH_ARRAYSIZE, arrow_to_df, rows_to_arrow
+from utils.numeric_cleaner import clean_numeric_columns
+
+DESCRIPTION = [
+    ("InvoiceId", int, None, 10, 10, 0, False),
+    ("Region", str, None, 50, 50, 0, True),
+    ("Amount", Decimal, None, 18, 18, 2, True),
+    ("InvoiceDate", datetime, None, 23, 23, 3, True),
+]
+REGIONS = ["North", "South", "East", "West", "Central"]
+
+
+def synthetic_rows(n: int):
+    start = datetime(2024, 1, 1)
+    return [
+        (
+            i,
+            REGIONS[i % len(REGIONS)],
+            Decimal(i % 1000) / 4,
+            start + timedelta(minutes=i),
+        )
+        for i in range(n)
+    ]
+
+
+def _old_clean(df):
+    # the original clean_numeric_columns: deep copy before converting
+    out = df.copy()
+    for col in out.columns:
+        if out[col].dtype == object:
+            converted = pd.to_numeric(out[col], errors="coerce")
+            if converted.notna().mean() > 0.7:
+                out[col] = converted
+    return out
+
+
+class _Stages:
+    def __init__(self, label):
+        self.label = label
+        self.times = []
+        self._t = time.perf_counter()
+
+    def mark(self, name):
+        now = time.perf_counter()
+        self.times.append((name, now - self._t))
+        self._t = now
+
+    def report(self):
+        total = sum(t for _, t in self.times)
+        print(f"{self.label}: {total:.2f}s")
+        for name, t in self.times:
+            print(f"  {name:<24} {t:6.2f}s")
+        return total
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    print(f"Generating {n:,} rows...")
+    rows = synthetic_rows(n)
+    columns = [c[0] for c in DESCRIPTION]
+    print()
+
+    old = _Stages("old (list of dicts)")
+    data = [dict(zip(columns, r)) for r in rows]
+    old.mark("rows -> dicts")
+    df = pd.DataFrame(data)
+    old.mark("dicts -> DataFrame")
+    df = _old_clean(df)
+    old.mark("clean numerics")
+    df.groupby("Region", as_index=False)["Amount"].sum()
+    old.mark("groupby")
+    del data, df
+    old_total = old.report()
+
+    new = _Stages("new (Arrow)")
+    batches = (
+        (DESCRIPTION, rows[i : i + FETCH_ARRAYSIZE])
+        for i in range(0, n, FETCH_ARRAYSIZE)
+    )
+    table = rows_to_arrow(batches)
+    new.mark("batches -> Arrow")
+    df = arrow_to_df(table)
+    new.mark("Arrow -> DataFrame")
+    df = clean_numeric_columns(df)
+    new.mark("clean numerics")
+    df.groupby("Region", as_index=False)["Amount"].sum()
+    new.mark("groupby")
+    new_total = new.report()
+
+    print(f"\nSpeed-up: {old_total / new_total:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+# benchmarks/bench_classify.py
+"""
+classify_columns latency by column count: the original per-column loop
+(3 cos_sim calls + nunique per column, all names re-embedded every call)
+vs. the batched version (one matmul, memoized name embeddings, one
+nunique pass).
+
+Run from the demo/ folder:
+
+    python -m benchmarks.bench_classify
+"""
+
+import time
+
+import numpy as np
+import pandas as pd
+
+from services import semantic_engine
+from services.semantic_engine import _concept_embeddings, _embed, classify_columns
+
+COLUMN_COUNTS = [10, 50, 200, 500]
+ROWS = 5_000
+REPEAT = 5
+
+NAME_PARTS = ["Customer", "Invoice", "Branch", "Item", "Tax", "Net", "Gross", "Posting"]
+NAME_KINDS = ["Amount", "Code", "Name", "Date", "Qty", "Rate", "Flag", "Type"]
+
+
+def synthetic_frame(n_cols: int) -> pd.DataFrame:
+    rng = np.random.default_rng(n_cols)
+    data = {}
+    for i in range(n_cols):
+        name = f"{NAME_PARTS[i % len(NAME_PARTS)]}{NAME_KINDS[(i // 8) % len(NAME_KINDS)]}{i}"
+        if i % 3 == 0:
+            data[name] = rng.choice(["A", "B", "C", "D", "E"], ROWS)
+        elif i % 3 == 1:
+            data[name] = rng.random(ROWS) * 1000
+        else:
+            data[name] = rng.integers(0, 2, ROWS)
+    return pd.DataFrame(data)
+
+
+def classify_columns_loop(df: pd.DataFrame):
+    """The original implementation, kept here for comparison."""
+    dims, metrics, dates, flags = [], [], [], []
+    dim_emb, met_emb, date_emb = _concept_embeddings()
+    col_embs = np.asarray(_embed(df.columns.tolist()), dtype="float32")
+
+    for i, col in enumerate(df.columns):
+        sim_dim = float(np.max(dim_emb @ col_embs[i]))
+        sim_met = float(np.max(met_emb @ col_embs[i]))
+        sim_date = float(np.max(date_emb @ col_embs[i]))
+
+        if sim_date > 0.6:
+            dates.append(col)
+        elif sim_met > sim_dim and pd.api.types.is_numeric_dtype(df[col]):
+            metrics.append(col)
+        elif df[col].nunique() <= 3:
+            flags.append(col)
+        else:
+            dims.append(col)
+    return {"dimensions": dims, "metrics": metrics, "dates": dates, "flags": flags}
+
+
+def _ms(fn, df):
+    times = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        fn(df)
+        times.append((time.perf_counter() - start) * 1000)
+    return float(np.median(times))
+
+
+def main():
+    # compare the live embedding paths, not lookups in data/column_roles.json
+    semantic_engine.known_column_roles = lambda: {}
+    _concept_embeddings()  # load the model + concepts outside the timings
+    print(f"{'columns':>8} {'loop':>12} {'batched cold':>14} {'batched warm':>14}")
+    for n in COLUMN_COUNTS:
+        df = synthetic_frame(n)
+        loop_ms = _ms(classify_columns_loop, df)
+
+        semantic_engine._name_cache.clear()
+        start = time.perf_counter()
+        result = classify_columns(df)
+        cold_ms = (time.perf_counter() - start) * 1000
+        warm_ms = _ms(classify_columns, df)
+
+        assert result == classify_columns_loop(df)
+        print(f"{n:>8} {loop_ms:>10.1f}ms {cold_ms:>12.1f}ms {warm_ms:>12.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
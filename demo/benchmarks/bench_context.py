@@ -0,0 +1,116 @@
+# benchmarks/bench_context.py
+"""
+nl_to_sql prompt size before (top-5 raw snippets + all join hints) and after
+context packing, plus how much of a fixed evaluation set is still covered:
+the tables and columns each question needs must appear in the context.
+
+Edit EVAL to match your database. Needs a built index and column-role index
+(see README). Run from the demo/ folder:
+
+    python -m benchmarks.bench_context          # prompt tokens + coverage
+    python -m benchmarks.bench_context --llm    # also time the LLM on both
+"""
+
+import argparse
+import statistics
+import time
+
+from context_packer import CONTEXT_TOP_K, pack_context
+from llm_ollama_cloud import _join_hints, call_ollama, sql_prompt
+from rag_index import retrieve_schema_hits
+from services.result_summarizer import estimate_tokens
+
+# question -> tables ("schema.table") and columns the SQL needs
+EVAL = [
+    {
+        "question": "total sales by party for last month",
+        "tables": ["dbo.sales", "dbo.partymaster"],
+        "columns": ["pcode"],
+    },
+    {
+        "question": "top 10 customers by outstanding balance",
+        "tables": ["dbo.partymaster"],
+        "columns": ["pcode"],
+    },
+    {
+        "question": "list employees with allowance above 5000",
+        "tables": ["dbo.allowance"],
+        "columns": [],
+    },
+    {
+        "question": "monthly purchase trend for 2024",
+        "tables": ["dbo.purchase"],
+        "columns": [],
+    },
+    {
+        "question": "which vendors supplied the most items",
+        "tables": ["dbo.purchase"],
+        "columns": [],
+    },
+]
+
+
+def _coverage(context: str, case) -> float:
+    text = context.lower()
+    needed = [f"[{t.split('.')[0]}].[{t.split('.')[1]}]".lower() for t in case["tables"]]
+    needed += [c.lower() for c in case["columns"]]
+    if not needed:
+        return 1.0
+    return sum(n in text for n in needed) / len(needed)
+
+
+def _llm_seconds(prompt: str) -> float:
+    start = time.perf_counter()
+    call_ollama(prompt)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--llm", action="store_true", help="also time the LLM call")
+    args = parser.parse_args()
+
+    rows = []
+    for case in EVAL:
+        q = case["question"]
+        q_emb, hits = retrieve_schema_hits(q, top_k=CONTEXT_TOP_K)
+        hints = _join_hints(q)
+
+        before_ctx = "\n\n".join(text for _, text in hits[:5])
+        before = sql_prompt(q, before_ctx, hints)
+
+        start = time.perf_counter()
+        after_ctx, after_hints = pack_context(q, q_emb, hits, hints)
+        pack_ms = (time.perf_counter() - start) * 1000
+        after = sql_prompt(q, after_ctx, after_hints)
+
+        row = {
+            "before_tokens": estimate_tokens(before),
+            "after_tokens": estimate_tokens(after),
+            "before_cov": _coverage(before_ctx, case),
+            "after_cov": _coverage(after_ctx, case),
+            "pack_ms": pack_ms,
+        }
+        if args.llm:
+            row["before_s"] = _llm_seconds(before)
+            row["after_s"] = _llm_seconds(after)
+        rows.append(row)
+        print(
+            f"{q[:45]:<45} tokens {row['before_tokens']:>6} -> {row['after_tokens']:>5}   "
+            f"coverage {row['before_cov']:.2f} -> {row['after_cov']:.2f}"
+        )
+
+    def mean(key):
+        return statistics.mean(r[key] for r in rows)
+
+    print(
+        f"\nmean prompt tokens {mean('before_tokens'):.0f} -> {mean('after_tokens'):.0f}, "
+        f"coverage {mean('before_cov'):.2f} -> {mean('after_cov'):.2f}, "
+        f"packing {mean('pack_ms'):.2f} ms"
+    )
+    if args.llm:
+        print(f"mean LLM latency {mean('before_s'):.2f}s -> {mean('after_s'):.2f}s")
+
+
+if __name__ == "__main__":
+    main()
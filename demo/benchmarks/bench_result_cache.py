@@ -0,0 +1,49 @@
+# benchmarks/bench_result_cache.py
+"""
+One query through the result cache: cold execution, memory-tier hit, and
+disk-tier hit (a fresh cache instance, as after an app restart). Needs the
+database and data/db_schema.json; the query must read catalog tables.
+Run from the demo/ folder:
+
+    python -m benchmarks.bench_result_cache "SELECT * FROM dbo.Sales"
+"""
+
+import statistics
+import sys
+import time
+
+import result_cache
+from result_cache import ResultCache, cached_sql_arrow
+
+REPEAT = 20
+
+
+def _ms(fn) -> float:
+    start = time.perf_counter()
+    fn()
+    return (time.perf_counter() - start) * 1000
+
+
+def main():
+    sql = sys.argv[1] if len(sys.argv) > 1 else "SELECT TOP 100000 * FROM dbo.Sales"
+    result_cache._cache = ResultCache()
+    result_cache._cache.invalidate()
+
+    cold = _ms(lambda: cached_sql_arrow(sql))
+    memory = [_ms(lambda: cached_sql_arrow(sql)) for _ in range(REPEAT)]
+
+    disk = []
+    for _ in range(REPEAT):
+        result_cache._cache = ResultCache()  # empty memory tier
+        disk.append(_ms(lambda: cached_sql_arrow(sql)))
+
+    table, _ = cached_sql_arrow(sql)
+    print(f"{table.num_rows:,} rows, {table.nbytes / 1024 / 1024:.1f} MB")
+    print(f"cold (query)  {cold:9.1f} ms")
+    print(f"memory hit    {statistics.median(memory):9.2f} ms")
+    print(f"disk hit      {statistics.median(disk):9.2f} ms")
+    print(result_cache.get_result_cache().stats())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+# benchmarks/bench_retrieval.py
+"""
+Per-question retrieval latency: reading the FAISS index + texts from disk
+on every question (old behaviour) vs. the resident cache in rag_index.
+
+Needs a built index (see README). Run from the demo/ folder:
+
+    python -m benchmarks.bench_retrieval
+"""
+
+import statistics
+import time
+
+import numpy as np
+
+import rag_index
+
+QUESTIONS = [
+    "total sales by region last month",
+    "top 10 customers by outstanding balance",
+    "list employees with allowance above 5000",
+    "monthly purchase trend for 2024",
+    "which vendors supplied the most items",
+]
+REPEAT = 20
+
+
+def _time(fn, n):
+    times = []
+    for i in range(n):
+        start = time.perf_counter()
+        fn(i)
+        times.append((time.perf_counter() - start) * 1000)
+    return times
+
+
+def _report(label, times):
+    times = sorted(times)
+    p95 = times[int(len(times) * 0.95) - 1]
+    print(
+        f"{label:<28} mean {statistics.mean(times):8.3f} ms   "
+        f"p50 {statistics.median(times):8.3f} ms   p95 {p95:8.3f} ms"
+    )
+
+
+def main():
+    model = rag_index.get_model()
+    q_embs = np.asarray(
+        model.encode(QUESTIONS, normalize_embeddings=True), dtype="float32"
+    )
+    n = len(QUESTIONS) * REPEAT
+
+    # Index access + search only (query embedding precomputed)
+    def uncached_search(i):
+        index, texts = rag_index.load_index()
+        _, idx = index.search(q_embs[i % len(QUESTIONS)][None, :], 5)
+        return [texts[j] for j in idx[0] if j >= 0]
+
+    def cached_search(i):
+        index, texts = rag_index.get_index()
+        _, idx = index.search(q_embs[i % len(QUESTIONS)][None, :], 5)
+        return [texts[j] for j in idx[0] if j >= 0]
+
+    rag_index.get_index()  # warm the cache
+    index, _ = rag_index.get_index()
+    print(f"Index vectors: {index.ntotal}, questions per run: {n}\n")
+
+    print("Index load + search:")
+    _report("  before (load_index)", _time(uncached_search, n))
+    _report("  after (resident cache)", _time(cached_search, n))
+
+    # Full retrieve_schema_snippets, including the question embedding
+    def uncached_retrieve(i):
+        index, texts = rag_index.load_index()
+        q = model.encode([QUESTIONS[i % len(QUESTIONS)]], normalize_embeddings=True)
+        _, idx = index.search(np.asarray(q, dtype="float32"), 5)
+        return [texts[j] for j in idx[0] if j >= 0]
+
+    def cached_retrieve(i):
+        return rag_index.retrieve_schema_snippets(QUESTIONS[i % len(QUESTIONS)], top_k=5)
+
+    print("\nFull retrieval (embedding + search):")
+    _report("  before (load_index)", _time(uncached_retrieve, n))
+    _report("  after (resident cache)", _time(cached_retrieve, n))
+
+
+if __name__ == "__main__":
+    main()
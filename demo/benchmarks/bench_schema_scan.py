@@ -0,0 +1,145 @@
+# benchmarks/bench_schema_scan.py
+"""
+schema_scanner tables/second, serial scan vs. fast scan, on a stand-in
+database: the tables live in a temporary SQLite file behind a minimal
+pyodbc-like connection that answers the scanner's queries, and every
+execute() waits --rtt-ms first, like a round-trip to SQL Server would.
+No database needed. Run from the demo/ folder:
+
+    python -m benchmarks.bench_schema_scan
+    python -m benchmarks.bench_schema_scan --tables 5000 --rtt-ms 2 --workers 8
+
+Output goes to a temporary folder, not to data/.
+"""
+
+import argparse
+import os
+import re
+import sqlite3
+import tempfile
+import time
+
+import db
+import schema_scanner
+from db_pool import ConnectionPool
+
+_TOP_RE = re.compile(r"SELECT TOP \((\d+)\) \* FROM \[([^\]]+)\]\.\[([^\]]+)\]")
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self._conn = conn
+        self._rows = []
+
+    def execute(self, sql, *params):
+        time.sleep(self._conn.rtt)
+        if len(params) == 1 and isinstance(params[0], tuple):
+            params = params[0]
+        catalog = self._conn.catalog
+        m = _TOP_RE.search(sql)
+        if m:
+            n, _, table = m.groups()
+            self._rows = self._conn.sqlite.execute(
+                f'SELECT * FROM "{table}" LIMIT {int(n)}'
+            ).fetchall()
+        elif "INFORMATION_SCHEMA.COLUMNS" in sql and params:
+            self._rows = [(c, t, "YES") for c, t in catalog[params]]
+        elif "INFORMATION_SCHEMA.COLUMNS" in sql:
+            self._rows = [
+                (s, t, c, dtype, "YES") for (s, t), cols in catalog.items() for c, dtype in cols
+            ]
+        elif "INFORMATION_SCHEMA.TABLES" in sql:
+            self._rows = list(catalog)
+        else:  # pool health check
+            self._rows = [(1,)]
+        return self
+
+    def fetchall(self):
+        rows, self._rows = self._rows, []
+        return rows
+
+    def fetchmany(self, size):
+        rows, self._rows = self._rows[:size], self._rows[size:]
+        return rows
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    """The parts of a pyodbc connection that schema_scanner and the pool use."""
+
+    def __init__(self, path, catalog, rtt):
+        self.sqlite = sqlite3.connect(path, check_same_thread=False)
+        self.catalog = catalog
+        self.rtt = rtt
+        self.timeout = 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.sqlite.close()
+
+
+def make_database(path, tables: int):
+    """(schema, table) -> [(column, type)], with a few rows in every table."""
+    catalog = {}
+    conn = sqlite3.connect(path)
+    for i in range(tables):
+        name = f"T{i:05d}"
+        cols = [("Id", "int"), ("Code", "varchar"), ("Amount", "decimal")]
+        cols += [(f"Attr{j}", "nvarchar") for j in range(i % 8)]
+        catalog[("dbo", name)] = cols
+        conn.execute(f'CREATE TABLE "{name}" ({", ".join(c for c, _ in cols)})')
+        conn.executemany(
+            f'INSERT INTO "{name}" VALUES ({", ".join("?" * len(cols))})',
+            [(r, f"C{r}", r * 1.5, *[f"v{j}" for j in range(len(cols) - 3)]) for r in range(5)],
+        )
+    conn.commit()
+    conn.close()
+    return catalog
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tables", type=int, default=2000)
+    parser.add_argument("--rtt-ms", type=float, default=1.0)
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "standin.sqlite")
+        catalog = make_database(path, args.tables)
+        db._pool = ConnectionPool(
+            lambda: FakeConnection(path, catalog, args.rtt_ms / 1000),
+            min_size=0,
+            max_size=args.workers,
+        )
+        # column roles embed every column: not what is measured here
+        schema_scanner._build_column_roles = lambda: None
+
+        cwd = os.getcwd()
+        os.chdir(tmp)
+        try:
+            results = {}
+            for label, fast in (("serial", False), ("fast", True)):
+                start = time.perf_counter()
+                schema_scanner.scan_schema(fast=fast, workers=args.workers)
+                results[label] = time.perf_counter() - start
+        finally:
+            os.chdir(cwd)
+
+    print(
+        f"\n{args.tables} tables, {args.rtt_ms:.1f} ms per round-trip, "
+        f"{args.workers} workers"
+    )
+    for label, elapsed in results.items():
+        print(f"{label:<7} {elapsed:7.2f}s  {args.tables / elapsed:8.0f} tables/s")
+
+
+if __name__ == "__main__":
+    main()
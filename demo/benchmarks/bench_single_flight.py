@@ -0,0 +1,73 @@
+# benchmarks/bench_single_flight.py
+"""
+A burst of identical requests (a shared report link opened by many users at
+once) against a slow upstream stand-in (LLM / database = a sleep), with and
+without request coalescing: upstream calls made and wall time, for threads
+(Streamlit sessions) and coroutines (api_server). Run from the demo/ folder:
+
+    python -m benchmarks.bench_single_flight
+    python -m benchmarks.bench_single_flight 200 0.5
+"""
+
+import asyncio
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.single_flight import AsyncSingleFlight, SingleFlight
+
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    upstream_s = float(sys.argv[2]) if len(sys.argv) > 2 else 0.5
+    # the upstream serves this many calls at once (e.g. LLM rate limit / DB pool)
+    upstream_slots = 10
+
+    slots = threading.BoundedSemaphore(upstream_slots)
+    calls = {"n": 0}
+
+    def upstream(question):
+        with slots:
+            calls["n"] += 1
+            time.sleep(upstream_s)
+            return f"SELECT ... -- {question}"
+
+    flights = SingleFlight()
+    for label, fn in [
+        ("threads, no coalescing", upstream),
+        ("threads, single-flight", lambda q: flights.do(q, upstream, q)),
+    ]:
+        calls["n"] = 0
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=users) as pool:
+            list(pool.map(fn, ["total sales by region"] * users))
+        print(f"{label:<26} {calls['n']:>4} upstream calls  {time.perf_counter() - start:6.2f}s")
+
+    async def run_async(coalesce: bool):
+        async_slots = asyncio.Semaphore(upstream_slots)
+
+        async def upstream_async(question):
+            async with async_slots:
+                calls["n"] += 1
+                await asyncio.sleep(upstream_s)
+                return f"SELECT ... -- {question}"
+
+        async_flights = AsyncSingleFlight()
+
+        async def request(q):
+            if coalesce:
+                return await async_flights.do(q, upstream_async, q)
+            return await upstream_async(q)
+
+        await asyncio.gather(*(request("total sales by region") for _ in range(users)))
+
+    for label, coalesce in [("asyncio, no coalescing", False), ("asyncio, single-flight", True)]:
+        calls["n"] = 0
+        start = time.perf_counter()
+        asyncio.run(run_async(coalesce))
+        print(f"{label:<26} {calls['n']:>4} upstream calls  {time.perf_counter() - start:6.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+# benchmarks/bench_startup.py
+"""
+Cold-start cost of the Streamlit app.
+
+Measures, in fresh interpreters:
+  - import-to-first-render: importing everything app.py imports, which is
+    what Streamlit runs before the page title shows up (models are lazy);
+  - eager load: the same imports plus loading the embedding model and the
+    concept embeddings, i.e. what every process paid up-front before the
+    model registry;
+  - first classify_columns() call with a warm concept cache on disk.
+
+Run from the demo/ folder:
+
+    python -m benchmarks.bench_startup
+"""
+
+import statistics
+import subprocess
+import sys
+
+RUNS = 3
+
+IMPORTS = """
+import time
+t0 = time.perf_counter()
+import pandas as pd
+import db
+import llm_ollama_cloud
+import model_registry
+import services.char_service
+t1 = time.perf_counter()
+"""
+
+SCENARIOS = {
+    "import-to-first-render": IMPORTS + "print(t1 - t0)",
+    "eager model + concepts": IMPORTS
+    + """
+from services import semantic_engine
+model_registry.get_embedding_model()
+semantic_engine._concept_embeddings()
+print(time.perf_counter() - t0)
+""",
+    "first classify (warm cache)": IMPORTS
+    + """
+from services.semantic_engine import classify_columns
+classify_columns(pd.DataFrame({"Region": ["a"], "Amount": [1.0]}))
+print(time.perf_counter() - t0)
+""",
+}
+
+
+def _run(code: str) -> float:
+    out = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    for name, code in SCENARIOS.items():
+        times = [_run(code) for _ in range(RUNS)]
+        print(
+            f"{name:<30} median {statistics.median(times):6.2f}s  "
+            f"(min {min(times):.2f}s, max {max(times):.2f}s)"
+        )
+
+
+if __name__ == "__main__":
+    main()
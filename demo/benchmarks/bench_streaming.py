@@ -0,0 +1,145 @@
+# benchmarks/bench_streaming.py
+"""
+Streaming check against a local fake Ollama server (no API key, model or
+database needed): the server answers /api/chat like Ollama does, one NDJSON
+chunk per token with a fixed delay, and the model "keeps talking" after
+the SQL block the way real models do.
+
+For the SQL it compares call_ollama (whole answer) with stream_ollama cut
+off at the end of the SQL block (as nl_to_sql does); for the report, the
+time to the first piece vs. the whole report. Run from the demo/ folder:
+
+    python -m benchmarks.bench_streaming
+    python -m benchmarks.bench_streaming 0.02     # seconds per token
+"""
+
+import json
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from ollama import Client
+
+import llm_ollama_cloud
+from llm_ollama_cloud import _clean_sql, _sql_complete, call_ollama, stream_ollama
+
+SQL_ANSWER = (
+    "```sql\nSELECT p.PartyName, SUM(s.Amount) AS Total\nFROM dbo.Sales s\n"
+    "JOIN dbo.PartyMaster p ON p.pcode = s.pcode\nGROUP BY p.PartyName\n"
+    "ORDER BY Total DESC;\n```\n\n"
+    "This query joins sales to parties, sums the amount per party and sorts "
+    "the result so the largest customers come first. " * 3
+)
+REPORT_ANSWER = (
+    "Sales are concentrated in a few parties: the top five account for most of "
+    "the total, with a long tail of small customers. " * 8
+)
+
+
+def _tokens(text):
+    # ~4 characters per token, like the model's pieces
+    return [text[i : i + 4] for i in range(0, len(text), 4)]
+
+
+def fake_server(token_s: float):
+    """A ThreadingHTTPServer on a free port speaking Ollama's /api/chat."""
+    stats = {"tokens_sent": 0}
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            prompt = body["messages"][-1]["content"]
+            answer = SQL_ANSWER if "SQL" in prompt else REPORT_ANSWER
+            now = datetime.now(timezone.utc).isoformat()
+
+            def chunk(content, done):
+                return {
+                    "model": body["model"],
+                    "created_at": now,
+                    "message": {"role": "assistant", "content": content},
+                    "done": done,
+                }
+
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.end_headers()
+            if not body.get("stream"):
+                time.sleep(token_s * len(_tokens(answer)))
+                stats["tokens_sent"] += len(_tokens(answer))
+                self.wfile.write(json.dumps(chunk(answer, True)).encode())
+                return
+            try:
+                for piece in _tokens(answer):
+                    time.sleep(token_s)
+                    self.wfile.write((json.dumps(chunk(piece, False)) + "\n").encode())
+                    self.wfile.flush()
+                    stats["tokens_sent"] += 1
+                self.wfile.write((json.dumps(chunk("", True)) + "\n").encode())
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # the client closed the stream early
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, stats
+
+
+def main():
+    token_s = float(sys.argv[1]) if len(sys.argv) > 1 else 0.01
+    server, stats = fake_server(token_s)
+    # point the module's client at the fake server
+    llm_ollama_cloud._client = Client(host=f"http://127.0.0.1:{server.server_address[1]}")
+    sql_prompt = "Write the SQL for: total sales by party"
+    report_prompt = "Write a short report:"
+    print(f"Fake Ollama at {token_s * 1000:.0f} ms/token\n")
+
+    start = time.perf_counter()
+    full = _clean_sql(call_ollama(sql_prompt))
+    full_s = time.perf_counter() - start
+    sent_full = stats["tokens_sent"]
+
+    stats["tokens_sent"] = 0
+    start = time.perf_counter()
+    text, first_s = "", None
+    pieces = stream_ollama(sql_prompt)
+    try:
+        for piece in pieces:
+            if first_s is None:
+                first_s = time.perf_counter() - start
+            text += piece
+            if _sql_complete(text):
+                break
+    finally:
+        pieces.close()
+    streamed_s = time.perf_counter() - start
+    streamed = _clean_sql(text)
+    time.sleep(5 * token_s)  # let the server notice the closed stream
+    sent_streamed = stats["tokens_sent"]
+
+    print(f"SQL     call_ollama    {full_s * 1000:7.0f} ms to the SQL   ({sent_full} tokens)")
+    print(
+        f"SQL     stream_ollama  {streamed_s * 1000:7.0f} ms to the SQL   "
+        f"({sent_streamed} tokens, first after {first_s * 1000:.0f} ms)"
+    )
+    print(f"        same SQL: {streamed == full}")
+
+    start = time.perf_counter()
+    first_s, n = None, 0
+    for piece in stream_ollama(report_prompt):
+        if first_s is None:
+            first_s = time.perf_counter() - start
+        n += 1
+    total_s = time.perf_counter() - start
+    print(
+        f"Report  stream_ollama  {first_s * 1000:7.0f} ms to the first piece, "
+        f"{total_s * 1000:.0f} ms to the end ({n} pieces)"
+    )
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
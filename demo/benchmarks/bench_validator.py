@@ -0,0 +1,129 @@
+# benchmarks/bench_validator.py
+"""
+validate_sql latency over a corpus of generated queries against a synthetic
+catalog (no database, no LLM): simple SELECTs, multi-table joins with
+aliases, CTEs, GROUP BY / ORDER BY lists ending in ", FUNC(...)", and a
+share of broken ones (unknown tables / columns, DML, multiple statements)
+that must be rejected.
+
+Run from the demo/ folder:
+
+    python -m benchmarks.bench_validator
+"""
+
+import random
+import statistics
+import time
+
+from sql_validator import SchemaCatalog, SQLValidationError, validate_sql
+
+TABLE_COUNTS = [100, 1_000, 5_000]
+COLUMNS_PER_TABLE = 20
+QUERIES = 2_000
+
+KINDS = ["Amount", "Code", "Name", "Date", "Qty", "Rate", "Flag", "Type"]
+
+
+def synthetic_catalog(n_tables: int) -> SchemaCatalog:
+    return SchemaCatalog(
+        [
+            {
+                "schema": "dbo",
+                "table": f"T{t}",
+                "columns": [
+                    {"name": "Id"},
+                    {"name": "PartyCode"},
+                    *({"name": f"{KINDS[c % len(KINDS)]}{c}"} for c in range(COLUMNS_PER_TABLE - 2)),
+                ],
+            }
+            for t in range(n_tables)
+        ]
+    )
+
+
+def _col(rng) -> str:
+    c = rng.randrange(COLUMNS_PER_TABLE - 2)
+    return f"{KINDS[c % len(KINDS)]}{c}"
+
+
+def _query(rng, n_tables: int):
+    """(sql, should_pass)"""
+    a, b, c = (f"T{rng.randrange(n_tables)}" for _ in range(3))
+    x, y = _col(rng), _col(rng)
+    kind = rng.randrange(12)
+    if kind == 0:
+        return f"SELECT * FROM dbo.{a}", True
+    if kind == 1:
+        return f"SELECT TOP 10 {x}, {y} FROM {a} WHERE {x} > 100 ORDER BY {y} DESC", True
+    if kind == 2:
+        return (
+            f"SELECT p.{x}, SUM(s.{y}) AS Total FROM dbo.{a} s "
+            f"JOIN dbo.{b} p ON s.PartyCode = p.PartyCode "
+            f"LEFT JOIN {c} AS q ON q.Id = s.Id "
+            f"WHERE s.{x} >= DATEADD(month, -3, GETDATE()) GROUP BY p.{x} ORDER BY Total DESC",
+            True,
+        )
+    if kind == 3:
+        return (
+            f"WITH m AS (SELECT YEAR({x}) AS y, SUM({y}) total FROM {a} GROUP BY YEAR({x})) "
+            f"SELECT y, total, CASE WHEN total > 0 THEN 'up' ELSE 'down' END AS trend FROM m ORDER BY y",
+            True,
+        )
+    if kind == 4:
+        return (
+            f"SELECT PartyCode, COUNT(*) cnt FROM {a} WHERE Id IN "
+            f"(SELECT Id FROM {b} WHERE {x} IS NOT NULL) GROUP BY PartyCode",
+            True,
+        )
+    if kind == 10:
+        # ends in ", FUNC(...)": must not be mistaken for a CTE list
+        return (
+            f"SELECT YEAR({x}) AS y, MONTH({x}) AS m, SUM({y}) AS total FROM dbo.{a} "
+            f"GROUP BY YEAR({x}), MONTH({x})",
+            True,
+        )
+    if kind == 11:
+        return (
+            f"SELECT PartyCode, SUM({y}) AS total FROM {a} GROUP BY PartyCode "
+            f"ORDER BY PartyCode, SUM({y})",
+            True,
+        )
+    if kind == 5:
+        return f"SELECT s.{x}, s.Missing FROM {a} s", False
+    if kind == 6:
+        return f"SELECT {x} FROM NoSuchTable{rng.randrange(100)}", False
+    if kind == 7:
+        return f"DELETE FROM {a} WHERE Id = 1", False
+    if kind == 8:
+        return f"SELECT {x} FROM {a}; DROP TABLE {b}", False
+    return f"SELECT Bogus{rng.randrange(100)} FROM {a}", False
+
+
+def main():
+    print(f"{'tables':>7} {'queries':>8} {'mean us':>9} {'p95 us':>8} {'rejected':>9} {'wrong':>6}")
+    for n_tables in TABLE_COUNTS:
+        catalog = synthetic_catalog(n_tables)
+        rng = random.Random(n_tables)
+        corpus = [_query(rng, n_tables) for _ in range(QUERIES)]
+
+        times, rejected, wrong = [], 0, 0
+        for sql, should_pass in corpus:
+            start = time.perf_counter()
+            try:
+                validate_sql(sql, max_rows=200_001, catalog=catalog)
+                passed = True
+            except SQLValidationError:
+                passed = False
+            times.append((time.perf_counter() - start) * 1e6)
+            rejected += not passed
+            wrong += passed != should_pass
+
+        times.sort()
+        print(
+            f"{n_tables:>7} {len(corpus):>8} {statistics.mean(times):>9.1f} "
+            f"{times[int(len(times) * 0.95)]:>8.1f} {rejected:>9} {wrong:>6}"
+        )
+
+
+if __name__ == "__main__":
+    main()
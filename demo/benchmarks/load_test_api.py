@@ -0,0 +1,152 @@
+# benchmarks/load_test_api.py
+"""
+Load test for api_server.py on local stand-ins: the LLM is an asyncio sleep,
+the database a blocking sleep (so it occupies a DB worker thread like
+pyodbc does) returning a small Arrow table, the chart a pandas groupby.
+No database, model or API key needed.
+
+Starts the server in-process on a free port, lets --users clients send
+--requests questions each, and prints throughput, latency percentiles and
+how many requests were turned away with 503. Run from the demo/ folder:
+
+    python -m benchmarks.load_test_api
+    python -m benchmarks.load_test_api --users 500 --max-concurrent 32 --max-waiting 64
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import statistics
+import time
+
+import numpy as np
+import pyarrow as pa
+import tornado.httpclient
+import tornado.httpserver
+import tornado.netutil
+
+from api_server import make_app
+
+
+def stand_in_steps(llm_s: float, db_s: float, rows: int) -> dict:
+    rng = np.random.default_rng(0)
+    table = pa.table(
+        {
+            "Region": rng.choice(["North", "South", "East", "West"], rows),
+            # a few NaN, as float result columns have
+            "Amount": np.where(rng.random(rows) < 0.01, np.nan, rng.random(rows) * 1000),
+        }
+    )
+    df = table.to_pandas()
+
+    async def generate_sql(question, executor, timer):
+        with timer.stage("llm sql"):
+            await asyncio.sleep(llm_s)
+        return "SELECT Region, Amount FROM dbo.Sales"
+
+    async def execute(question, sql, db_pool, llm_slots, timer):
+        def query():
+            with timer.stage("query"):
+                time.sleep(db_s)
+
+        await asyncio.get_running_loop().run_in_executor(db_pool, query)
+        return {"sql": sql, "table": table, "df": df, "truncated": False, "repairs": 0}
+
+    async def write_report(question, df, executor):
+        await asyncio.sleep(llm_s)
+        return f"{len(df)} rows."
+
+    def make_chart(df, question):
+        totals = df.groupby("Region")["Amount"].sum()
+        return {"data": [{"type": "bar", "x": list(totals.index), "y": totals.tolist()}]}, None
+
+    return {
+        "generate_sql": generate_sql,
+        "execute": execute,
+        "write_report": write_report,
+        "make_chart": make_chart,
+    }
+
+
+async def run(args):
+    app = make_app(
+        stand_in_steps(args.llm_ms / 1000, args.db_ms / 1000, args.rows),
+        max_concurrent=args.max_concurrent,
+        max_waiting=args.max_waiting,
+        queue_timeout=args.queue_timeout,
+        max_llm_calls=args.max_llm_calls,
+        db_workers=args.db_workers,
+    )
+    # 503s are expected here; don't log each one
+    logging.getLogger("tornado.access").setLevel(logging.CRITICAL)
+
+    sockets = tornado.netutil.bind_sockets(0, "127.0.0.1", backlog=4096)
+    port = sockets[0].getsockname()[1]
+    server = tornado.httpserver.HTTPServer(app)
+    server.add_sockets(sockets)
+
+    client = tornado.httpclient.AsyncHTTPClient(max_clients=args.users)
+    url = f"http://127.0.0.1:{port}/api/ask"
+    latencies, statuses = [], {}
+
+    async def user(u):
+        for r in range(args.requests):
+            body = json.dumps({"question": f"sales by region #{u}-{r}", "rows": 100})
+            start = time.perf_counter()
+            try:
+                response = await client.fetch(
+                    url, method="POST", body=body, raise_error=False, request_timeout=120
+                )
+                status = str(response.code)
+            except Exception as e:  # connection refused / reset under overload
+                status = type(e).__name__
+            statuses[status] = statuses.get(status, 0) + 1
+            if status == "200":
+                latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(user(u) for u in range(args.users)))
+    elapsed = time.perf_counter() - start
+
+    health = await client.fetch(f"http://127.0.0.1:{port}/api/health")
+    server.stop()
+
+    latencies.sort()
+    ok = len(latencies)
+
+    def pct(p):
+        return latencies[min(ok - 1, int(ok * p))] * 1000 if ok else float("nan")
+
+    print(
+        f"{args.users} users x {args.requests} requests "
+        f"(LLM {args.llm_ms:.0f} ms x2, DB {args.db_ms:.0f} ms, "
+        f"max {args.max_concurrent} concurrent / {args.max_waiting} waiting)"
+    )
+    print(f"status codes  {dict(sorted(statuses.items()))}")
+    print(f"throughput    {ok / elapsed:.1f} req/s over {elapsed:.1f}s")
+    if ok:
+        print(
+            f"latency ms    p50 {pct(0.5):.0f}  p95 {pct(0.95):.0f}  "
+            f"p99 {pct(0.99):.0f}  mean {statistics.mean(latencies) * 1000:.0f}"
+        )
+    print(f"server        {json.loads(health.body)}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=5)
+    parser.add_argument("--llm-ms", type=float, default=500)
+    parser.add_argument("--db-ms", type=float, default=100)
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--max-concurrent", type=int, default=32)
+    parser.add_argument("--max-waiting", type=int, default=128)
+    parser.add_argument("--queue-timeout", type=float, default=10)
+    parser.add_argument("--max-llm-calls", type=int, default=16)
+    parser.add_argument("--db-workers", type=int, default=10)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+# context_packer.py
+"""
+Builds the SCHEMA CONTEXT / JOIN HINTS part of the nl_to_sql prompt within a
+token budget, instead of pasting whole retrieval snippets (every column plus
+all sample rows of each table) and every join hint.
+
+- Tables are taken best retrieval score first; hits scoring far below the
+  best one are dropped.
+- Wide tables keep only the columns most similar to the question (column
+  embeddings from the column-role index), plus join keys and any column the
+  question names literally.
+- Sample rows are cut to a couple of rows over the kept columns.
+- Join hints are kept only when they touch a table in the context, and
+  their join columns are always listed for that table, so a hint never
+  points at a column the context left out.
+- Tables are added until SQL_CONTEXT_BUDGET tokens are used up.
+"""
+
+import json
+import os
+import re
+import threading
+
+import numpy as np
+
+from services.result_summarizer import estimate_tokens
+from services.semantic_engine import load_column_embeddings
+
+DATA_DIR = "data"
+SCHEMA_JSON = os.path.join(DATA_DIR, "db_schema.json")
+COLUMN_ROLES_JSON = os.path.join(DATA_DIR, "column_roles.json")
+
+SQL_CONTEXT_BUDGET = int(os.getenv("SQL_CONTEXT_BUDGET", "1500"))
+SCORE_MARGIN = float(os.getenv("SQL_CONTEXT_SCORE_MARGIN", "0.2"))
+CONTEXT_TOP_K = 8
+MAX_COLUMNS = 12
+SAMPLE_ROWS = 2
+MAX_VALUE_CHARS = 30
+
+_TABLE_RE = re.compile(r"Table \[([^\]]+)\]\.\[([^\]]+)\]")
+_HINT_RE = re.compile(r"Join (\S+) and (\S+) ON \S+\.(\S+) = \S+\.(\S+)")
+
+# (file signature, data) caches, reloaded when the files change
+_schema = None
+_columns = None
+_lock = threading.Lock()
+
+
+def _signature(path):
+    st = os.stat(path)
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _schema_entries() -> dict:
+    """lowercase "schema.table" -> db_schema.json entry."""
+    global _schema
+    if not os.path.exists(SCHEMA_JSON):
+        return {}
+    sig = _signature(SCHEMA_JSON)
+    cached = _schema
+    if cached is None or cached[0] != sig:
+        with _lock:
+            with open(SCHEMA_JSON, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+            cached = (
+                sig,
+                {f"{e['schema']}.{e['table']}".lower(): e for e in entries},
+            )
+            _schema = cached
+    return cached[1]
+
+
+def _column_index():
+    """({lowercase column name: row}, embeddings) from the column-role index."""
+    global _columns
+    if not os.path.exists(COLUMN_ROLES_JSON):
+        return {}, None
+    sig = _signature(COLUMN_ROLES_JSON)
+    cached = _columns
+    if cached is None or cached[0] != sig:
+        with _lock:
+            names, embs = load_column_embeddings()
+            cached = (sig, {n: i for i, n in enumerate(names)}, embs)
+            _columns = cached
+    return cached[1], cached[2]
+
+
+def _parse_hints(join_hints: str):
+    """[(line, {tables}, {(table, column)})] for the hint lines we understand."""
+    parsed = []
+    seen = set()
+    for line in (join_hints or "").splitlines():
+        m = _HINT_RE.search(line)
+        if not m:
+            continue
+        left, right, lcol, rcol = (g.lower() for g in m.groups())
+        key = tuple(sorted([(left, lcol), (right, rcol)]))
+        if key in seen:  # same join listed from both sides
+            continue
+        seen.add(key)
+        parsed.append((line, {left, right}, {(left, lcol), (right, rcol)}))
+    return parsed
+
+
+def _pick_columns(columns, q_emb, question, pinned):
+    """Indexes of the columns to show, in table order."""
+    if len(columns) <= MAX_COLUMNS:
+        return list(range(len(columns)))
+
+    q = question.lower()
+    keep = {
+        i
+        for i, c in enumerate(columns)
+        if c["name"].lower() in pinned or c["name"].lower() in q
+    }
+
+    rows, embs = _column_index()
+    scored = [
+        (i, rows.get(c["name"].lower()))
+        for i, c in enumerate(columns)
+        if i not in keep
+    ]
+    known = [(i, r) for i, r in scored if r is not None]
+    if known and embs is not None:
+        sims = np.asarray(embs[[r for _, r in known]]) @ q_emb[0]
+        order = [known[j][0] for j in np.argsort(-sims)]
+    else:
+        order = []
+    # names without an embedding go last, in table order
+    order += [i for i, r in scored if r is None]
+
+    for i in order:
+        if len(keep) >= MAX_COLUMNS:
+            break
+        keep.add(i)
+    return sorted(keep)
+
+
+def _value(v) -> str:
+    text = str(v)
+    if len(text) > MAX_VALUE_CHARS:
+        text = text[: MAX_VALUE_CHARS - 3] + "..."
+    return text
+
+
+def _table_block(entry, q_emb, question, pinned, with_samples=True) -> str:
+    columns = entry["columns"]
+    picked = _pick_columns(columns, q_emb, question, pinned)
+
+    col_text = ", ".join(
+        f"{columns[i]['name']} ({columns[i]['type']})"
+        f"{' NULL' if columns[i]['nullable'] else ''}"
+        for i in picked
+    )
+    text = f"Table [{entry['schema']}].[{entry['table']}] columns: {col_text}"
+    omitted = len(columns) - len(picked)
+    if omitted:
+        text += f"; {omitted} more columns not shown"
+    text += "."
+
+    rows = (entry.get("sample_rows") or [])[:SAMPLE_ROWS] if with_samples else []
+    if rows:
+        names = [columns[i]["name"] for i in picked]
+        samples = " | ".join(
+            ", ".join(f"{n}={_value(row.get(n))}" for n in names if n in row)
+            for row in rows
+        )
+        text += f" Example rows: {samples}"
+    return text
+
+
+def pack_context(
+    question: str,
+    q_emb: np.ndarray,
+    hits,
+    join_hints: str = "",
+    token_budget: int = SQL_CONTEXT_BUDGET,
+):
+    """
+    hits: [(score, snippet text)] best first, as from
+    rag_index.retrieve_schema_hits. Returns (schema_context, join_hints).
+    """
+    if not hits:
+        return "", join_hints or ""
+
+    best = hits[0][0]
+    hits = [h for h in hits if h[0] >= best - SCORE_MARGIN]
+
+    entries = _schema_entries()
+    keyed = []
+    for score, text in hits:
+        m = _TABLE_RE.search(text)
+        key = f"{m.group(1)}.{m.group(2)}".lower() if m else None
+        keyed.append((key, entries.get(key), text))
+
+    # join hints between retrieved tables (a hint naming a table whose DDL
+    # isn't in the prompt only invites the model to guess its columns)
+    retrieved = {key for key, _, _ in keyed if key}
+    hints = [h for h in _parse_hints(join_hints) if h[1] <= retrieved]
+    pinned_by_table = {}
+    for _, _, cols in hints:
+        for table, col in cols:
+            pinned_by_table.setdefault(table, set()).add(col)
+
+    hints_cost = estimate_tokens("\n".join(line for line, _, _ in hints))
+    budget = token_budget - hints_cost
+
+    blocks, packed, used = [], set(), 0
+    for key, entry, text in keyed:
+        if entry is None:
+            # snippet we cannot restructure (e.g. schema file rebuilt since)
+            candidates = [text]
+        else:
+            pinned = pinned_by_table.get(key, set())
+            candidates = [
+                _table_block(entry, q_emb, question, pinned),
+                _table_block(entry, q_emb, question, pinned, with_samples=False),
+            ]
+        chosen = next(
+            (b for b in candidates if used + estimate_tokens(b) <= budget), None
+        )
+        if chosen is None and not blocks:
+            chosen = candidates[-1]  # always keep the best table, however wide
+        if chosen is None:
+            continue
+        blocks.append(chosen)
+        packed.add(key)
+        used += estimate_tokens(chosen)
+
+    hint_lines = [line for line, tables, _ in hints if tables <= packed]
+    return "\n\n".join(blocks), "\n".join(hint_lines)
@@ -1,7 +1,17 @@
 # db.py
 import pyodbc
 import os
+import sys
+import threading
+from contextlib import contextmanager
+from typing import Iterator, List, Optional, Tuple
+import pandas as pd
+import pyarrow as pa
+from datetime import date, datetime, time
+from decimal import Decimal
 from dotenv import load_dotenv
+from db_pool import ConnectionPool
+from utils.column_names import unique_column_names
 
 # Load .env once, at import
 load_dotenv()
@@ -11,8 +21,28 @@ NAME = os.getenv("DB_NAME")
 USER = os.getenv("DB_USER")
 PASSWORD = os.getenv("DB_PASSWORD")
 
+POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+POOL_MAX_IDLE = float(os.getenv("DB_POOL_MAX_IDLE", "300"))
+POOL_MAX_LIFETIME = float(os.getenv("DB_POOL_MAX_LIFETIME", "3600"))
+
+# result fetching: rows per fetchmany() round-trip, and hard caps so a careless
+# SELECT * cannot materialize millions of rows in the app
+FETCH_ARRAYSIZE = int(os.getenv("DB_FETCH_ARRAYSIZE", "5000"))
+MAX_RESULT_ROWS = int(os.getenv("DB_MAX_RESULT_ROWS", "200000"))
+MAX_RESULT_BYTES = int(os.getenv("DB_MAX_RESULT_BYTES", str(256 * 1024 * 1024)))
+# seconds before a streamed query is cancelled by the driver (0 = no limit)
+QUERY_TIMEOUT = int(os.getenv("DB_QUERY_TIMEOUT", "60"))
+
+_pool = None
+_pool_lock = threading.Lock()
+
 
 def get_connection():
+    """
+    Open a new, unpooled connection. Prefer pooled_connection().
+    """
     conn_str = (
         "DRIVER={ODBC Driver 17 for SQL Server};"
         f"SERVER={SERVER};DATABASE={NAME};UID={USER};PWD={PASSWORD}"
@@ -20,15 +50,262 @@ def get_connection():
     return pyodbc.connect(conn_str)
 
 
-def run_sql(query: str):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute(query)
+def get_pool() -> ConnectionPool:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    get_connection,
+                    min_size=POOL_MIN_SIZE,
+                    max_size=POOL_MAX_SIZE,
+                    timeout=POOL_TIMEOUT,
+                    max_idle=POOL_MAX_IDLE,
+                    max_lifetime=POOL_MAX_LIFETIME,
+                )
+    return _pool
+
 
-    columns = [col[0] for col in cursor.description]
-    rows = cursor.fetchall()
+@contextmanager
+def pooled_connection():
+    """
+    Borrow a connection from the shared pool:
 
-    cursor.close()
-    conn.close()
+        with pooled_connection() as conn:
+            cur = conn.cursor()
+    """
+    with get_pool().connection() as conn:
+        yield conn
+
+
+def pool_stats() -> dict:
+    """Checkouts, creations, wait times etc. for sizing the pool."""
+    return get_pool().stats()
+
+
+def run_sql(query: str):
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(query)
+
+            columns = [col[0] for col in cursor.description]
+            rows = cursor.fetchall()
+        finally:
+            cursor.close()
 
     return columns, rows
+
+
+def _stream(query: str, arraysize: int):
+    """Yields (cursor.description, rows) per fetchmany() batch."""
+    with pooled_connection() as conn:
+        conn.timeout = QUERY_TIMEOUT
+        cursor = conn.cursor()
+        try:
+            cursor.arraysize = arraysize
+            cursor.execute(query)
+            description = cursor.description
+            batch = cursor.fetchmany(arraysize)
+            yield description, batch
+            while batch:
+                batch = cursor.fetchmany(arraysize)
+                if batch:
+                    yield description, batch
+        finally:
+            try:
+                cursor.cancel()  # stop the server streaming rows we won't read
+            except Exception:
+                pass
+            cursor.close()
+            conn.timeout = 0
+
+
+def iter_sql(
+    query: str, arraysize: int = FETCH_ARRAYSIZE
+) -> Iterator[Tuple[List[str], list]]:
+    """
+    Stream a result set: yields (columns, rows) per fetchmany() batch of
+    `arraysize` rows (a single empty batch for an empty result). The pooled
+    connection is held until the generator is exhausted or closed.
+    """
+    for description, batch in _stream(query, arraysize):
+        yield [col[0] for col in description], batch
+
+
+def _approx_batch_bytes(batch) -> int:
+    # size of the first row times the batch length: cheap, and close enough
+    # for a safety cap
+    if not batch:
+        return 0
+    return len(batch) * sum(sys.getsizeof(v) for v in batch[0])
+
+
+def _iter_capped(query, max_rows, max_bytes, arraysize, state: dict):
+    """
+    Yields (description, rows) batches, stopping at max_rows / ~max_bytes.
+    Sets state["truncated"] when rows were left unread.
+    """
+    max_rows = MAX_RESULT_ROWS if max_rows is None else max_rows
+    max_bytes = MAX_RESULT_BYTES if max_bytes is None else max_bytes
+    state["truncated"] = False
+
+    n_rows = 0
+    n_bytes = 0
+    stream = _stream(query, arraysize)
+    try:
+        for description, batch in stream:
+            room = max_rows - n_rows
+            if len(batch) > room:
+                state["truncated"] = True
+                yield description, batch[:room]
+                return
+            n_rows += len(batch)
+            n_bytes += _approx_batch_bytes(batch)
+            yield description, batch
+            if n_bytes >= max_bytes or n_rows >= max_rows:
+                # only truncated if there is something left to read
+                state["truncated"] = next(stream, None) is not None
+                return
+    finally:
+        stream.close()
+
+
+def fetch_sql(
+    query: str,
+    max_rows: Optional[int] = None,
+    max_bytes: Optional[int] = None,
+    arraysize: int = FETCH_ARRAYSIZE,
+):
+    """
+    Like run_sql, but capped at max_rows / ~max_bytes.
+    Returns (columns, rows, truncated).
+    """
+    state = {}
+    description = []
+    rows: list = []
+    for description, batch in _iter_capped(query, max_rows, max_bytes, arraysize, state):
+        rows.extend(batch)
+    return [col[0] for col in description], rows, state["truncated"]
+
+
+def run_sql_df(
+    query: str,
+    max_rows: Optional[int] = None,
+    max_bytes: Optional[int] = None,
+    arraysize: int = FETCH_ARRAYSIZE,
+):
+    """
+    Fetch straight into a DataFrame, column by column: each batch is
+    transposed into per-column lists, so no per-row dict is ever built.
+    Returns (df, truncated).
+    """
+    state = {}
+    description = []
+    data: List[list] = []
+    for description, batch in _iter_capped(query, max_rows, max_bytes, arraysize, state):
+        if not data:
+            data = [[] for _ in description]
+        for values, col in zip(data, zip(*batch)):
+            values.extend(col)
+
+    # positional keys keep duplicate column names (e.g. two "Id" columns)
+    df = pd.DataFrame({i: values for i, values in enumerate(data)})
+    df.columns = unique_column_names([col[0] for col in description])
+    return df, state["truncated"]
+
+
+def _arrow_type(col_desc):
+    """Arrow type for a pyodbc description entry (None = let Arrow infer)."""
+    type_code = col_desc[1]
+    precision, scale = col_desc[4], col_desc[5]
+    if type_code is bool:
+        return pa.bool_()
+    if type_code is int:
+        return pa.int64()
+    if type_code is float:
+        return pa.float64()
+    if type_code is Decimal:
+        if precision and precision <= 38:
+            return pa.decimal128(precision, scale or 0)
+        return pa.decimal256(76, scale or 0)
+    if type_code is str:
+        return pa.string()
+    if type_code is datetime:
+        return pa.timestamp("us")
+    if type_code is date:
+        return pa.date32()
+    if type_code is time:
+        return pa.time64("us")
+    if type_code in (bytes, bytearray):
+        return pa.binary()
+    return None
+
+
+def _to_arrow_column(values, col_desc):
+    arrow_type = _arrow_type(col_desc)
+    if arrow_type is None:
+        # GUIDs and other driver types: keep as text
+        return pa.array([None if v is None else str(v) for v in values], pa.string())
+    arr = pa.array(values, type=arrow_type)
+    if pa.types.is_decimal(arrow_type):
+        # charts and pandas want floats; the cast runs in Arrow, not Python
+        arr = arr.cast(pa.float64(), safe=False)
+    return arr
+
+
+def rows_to_arrow(stream) -> pa.Table:
+    """
+    Build an Arrow table from (description, rows) batches as produced while
+    fetching. Each batch is transposed into typed Arrow columns right away,
+    so driver rows never pile up in Python.
+    """
+    description = None
+    arrays: List[list] = []
+    for description, batch in stream:
+        if not arrays:
+            arrays = [[] for _ in description]
+        if not batch:
+            continue
+        for chunks, values, col_desc in zip(arrays, zip(*batch), description):
+            chunks.append(_to_arrow_column(values, col_desc))
+
+    if description is None:
+        return pa.table({})
+
+    columns = []
+    for chunks, col_desc in zip(arrays, description):
+        if chunks:
+            columns.append(pa.chunked_array(chunks))
+        else:
+            arrow_type = _arrow_type(col_desc) or pa.string()
+            if pa.types.is_decimal(arrow_type):
+                arrow_type = pa.float64()
+            columns.append(pa.chunked_array([], type=arrow_type))
+    # unique names, so df[col] is always a Series downstream
+    names = unique_column_names([col[0] for col in description])
+    return pa.Table.from_arrays(columns, names=names)
+
+
+def run_sql_arrow(
+    query: str,
+    max_rows: Optional[int] = None,
+    max_bytes: Optional[int] = None,
+    arraysize: int = FETCH_ARRAYSIZE,
+):
+    """
+    Fetch into an Arrow table (streamed, capped like fetch_sql).
+    Returns (table, truncated).
+    """
+    state = {}
+    table = rows_to_arrow(_iter_capped(query, max_rows, max_bytes, arraysize, state))
+    return table, state["truncated"]
+
+
+def arrow_to_df(table: pa.Table) -> pd.DataFrame:
+    """
+    Arrow -> pandas without per-value copies where possible: split_blocks
+    keeps each column in its own block, so null-free numeric columns are
+    zero-copy views of the Arrow buffers.
+    """
+    return table.to_pandas(split_blocks=True)
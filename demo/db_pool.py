@@ -0,0 +1,280 @@
+# db_pool.py
+"""
+Thread-safe connection pool.
+
+Opening a SQL Server connection costs a TCP + TLS + login handshake, so
+connections are kept open and handed out again instead of being created
+for every query.
+
+- min_size connections are opened up-front and kept alive.
+- max_size caps how many connections exist at once; callers wait for a
+  free one (up to `timeout` seconds) when the pool is exhausted.
+- Connections are health-checked on checkout (`SELECT 1`) when they have
+  been idle for longer than `health_check_after` seconds.
+- Idle connections above min_size are closed after `max_idle` seconds.
+- Every connection is retired once it is older than `max_lifetime`.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, List, Optional
+
+
+class PoolTimeout(RuntimeError):
+    """Raised when no connection becomes available in time."""
+
+
+class _PooledConn:
+    __slots__ = ("conn", "created_at", "last_used")
+
+    def __init__(self, conn):
+        now = time.monotonic()
+        self.conn = conn
+        self.created_at = now
+        self.last_used = now
+
+
+class ConnectionPool:
+    def __init__(
+        self,
+        factory: Callable,
+        min_size: int = 1,
+        max_size: int = 10,
+        timeout: float = 30.0,
+        max_idle: float = 300.0,
+        max_lifetime: float = 3600.0,
+        health_check_after: float = 30.0,
+    ):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError("Invalid pool size: need 0 <= min_size <= max_size, max_size >= 1")
+
+        self._factory = factory
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+        self.health_check_after = health_check_after
+
+        self._idle: List[_PooledConn] = []
+        self._size = 0  # open connections, idle + checked out
+        self._cond = threading.Condition()
+        self._closed = False
+
+        self._stats = {
+            "checkouts": 0,
+            "creations": 0,
+            "closed": 0,
+            "failed_health_checks": 0,
+            "timeouts": 0,
+            "waits": 0,
+            "wait_time_total": 0.0,
+            "wait_time_max": 0.0,
+        }
+
+        for _ in range(min_size):
+            with self._cond:
+                self._size += 1
+            try:
+                self._idle.append(self._create())
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                raise
+
+    # -----------------------------------------------------
+    # Internal helpers
+    # -----------------------------------------------------
+    def _create(self) -> _PooledConn:
+        conn = self._factory()
+        with self._cond:
+            self._stats["creations"] += 1
+        return _PooledConn(conn)
+
+    def _close(self, pc: _PooledConn):
+        try:
+            pc.conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._stats["closed"] += 1
+
+    def _discard(self, pc: _PooledConn):
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+        self._close(pc)
+
+    def _expired(self, pc: _PooledConn, now: float) -> bool:
+        return now - pc.created_at > self.max_lifetime
+
+    def _healthy(self, pc: _PooledConn) -> bool:
+        try:
+            cur = pc.conn.cursor()
+            cur.execute("SELECT 1")
+            cur.fetchall()
+            cur.close()
+            return True
+        except Exception:
+            with self._cond:
+                self._stats["failed_health_checks"] += 1
+            return False
+
+    def _evict_idle(self, now: float) -> List[_PooledConn]:
+        """
+        Pop idle connections that are expired or idle for too long and drop
+        them from the pool size. Caller holds the lock and closes them.
+        """
+        evicted = []
+        keep = []
+        # oldest-used first, so the freshest connections survive
+        for pc in sorted(self._idle, key=lambda p: p.last_used):
+            too_old = self._expired(pc, now)
+            too_idle = (
+                now - pc.last_used > self.max_idle
+                and self._size - len(evicted) > self.min_size
+            )
+            if too_old or too_idle:
+                evicted.append(pc)
+            else:
+                keep.append(pc)
+        self._idle = keep
+        self._size -= len(evicted)
+        return evicted
+
+    # -----------------------------------------------------
+    # Public API
+    # -----------------------------------------------------
+    def acquire(self, timeout: Optional[float] = None):
+        """
+        Borrow a connection. Must be returned with release().
+        """
+        timeout = self.timeout if timeout is None else timeout
+        start = time.monotonic()
+        deadline = start + timeout
+        waited = False
+
+        while True:
+            pc = None
+            create = False
+            with self._cond:
+                if self._closed:
+                    raise RuntimeError("Connection pool is closed.")
+
+                evicted = self._evict_idle(time.monotonic())
+
+                if self._idle:
+                    pc = self._idle.pop()  # most recently used
+                elif self._size < self.max_size:
+                    self._size += 1
+                    create = True
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats["timeouts"] += 1
+                        raise PoolTimeout(
+                            f"No database connection available after {timeout:.1f}s "
+                            f"(max_size={self.max_size})."
+                        )
+                    waited = True
+                    self._cond.wait(remaining)
+
+            for old in evicted:
+                self._close(old)
+
+            if create:
+                try:
+                    pc = self._create()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+            elif pc is not None:
+                idle_for = time.monotonic() - pc.last_used
+                if idle_for > self.health_check_after and not self._healthy(pc):
+                    self._discard(pc)
+                    continue
+            else:
+                continue
+
+            waited_for = time.monotonic() - start
+            with self._cond:
+                self._stats["checkouts"] += 1
+                if waited:
+                    self._stats["waits"] += 1
+                self._stats["wait_time_total"] += waited_for
+                self._stats["wait_time_max"] = max(
+                    self._stats["wait_time_max"], waited_for
+                )
+            pc.last_used = time.monotonic()
+            return pc
+
+    def release(self, pc: _PooledConn, broken: bool = False):
+        """
+        Return a borrowed connection. Broken or expired connections are closed.
+        Any open transaction is rolled back so the next borrower starts clean.
+        """
+        if not broken:
+            try:
+                pc.conn.rollback()
+            except Exception:
+                broken = True
+
+        now = time.monotonic()
+        if broken or self._closed or self._expired(pc, now):
+            self._discard(pc)
+            return
+
+        pc.last_used = now
+        with self._cond:
+            self._idle.append(pc)
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, timeout: Optional[float] = None):
+        """
+        with pool.connection() as conn:
+            cur = conn.cursor()
+            ...
+        """
+        pc = self.acquire(timeout)
+        broken = False
+        try:
+            yield pc.conn
+        except Exception as e:
+            # driver-level errors usually mean the connection is unusable
+            broken = _is_connection_error(e)
+            raise
+        finally:
+            self.release(pc, broken=broken)
+
+    def stats(self) -> dict:
+        with self._cond:
+            s = dict(self._stats)
+            s["size"] = self._size
+            s["idle"] = len(self._idle)
+            s["in_use"] = self._size - len(self._idle)
+            s["min_size"] = self.min_size
+            s["max_size"] = self.max_size
+        s["wait_time_avg"] = (
+            s["wait_time_total"] / s["checkouts"] if s["checkouts"] else 0.0
+        )
+        return s
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for pc in idle:
+            self._close(pc)
+
+
+def _is_connection_error(e: Exception) -> bool:
+    # pyodbc reports lost links with SQLSTATE 08xxx (connection exceptions)
+    args = getattr(e, "args", ())
+    state = args[0] if args and isinstance(args[0], str) else ""
+    return state.startswith("08")
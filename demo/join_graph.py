@@ -3,57 +3,122 @@
 JOIN-Inference engine.
 
 1. Reads foreign keys from SQL Server (strong joins).
-2. Adds heuristic joins where tables share the same column name & type.
-3. Saves everything to data/join_graph.json.
-4. Exposes suggest_join_hints(question) for the LLM prompt.
+2. Adds heuristic joins where tables share the same column name & type:
+   every pair when only a few tables share the name, otherwise only to
+   the likely key ("hub") tables for that column.
+3. Saves everything to data/join_graph.npz (columnar; data/join_graph.json
+   from older builds is still read).
+4. Exposes suggest_join_hints(question) for the LLM prompt, backed by a
+   resident JoinGraphIndex (table-name matcher, sorted edge lists,
+   shortest join paths).
+5. join_profiler.py (optional) verifies heuristic edges against sampled
+   values; its sketches are applied on every (re)build.
+6. update_join_graph() patches the graph for the tables listed in
+   data/schema_changes.json (written by an incremental schema scan).
 """
 
 import os
 import json
-from typing import Dict, List, Tuple
-from db import get_connection
+import heapq
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import numpy as np
+from db import pooled_connection
+from utils.text_utils import AhoCorasick
 
 DATA_DIR = "data"
-JOIN_GRAPH_JSON = os.path.join(DATA_DIR, "join_graph.json")
+JOIN_GRAPH_NPZ = os.path.join(DATA_DIR, "join_graph.npz")
+JOIN_GRAPH_JSON = os.path.join(DATA_DIR, "join_graph.json")  # legacy format
+SCHEMA_CHANGES_JSON = os.path.join(DATA_DIR, "schema_changes.json")
+
+FK_SQL = """
+    SELECT 
+        OBJECT_SCHEMA_NAME(fk.parent_object_id) AS fk_schema,
+        OBJECT_NAME(fk.parent_object_id)        AS fk_table,
+        pc.name                                 AS fk_column,
+        OBJECT_SCHEMA_NAME(fk.referenced_object_id) AS pk_schema,
+        OBJECT_NAME(fk.referenced_object_id)        AS pk_table,
+        rc.name                                     AS pk_column
+    FROM sys.foreign_keys fk
+    JOIN sys.foreign_key_columns fkc
+        ON fk.object_id = fkc.constraint_object_id
+    JOIN sys.columns pc
+        ON fkc.parent_object_id = pc.object_id
+       AND fkc.parent_column_id = pc.column_id
+    JOIN sys.columns rc
+        ON fkc.referenced_object_id = rc.object_id
+       AND fkc.referenced_column_id = rc.column_id
+    WHERE fk.is_disabled = 0
+"""
 
+COLUMNS_SQL = """
+    SELECT TABLE_SCHEMA, TABLE_NAME, COLUMN_NAME, DATA_TYPE
+    FROM INFORMATION_SCHEMA.COLUMNS
+"""
 
-def build_join_graph() -> Dict[str, List[dict]]:
-    """
-    Build join graph using:
-    - Real foreign keys (sys.foreign_keys)
-    - Heuristic joins on same column names
+# single-column primary keys and unique indexes
+KEYS_SQL = """
+    SELECT
+        OBJECT_SCHEMA_NAME(i.object_id) AS table_schema,
+        OBJECT_NAME(i.object_id)        AS table_name,
+        c.name                          AS column_name
+    FROM sys.indexes i
+    JOIN sys.index_columns ic
+        ON i.object_id = ic.object_id
+       AND i.index_id = ic.index_id
+       AND ic.is_included_column = 0
+    JOIN sys.columns c
+        ON ic.object_id = c.object_id
+       AND ic.column_id = c.column_id
+    WHERE (i.is_primary_key = 1 OR i.is_unique = 1)
+      AND OBJECTPROPERTY(i.object_id, 'IsUserTable') = 1
+      AND (
+          SELECT COUNT(*) FROM sys.index_columns k
+          WHERE k.object_id = i.object_id
+            AND k.index_id = i.index_id
+            AND k.is_included_column = 0
+      ) = 1
+"""
 
-    Returns adjacency dict: { "schema.table": [edge, ...], ... }
-    """
-    os.makedirs(DATA_DIR, exist_ok=True)
+# approximate row count per table from statistics metadata
+ROW_COUNTS_SQL = """
+    SELECT
+        OBJECT_SCHEMA_NAME(s.object_id) AS table_schema,
+        OBJECT_NAME(s.object_id)        AS table_name,
+        MAX(sp.rows)                    AS row_count
+    FROM sys.stats s
+    CROSS APPLY sys.dm_db_stats_properties(s.object_id, s.stats_id) sp
+    WHERE OBJECTPROPERTY(s.object_id, 'IsUserTable') = 1
+    GROUP BY s.object_id
+"""
 
-    conn = get_connection()
-    cur = conn.cursor()
+MAX_PATH_HOPS = 3  # longest join chain suggested between two named tables
+PATH_CACHE_SIZE = 1024
 
-    # 1) Strong edges from FOREIGN KEYS
-    cur.execute(
-        """
-        SELECT 
-            OBJECT_SCHEMA_NAME(fk.parent_object_id) AS fk_schema,
-            OBJECT_NAME(fk.parent_object_id)        AS fk_table,
-            pc.name                                 AS fk_column,
-            OBJECT_SCHEMA_NAME(fk.referenced_object_id) AS pk_schema,
-            OBJECT_NAME(fk.referenced_object_id)        AS pk_table,
-            rc.name                                     AS pk_column
-        FROM sys.foreign_keys fk
-        JOIN sys.foreign_key_columns fkc
-            ON fk.object_id = fkc.constraint_object_id
-        JOIN sys.columns pc
-            ON fkc.parent_object_id = pc.object_id
-           AND fkc.parent_column_id = pc.column_id
-        JOIN sys.columns rc
-            ON fkc.referenced_object_id = rc.object_id
-           AND fkc.referenced_column_id = rc.column_id
-        WHERE fk.is_disabled = 0
-    """
-    )
-    fk_rows = cur.fetchall()
+# heuristic edges: below this many tables per column name, join every pair;
+# above it, join each table only to the column's hub tables
+PAIRWISE_MAX_TABLES = 4
+MAX_HUBS = 2
+MAX_FANOUT = 1000  # heuristic edges per column name
+
+KEY_SUFFIXES = ("id", "code", "no", "num", "key")
+HUB_TABLE_SUFFIXES = ("master", "mst", "s", "es")
+
+SOURCES = ["foreign_key", "same_column_name"]
 
+GENERIC_COLS = {
+    "id",
+    "createddate",
+    "modifieddate",
+    "created_by",
+    "updated_by",
+    "rowversion",
+    "timestamp",
+}
+
+
+def _fk_edges(fk_rows) -> List[dict]:
     edges: List[dict] = []
 
     for row in fk_rows:
@@ -71,60 +136,125 @@ def build_join_graph() -> Dict[str, List[dict]]:
                 "score": 1.0,
             }
         )
+    return edges
 
-    # 2) Heuristic edges: same column name & type in multiple tables
-    cur.execute(
-        """
-        SELECT TABLE_SCHEMA, TABLE_NAME, COLUMN_NAME, DATA_TYPE
-        FROM INFORMATION_SCHEMA.COLUMNS
-    """
-    )
-    cols = cur.fetchall()
-    conn.close()
 
+def _columns_by_name(cols) -> Dict[str, List[Tuple[str, str]]]:
     by_col: Dict[str, List[Tuple[str, str]]] = {}
     for schema, table, col, dtype in cols:
         key = col.lower()
         table_name = f"{schema}.{table}"
         by_col.setdefault(key, []).append((table_name, dtype))
+    return by_col
+
+
+def _name_matches(col_name: str, table: str) -> bool:
+    """Column "branchcode" / "branch_id" looks like the key of Branch, Branches, BranchMaster."""
+    stem = col_name
+    for suffix in KEY_SUFFIXES:
+        if stem.endswith(suffix) and len(stem) > len(suffix):
+            stem = stem[: -len(suffix)].rstrip("_")
+            break
+    name = table.split(".", 1)[1].lower()
+    if name == stem:
+        return True
+    return any(name == stem + suffix for suffix in HUB_TABLE_SUFFIXES)
+
+
+def _hub_score(col_name, table, keys, row_counts) -> float:
+    """How likely `table` is the one that owns `col_name` (0 = not a hub)."""
+    score = 0.0
+    if (table, col_name) in keys:
+        score += 2.0
+    if _name_matches(col_name, table):
+        score += 1.0
+    if score and row_counts:
+        # among equal signals prefer the smaller (dimension-like) table
+        score -= min(row_counts.get(table, 0), 10**9) / 10**10
+    return score
+
+
+def _heuristic_edges(
+    by_col: Dict[str, List[Tuple[str, str]]],
+    only: Optional[Set[str]] = None,
+    keys: Optional[Set[Tuple[str, str]]] = None,
+    row_counts: Optional[Dict[str, int]] = None,
+) -> List[dict]:
+    """
+    Same column name & type in multiple tables. `only` restricts the pass
+    to those (lowercase) column names.
+
+    A column name shared by a few tables joins every pair (score 0.6). For
+    widely shared names (BranchCode in 800 tables) that would be O(n^2)
+    edges, so each table is joined only to the column's hub tables: those
+    with a single-column PK / unique index on it (`keys`, lowercase column
+    names) or named after it. Hub edges score 0.8 (key) or 0.7 (name only);
+    names without any hub get no edges. At most MAX_FANOUT edges per name,
+    largest tables (by `row_counts`) first.
+    """
+    keys = keys or set()
+    row_counts = row_counts or {}
+    edges: List[dict] = []
 
-    generic_cols = {
-        "id",
-        "createddate",
-        "modifieddate",
-        "created_by",
-        "updated_by",
-        "rowversion",
-        "timestamp",
-    }
+    def edge(t1, t2, col_name, score):
+        return {
+            "left": t1,
+            "right": t2,
+            "left_column": col_name,
+            "right_column": col_name,
+            "source": "same_column_name",
+            "score": score,
+        }
 
     for col_name, tables in by_col.items():
+        if only is not None and col_name not in only:
+            continue
         if len(tables) < 2:
             continue
-        if col_name in generic_cols:
+        if col_name in GENERIC_COLS:
+            continue
+
+        if len(tables) <= PAIRWISE_MAX_TABLES:
+            for i in range(len(tables)):
+                for j in range(i + 1, len(tables)):
+                    t1, dt1 = tables[i]
+                    t2, dt2 = tables[j]
+                    if t1 == t2:
+                        continue
+                    if dt1 != dt2:
+                        continue  # require same datatype for heuristic edge
+
+                    edges.append(edge(t1, t2, col_name, 0.6))  # weaker than foreign key
+            continue
+
+        scored = sorted(
+            ((_hub_score(col_name, t, keys, row_counts), t, dt) for t, dt in tables),
+            reverse=True,
+        )
+        hubs = [(score, t, dt) for score, t, dt in scored[:MAX_HUBS] if score > 0]
+        if not hubs:
             continue
+        hub_tables = {t for _, t, _ in hubs}
 
-        for i in range(len(tables)):
-            for j in range(i + 1, len(tables)):
-                t1, dt1 = tables[i]
-                t2, dt2 = tables[j]
-                if t1 == t2:
+        others = sorted(
+            (tdt for tdt in tables if tdt[0] not in hub_tables),
+            key=lambda tdt: row_counts.get(tdt[0], 0),
+            reverse=True,
+        )
+        n = 0
+        for score, hub, hub_dt in hubs:
+            strength = 0.8 if (hub, col_name) in keys else 0.7
+            for t, dt in others:
+                if n >= MAX_FANOUT:
+                    break
+                if dt != hub_dt:
                     continue
-                if dt1 != dt2:
-                    continue  # require same datatype for heuristic edge
-
-                edges.append(
-                    {
-                        "left": t1,
-                        "right": t2,
-                        "left_column": col_name,
-                        "right_column": col_name,
-                        "source": "same_column_name",
-                        "score": 0.6,  # weaker than foreign key
-                    }
-                )
+                edges.append(edge(t, hub, col_name, strength))
+                n += 1
+    return edges
 
-    # 3) Build adjacency graph
+
+def _graph_from_edges(edges: List[dict]) -> Dict[str, List[dict]]:
     graph: Dict[str, List[dict]] = {}
     for e in edges:
         graph.setdefault(e["left"], []).append(e)
@@ -139,22 +269,375 @@ def build_join_graph() -> Dict[str, List[dict]]:
             "score": e["score"],
         }
         graph.setdefault(rev["left"], []).append(rev)
+    return graph
 
-    with open(JOIN_GRAPH_JSON, "w", encoding="utf-8") as f:
-        json.dump({"edges": edges, "graph": graph}, f, ensure_ascii=False, indent=2)
 
-    print(f"Join graph saved to {JOIN_GRAPH_JSON} with {len(edges)} edges.")
-    return graph
+def _save_join_graph(edges: List[dict]) -> Dict[str, List[dict]]:
+    """
+    Store the edges (one direction only) as columnar arrays: table and column
+    names once each, edges as integer codes into them.
+    """
+    tables = sorted({e["left"] for e in edges} | {e["right"] for e in edges})
+    columns = sorted({e["left_column"] for e in edges} | {e["right_column"] for e in edges})
+    t_code = {t: i for i, t in enumerate(tables)}
+    c_code = {c: i for i, c in enumerate(columns)}
+    s_code = {src: i for i, src in enumerate(SOURCES)}
+
+    tmp = JOIN_GRAPH_NPZ + ".tmp"
+    with open(tmp, "wb") as f:
+        np.savez(
+            f,
+            tables=np.asarray(tables, dtype=str),
+            columns=np.asarray(columns, dtype=str),
+            left=np.asarray([t_code[e["left"]] for e in edges], dtype="int32"),
+            right=np.asarray([t_code[e["right"]] for e in edges], dtype="int32"),
+            left_column=np.asarray([c_code[e["left_column"]] for e in edges], dtype="int32"),
+            right_column=np.asarray([c_code[e["right_column"]] for e in edges], dtype="int32"),
+            source=np.asarray([s_code[e["source"]] for e in edges], dtype="uint8"),
+            score=np.asarray([e["score"] for e in edges], dtype="float64"),
+            # heuristic score before join_profiler's rescoring
+            base_score=np.asarray(
+                [e.get("base_score", e["score"]) for e in edges], dtype="float64"
+            ),
+        )
+    os.replace(tmp, JOIN_GRAPH_NPZ)
+
+    print(f"Join graph saved to {JOIN_GRAPH_NPZ} with {len(edges)} edges.")
+    return _graph_from_edges(edges)
+
+
+def _read_catalog():
+    """(fk_rows, columns, single-column keys, row counts) from SQL Server."""
+    with pooled_connection() as conn:
+        cur = conn.cursor()
+
+        cur.execute(FK_SQL)
+        fk_rows = cur.fetchall()
+
+        cur.execute(COLUMNS_SQL)
+        cols = cur.fetchall()
+
+        cur.execute(KEYS_SQL)
+        keys = {(f"{s}.{t}", c.lower()) for s, t, c in cur.fetchall()}
+
+        try:
+            cur.execute(ROW_COUNTS_SQL)
+            row_counts = {f"{s}.{t}": int(n or 0) for s, t, n in cur.fetchall()}
+        except Exception:
+            # needs VIEW DATABASE STATE; hubs are still found without it
+            row_counts = {}
+
+    return fk_rows, cols, keys, row_counts
+
+
+def _verify_with_sketches(edges: List[dict]) -> List[dict]:
+    """Rescore heuristic edges with the value sketches, if join_profiler ran."""
+    # imported here: join_profiler itself imports this module
+    from join_profiler import load_sketches, rescore_edges
+
+    sketches = load_sketches()
+    return rescore_edges(edges, sketches) if sketches else edges
+
+
+def build_join_graph() -> Dict[str, List[dict]]:
+    """
+    Build join graph using:
+    - Real foreign keys (sys.foreign_keys)
+    - Heuristic joins on same column names, guided by PK / unique keys,
+      row counts and naming (see _heuristic_edges)
+
+    Returns adjacency dict: { "schema.table": [edge, ...], ... }
+    """
+    os.makedirs(DATA_DIR, exist_ok=True)
+
+    fk_rows, cols, keys, row_counts = _read_catalog()
+
+    # 1) Strong edges from FOREIGN KEYS
+    edges = _fk_edges(fk_rows)
+    # 2) Heuristic edges: same column name & type in multiple tables
+    edges += _heuristic_edges(_columns_by_name(cols), keys=keys, row_counts=row_counts)
+    edges = _verify_with_sketches(edges)
+
+    # 3) Build adjacency graph
+    return _save_join_graph(edges)
+
+
+def update_join_graph(changed_tables: Optional[Iterable[str]] = None):
+    """
+    Patch the saved join graph after an incremental schema scan instead of
+    rebuilding it. `changed_tables` ("schema.table") defaults to the added,
+    changed and dropped tables in data/schema_changes.json.
+
+    Edges touching those tables are dropped; foreign-key edges for them are
+    re-read and heuristic edges are recomputed for every column name they
+    had before or have now (other tables' edges on those names included).
+    """
+    if changed_tables is None:
+        if not os.path.exists(SCHEMA_CHANGES_JSON):
+            return build_join_graph()
+        with open(SCHEMA_CHANGES_JSON, "r", encoding="utf-8") as f:
+            changes = json.load(f)
+        changed_tables = changes["added"] + changes["changed"] + changes["dropped"]
+
+    affected = set(changed_tables)
+    if not affected:
+        print("Join graph is up to date.")
+        return _load_join_graph()
+    if _graph_file() is None:
+        return build_join_graph()
+
+    edges = _load_edges()
+    fk_rows, cols, keys, row_counts = _read_catalog()
+
+    by_col = _columns_by_name(cols)
+
+    def touches(e):
+        return e["left"] in affected or e["right"] in affected
+
+    # column names the affected tables have now, or had in the old graph
+    affected_cols = {
+        name for name, tables in by_col.items() if any(t in affected for t, _ in tables)
+    }
+    affected_cols |= {
+        e["left_column"] for e in edges if e["source"] == "same_column_name" and touches(e)
+    }
+
+    kept = [
+        e
+        for e in edges
+        if not (
+            touches(e)
+            or (e["source"] == "same_column_name" and e["left_column"] in affected_cols)
+        )
+    ]
+    fresh = [e for e in _fk_edges(fk_rows) if touches(e)]
+    fresh += _heuristic_edges(by_col, only=affected_cols, keys=keys, row_counts=row_counts)
+    fresh = _verify_with_sketches(fresh)
+
+    print(f"- Join graph: {len(edges) - len(kept)} edge(s) removed, {len(fresh)} recomputed.")
+    return _save_join_graph(kept + fresh)
+
+
+def _graph_file() -> Optional[str]:
+    for path in (JOIN_GRAPH_NPZ, JOIN_GRAPH_JSON):
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def _load_edges() -> List[dict]:
+    path = _graph_file()
+    if path is None:
+        raise FileNotFoundError(
+            f"{JOIN_GRAPH_NPZ} not found. Run build_join_graph() once first."
+        )
+    if path == JOIN_GRAPH_JSON:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)["edges"]
+
+    with np.load(path) as data:
+        tables = data["tables"].tolist()
+        columns = data["columns"].tolist()
+        return [
+            {
+                "left": tables[l],
+                "right": tables[r],
+                "left_column": columns[lc],
+                "right_column": columns[rc],
+                "source": SOURCES[src],
+                "score": score,
+                "base_score": base,
+            }
+            for l, r, lc, rc, src, score, base in zip(
+                data["left"].tolist(),
+                data["right"].tolist(),
+                data["left_column"].tolist(),
+                data["right_column"].tolist(),
+                data["source"].tolist(),
+                data["score"].tolist(),
+                # graphs saved before base_score existed
+                (data["base_score"] if "base_score" in data.files else data["score"]).tolist(),
+            )
+        ]
 
 
 def _load_join_graph() -> Dict[str, List[dict]]:
-    if not os.path.exists(JOIN_GRAPH_JSON):
+    return _graph_from_edges(_load_edges())
+
+
+def _hint_line(e: dict) -> str:
+    return (
+        f"- Join {e['left']} and {e['right']} ON "
+        f"{e['left']}.{e['left_column']} = {e['right']}.{e['right_column']} "
+        f"({e['source']})"
+    )
+
+
+def _edge_key(e: dict):
+    # the same join seen from either side
+    return tuple(sorted([(e["left"], e["left_column"]), (e["right"], e["right_column"])]))
+
+
+class JoinGraphIndex:
+    """
+    The join graph prepared for per-question lookups:
+    - an Aho-Corasick matcher over table names (one pass over the question),
+    - per-table edge lists and a global edge list, deduplicated and sorted
+      by score once,
+    - shortest join paths between candidate tables (Dijkstra, cost 1/score
+      per hop, so fewer and stronger joins win), cached per candidate set.
+    """
+
+    def __init__(self, graph: Dict[str, List[dict]]):
+        self.graph = graph
+
+        self.edges_by_table: Dict[str, List[dict]] = {}
+        seen = set()
+        all_edges = []
+        for table, edges in graph.items():
+            by_key = {}
+            for e in edges:
+                by_key.setdefault(
+                    (e["right"], e["left_column"], e["right_column"]), e
+                )
+            self.edges_by_table[table] = sorted(
+                by_key.values(), key=lambda e: e["score"], reverse=True
+            )
+            for e in edges:
+                key = _edge_key(e)
+                if key not in seen:
+                    seen.add(key)
+                    all_edges.append(e)
+        self.top_edges = sorted(all_edges, key=lambda e: e["score"], reverse=True)
+
+        self.matcher = AhoCorasick(
+            (full_table.split(".", 1)[1], full_table) for full_table in graph
+        )
+        self.matcher.build()
+
+        self._paths: "OrderedDict[frozenset, List[dict]]" = OrderedDict()
+        self._paths_lock = threading.Lock()
+
+    def candidate_tables(self, question: str) -> List[str]:
+        """
+        Tables whose name appears in the question. A name found only inside
+        a longer matched name ("sales" in "salesdetail") does not count.
+        """
+        matches = list(self.matcher.find(question))
+        spans = {(s, e) for _, s, e in matches}
+        return list(
+            dict.fromkeys(
+                table
+                for table, s, e in matches
+                if not any(
+                    s2 <= s and e <= e2 and (s2, e2) != (s, e) for s2, e2 in spans
+                )
+            )
+        )
+
+    def _shortest_paths(self, source: str, targets: Set[str]) -> Dict[str, List[dict]]:
+        """Edge lists of the cheapest paths from source to each reachable target."""
+        dist = {source: 0.0}
+        back: Dict[str, dict] = {}
+        heap = [(0.0, source)]
+        left = set(targets) - {source}
+        while heap and left:
+            cost, table = heapq.heappop(heap)
+            if cost > dist.get(table, float("inf")):
+                continue
+            left.discard(table)
+            hops = 0
+            t = table
+            while t in back:
+                hops += 1
+                t = back[t]["left"]
+            if hops >= MAX_PATH_HOPS:
+                continue
+            for e in self.edges_by_table.get(table, []):
+                nxt = e["right"]
+                new_cost = cost + 1.0 / max(e["score"], 1e-6)
+                if new_cost < dist.get(nxt, float("inf")):
+                    dist[nxt] = new_cost
+                    back[nxt] = e
+                    heapq.heappush(heap, (new_cost, nxt))
+
+        paths = {}
+        for target in targets:
+            if target == source or target not in back:
+                continue
+            path = []
+            t = target
+            while t != source:
+                e = back[t]
+                path.append(e)
+                t = e["left"]
+            paths[target] = path[::-1]
+        return paths
+
+    def join_paths(self, candidates: List[str]) -> List[dict]:
+        """
+        Edges connecting the candidate tables: every direct edge between two
+        candidates, and the shortest multi-hop path for pairs with none.
+        """
+        key = frozenset(candidates)
+        with self._paths_lock:
+            cached = self._paths.get(key)
+            if cached is not None:
+                self._paths.move_to_end(key)
+                return cached
+
+        ordered = sorted(key)
+        cand = set(ordered)
+        result, seen = [], set()
+
+        def add(e):
+            k = _edge_key(e)
+            if k not in seen:
+                seen.add(k)
+                result.append(e)
+
+        for i, t1 in enumerate(ordered):
+            direct = {e["right"] for e in self.edges_by_table.get(t1, []) if e["right"] in cand}
+            for e in self.edges_by_table.get(t1, []):
+                if e["right"] in cand:
+                    add(e)
+            missing = {t2 for t2 in ordered[i + 1 :] if t2 not in direct}
+            if missing:
+                for path in self._shortest_paths(t1, missing).values():
+                    for e in path:
+                        add(e)
+
+        with self._paths_lock:
+            self._paths[key] = result
+            while len(self._paths) > PATH_CACHE_SIZE:
+                self._paths.popitem(last=False)
+        return result
+
+
+# resident (file signature, JoinGraphIndex), reloaded when the file changes
+_index_cache = None
+_index_lock = threading.Lock()
+
+
+def get_join_index() -> JoinGraphIndex:
+    global _index_cache
+    path = _graph_file()
+    if path is None:
         raise FileNotFoundError(
-            f"{JOIN_GRAPH_JSON} not found. Run build_join_graph() once first."
+            f"{JOIN_GRAPH_NPZ} not found. Run build_join_graph() once first."
         )
-    with open(JOIN_GRAPH_JSON, "r", encoding="utf-8") as f:
-        data = json.load(f)
-    return data["graph"]
+    st = os.stat(path)
+    sig = (path, st.st_mtime_ns, st.st_size)
+    cached = _index_cache
+    if cached is not None and cached[0] == sig:
+        return cached[1]
+
+    with _index_lock:
+        cached = _index_cache
+        if cached is None or cached[0] != sig:
+            cached = (sig, JoinGraphIndex(_load_join_graph()))
+            _index_cache = cached
+        return cached[1]
 
 
 def suggest_join_hints(question: str, max_pairs: int = 10) -> str:
@@ -164,65 +647,20 @@ def suggest_join_hints(question: str, max_pairs: int = 10) -> str:
       - Join dbo.sales and dbo.partymaster ON dbo.sales.pcode = dbo.partymaster.pcode
 
     The LLM will see these and use them when generating SQL.
+    Tables named in the question are connected directly or, failing that,
+    through the shortest chain of joins; a single named table gets its
+    strongest joins.
     """
 
-    graph = _load_join_graph()
-
-    q = question.lower()
-
-    # Candidate tables: those whose table-name appears in the question text
-    candidate_tables = []
-    for full_table in graph.keys():
-        schema, name = full_table.split(".", 1)
-        if name.lower() in q:
-            candidate_tables.append(full_table)
+    index = get_join_index()
+    candidate_tables = index.candidate_tables(question)
 
     # If no table name explicitly in the question, just return top edges (generic hints)
     if not candidate_tables:
-        # Take a few high-score edges as generic patterns
-        pairs = []
-        for table, edges in graph.items():
-            for e in edges:
-                pairs.append(e)
-        # sort by score descending, unique them
-        seen = set()
-        lines = []
-        for e in sorted(pairs, key=lambda x: x["score"], reverse=True):
-            key = (e["left"], e["right"], e["left_column"], e["right_column"])
-            if key in seen:
-                continue
-            seen.add(key)
-            lines.append(
-                f"- Join {e['left']} and {e['right']} ON "
-                f"{e['left']}.{e['left_column']} = {e['right']}.{e['right_column']} "
-                f"({e['source']})"
-            )
-            if len(lines) >= max_pairs:
-                break
-        return "\n".join(lines)
-
-    # If we have candidate tables, create hints only for them
-    lines: List[str] = []
-    seen_pairs = set()
-
-    for i in range(len(candidate_tables)):
-        t1 = candidate_tables[i]
-        for e in graph.get(t1, []):
-            t2 = e["right"]
-            if t2 not in candidate_tables:
-                continue
-
-            key = tuple(sorted([t1, t2]) + [e["left_column"], e["right_column"]])
-            if key in seen_pairs:
-                continue
-
-            seen_pairs.add(key)
-            lines.append(
-                f"- Join {t1} and {t2} ON "
-                f"{t1}.{e['left_column']} = {t2}.{e['right_column']} "
-                f"({e['source']})"
-            )
-            if len(lines) >= max_pairs:
-                break
+        edges = index.top_edges[:max_pairs]
+    elif len(candidate_tables) == 1:
+        edges = index.edges_by_table.get(candidate_tables[0], [])[:max_pairs]
+    else:
+        edges = index.join_paths(candidate_tables)[:max_pairs]
 
-    return "\n".join(lines)
+    return "\n".join(_hint_line(e) for e in edges)
@@ -0,0 +1,320 @@
+# join_profiler.py
+"""
+Optional profiling job that checks heuristic join edges against the data.
+
+For every column used by a "same_column_name" edge, the distinct values are
+hashed on the server (MD5 of the value as text, as a 64-bit number; on pooled
+connections, tables in parallel) and reduced to a bottom-k MinHash sketch:
+the K smallest hashes (and a KMV estimate of the distinct count). Two
+sketches give the containment |A ∩ B| / |A| without ever running a
+pairwise overlap query: the share of A's hashes, below the largest hash
+both sketches hold in full, that B's sketch has too.
+
+Every read is bounded: a table of up to sample_rows rows is read with
+TOP (sample_rows + 1), a larger one through TABLESAMPLE sized for about
+sample_rows rows (plain TOP when the sample comes back short), so the server
+only hashes the rows it returns. The K smallest hashes are then picked on
+the client; being the lowest hashes, they are still the same slice of
+values on both sides of a join. A sampled sketch is never exact. Columns
+profiled before an error or timeout on their table are kept.
+
+Edges are then rescored from the better of the two containments:
+0.5 + 0.5 * containment. Below MIN_CONTAINMENT an edge is dropped only when
+both sketches hold every distinct value of their column ("exact"); otherwise
+the overlap may just be missing from the samples and its score is halved.
+Foreign-key edges, edges without both sketches and pairs whose sketches
+overlap in too small a range to tell (MIN_SUPPORT) keep their score.
+Rescoring always starts from the heuristic score (kept as "base_score"
+in the join graph), so running the job again doesn't compound it.
+
+Sketches are kept in data/join_sketches.npz. A run re-profiles only tables
+that are new, changed (data/schema_changes.json) or older than
+SKETCH_MAX_AGE_DAYS; pass --full to redo everything.
+
+    python join_profiler.py [--full] [--workers 8] [--sample-rows 10000]
+"""
+
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from db import pooled_connection
+from schema_scanner import SCHEMA_CHANGES_JSON, _worker_count
+
+DATA_DIR = "data"
+SKETCHES_NPZ = os.path.join(DATA_DIR, "join_sketches.npz")
+
+SKETCH_K = 256
+SAMPLE_ROWS = int(os.getenv("JOIN_PROFILE_SAMPLE_ROWS", "10000"))
+SKETCH_MAX_AGE_DAYS = float(os.getenv("JOIN_SKETCH_MAX_AGE_DAYS", "7"))
+MIN_CONTAINMENT = 0.2
+MIN_SUPPORT = 16  # sketched values behind a containment estimate
+
+# (table, lowercase column) ->
+#     {"hashes": sorted uint64, "ndv": float, "at": epoch, "exact": bool}
+# exact: the sketch holds every distinct value of the column
+Sketches = Dict[Tuple[str, str], dict]
+
+# the value as trimmed text (an int key and its varchar copy hash alike),
+# MD5, last 8 bytes as a signed bigint
+HASH_EXPR = "CAST(HASHBYTES('MD5', LTRIM(RTRIM(CONVERT(nvarchar(4000), [{column}])))) AS bigint)"
+
+ROW_COUNT_SQL = """
+SELECT SUM(p.rows) FROM sys.partitions p
+WHERE p.object_id = OBJECT_ID(?) AND p.index_id IN (0, 1)
+"""
+
+
+def make_sketch(hashes, k: int = SKETCH_K, truncated: bool = False) -> dict:
+    """
+    Bottom-k sketch from server-side value hashes (signed bigints);
+    truncated when the read was a sample or stopped at its row cap.
+    """
+    h = np.unique(np.asarray(list(hashes), dtype="int64")).view("uint64") ^ np.uint64(1 << 63)
+    h.sort()  # signed order -> unsigned, same order
+    if len(h) >= k:
+        ndv = (k - 1) / (float(h[k - 1]) / 2.0**64)
+    else:
+        ndv = float(len(h))
+    exact = not truncated and len(h) < k
+    return {"hashes": h[:k], "ndv": ndv, "at": time.time(), "exact": exact}
+
+
+def _covered(sketch: dict, k: int = SKETCH_K) -> int:
+    """Largest hash up to which the sketch holds every hash that was read."""
+    h = sketch["hashes"]
+    if len(h) >= k:
+        return int(h[k - 1])
+    return 2**64 - 1
+
+
+def containment(a: dict, b: dict, k: int = SKETCH_K) -> Optional[float]:
+    """
+    Estimated |A ∩ B| / |A|: the share of A's sketched hashes, within the
+    range both sketches hold in full, that B's sketch holds too. None when
+    too few of them fall in that range to tell (e.g. a small set against a
+    very large one), unless both sketches are exact.
+    """
+    ha, hb = a["hashes"], b["hashes"]
+    shared = ha[ha <= np.uint64(min(_covered(a, k), _covered(b, k)))]
+    if not len(shared) or (len(shared) < MIN_SUPPORT and not (a["exact"] and b["exact"])):
+        return None
+    return len(np.intersect1d(shared, hb, assume_unique=True)) / len(shared)
+
+
+def load_sketches() -> Sketches:
+    if not os.path.exists(SKETCHES_NPZ):
+        return {}
+    with np.load(SKETCHES_NPZ) as data:
+        tables = data["tables"].tolist()
+        columns = data["columns"].tolist()
+        offsets = data["offsets"]
+        hashes = data["hashes"]
+        ndv = data["ndv"].tolist()
+        at = data["at"].tolist()
+        # files from before exact sketches: TOP N row samples, never exact
+        exact = data["exact"].tolist() if "exact" in data else [False] * len(tables)
+        if "mod" in data:
+            # hash-range slices of an older version: stale, profile them again
+            at = [0.0 if m > 1 else a for m, a in zip(data["mod"].tolist(), at)]
+        return {
+            (t, c): {
+                "hashes": hashes[offsets[i] : offsets[i + 1]],
+                "ndv": ndv[i],
+                "at": at[i],
+                "exact": exact[i],
+            }
+            for i, (t, c) in enumerate(zip(tables, columns))
+        }
+
+
+def save_sketches(sketches: Sketches):
+    keys = sorted(sketches)
+    sizes = [len(sketches[k]["hashes"]) for k in keys]
+    tmp = SKETCHES_NPZ + ".tmp"
+    with open(tmp, "wb") as f:
+        np.savez(
+            f,
+            tables=np.asarray([t for t, _ in keys], dtype=str),
+            columns=np.asarray([c for _, c in keys], dtype=str),
+            offsets=np.concatenate([[0], np.cumsum(sizes)]).astype("int64"),
+            hashes=(
+                np.concatenate([sketches[k]["hashes"] for k in keys])
+                if keys
+                else np.zeros(0, dtype="uint64")
+            ),
+            ndv=np.asarray([sketches[k]["ndv"] for k in keys], dtype="float64"),
+            at=np.asarray([sketches[k]["at"] for k in keys], dtype="float64"),
+            exact=np.asarray([sketches[k]["exact"] for k in keys], dtype=bool),
+        )
+    os.replace(tmp, SKETCHES_NPZ)
+
+
+def _candidate_columns(edges) -> Dict[str, List[str]]:
+    """table -> lowercase columns used by heuristic edges."""
+    wanted: Dict[str, set] = {}
+    for e in edges:
+        if e["source"] != "same_column_name":
+            continue
+        wanted.setdefault(e["left"], set()).add(e["left_column"].lower())
+        wanted.setdefault(e["right"], set()).add(e["right_column"].lower())
+    return {t: sorted(cols) for t, cols in wanted.items()}
+
+
+def _read_hashes(cur, table_sql: str, column: str, limit: int, percent: float = 100.0) -> list:
+    """
+    Value hashes of up to `limit` non-null rows (not distinct: TOP stops the
+    scan early); from a TABLESAMPLE of `percent` of the pages below 100.
+    """
+    sample = f" TABLESAMPLE SYSTEM ({percent:.6f} PERCENT)" if percent < 100 else ""
+    cur.execute(
+        f"SELECT TOP ({int(limit)}) {HASH_EXPR.format(column=column)} "
+        f"FROM {table_sql}{sample} WHERE [{column}] IS NOT NULL"
+    )
+    return [r[0] for r in cur.fetchall()]
+
+
+def _sketch_column(cur, table_sql: str, column: str, sample_rows: int, row_count: int) -> dict:
+    if row_count <= sample_rows:
+        # the row count may be stale: one row past the cap says "not all of it"
+        hashes = _read_hashes(cur, table_sql, column, sample_rows + 1)
+        return make_sketch(hashes[:sample_rows], truncated=len(hashes) > sample_rows)
+    # pages are sampled, not rows: ask for twice the share and cap with TOP
+    percent = min(100.0, 200.0 * sample_rows / row_count)
+    hashes = _read_hashes(cur, table_sql, column, sample_rows, percent)
+    if len(hashes) < SKETCH_K:
+        # few pages picked (or no TABLESAMPLE on a view): the first rows will do
+        hashes = _read_hashes(cur, table_sql, column, sample_rows)
+    return make_sketch(hashes, truncated=True)
+
+
+def _profile_table(table: str, columns: List[str], sample_rows: int, table_timeout: int):
+    """
+    {column: sketch} for one table. An error or timeout stops the table;
+    the columns done before it are kept, the rest wait for the next run.
+    """
+    schema, name = table.split(".", 1)
+    table_sql = f"[{schema}].[{name}]"
+    sketches = {}
+    try:
+        with pooled_connection() as conn:
+            conn.timeout = table_timeout
+            try:
+                cur = conn.cursor()
+                row = cur.execute(ROW_COUNT_SQL, table_sql).fetchone()
+                row_count = int(row[0] or 0) if row else 0
+                for c in columns:
+                    sketches[c] = _sketch_column(cur, table_sql, c, sample_rows, row_count)
+                cur.close()
+            finally:
+                conn.timeout = 0
+    except Exception:
+        pass
+    return sketches
+
+
+def rescore_edges(edges: List[dict], sketches: Sketches) -> List[dict]:
+    """
+    Heuristic edges rescored by value containment; unjoinable ones dropped.
+    Scores are derived from e["base_score"] (the heuristic score, set on the
+    first rescore), never from an earlier rescored score.
+    """
+    out = []
+    for e in edges:
+        if e["source"] != "same_column_name":
+            out.append(e)
+            continue
+        base = e.get("base_score", e["score"])
+        e = dict(e, base_score=base, score=base)
+        a = sketches.get((e["left"], e["left_column"].lower()))
+        b = sketches.get((e["right"], e["right_column"].lower()))
+        if a is None or b is None or not len(a["hashes"]) or not len(b["hashes"]):
+            out.append(e)
+            continue
+        both = (containment(a, b), containment(b, a))
+        c = max((x for x in both if x is not None), default=None)
+        if c is not None and c >= MIN_CONTAINMENT:
+            out.append(dict(e, score=round(0.5 + 0.5 * c, 3)))
+        elif None in both:
+            # one direction can't be told from the sketches: no evidence against it
+            out.append(e)
+        elif not (a["exact"] and b["exact"]):
+            # samples may just have missed the overlap: demote, don't drop
+            out.append(dict(e, score=round(0.5 * base, 3)))
+    return out
+
+
+def profile_joins(
+    full: bool = False,
+    workers: int = 8,
+    sample_rows: int = SAMPLE_ROWS,
+    table_timeout: int = 30,
+):
+    """Refresh the sketches, then rescore and save the join graph."""
+    import join_graph
+
+    start = time.perf_counter()
+    edges = join_graph._load_edges()
+    wanted = _candidate_columns(edges)
+
+    old = {} if full else load_sketches()
+
+    # tables altered since their sketch was taken (per the last schema scan)
+    changed, dropped, changed_at = set(), set(), 0.0
+    if not full and os.path.exists(SCHEMA_CHANGES_JSON):
+        with open(SCHEMA_CHANGES_JSON, "r", encoding="utf-8") as f:
+            changes = json.load(f)
+        changed = set(changes["added"]) | set(changes["changed"])
+        dropped = set(changes["dropped"])
+        changed_at = os.path.getmtime(SCHEMA_CHANGES_JSON)
+
+    stale_before = time.time() - SKETCH_MAX_AGE_DAYS * 86400
+
+    def needs_profile(table, col):
+        sketch = old.get((table, col))
+        if sketch is None or sketch["at"] < stale_before:
+            return True
+        return table in changed and sketch["at"] < changed_at
+
+    todo = [
+        (table, cols)
+        for table, cols in wanted.items()
+        if any(needs_profile(table, c) for c in cols)
+    ]
+
+    # sketches of columns whose edges were dropped are kept: a rebuild of
+    # the graph recreates those edges, and the sketch drops them again
+    sketches = {(t, c): s for (t, c), s in old.items() if t not in dropped}
+    with ThreadPoolExecutor(max_workers=_worker_count(workers)) as pool:
+        results = pool.map(
+            lambda tc: _profile_table(tc[0], tc[1], sample_rows, table_timeout), todo
+        )
+        for (table, _), profiled in zip(todo, results):
+            for col, sketch in profiled.items():
+                sketches[(table, col)] = sketch
+
+    os.makedirs(DATA_DIR, exist_ok=True)
+    save_sketches(sketches)
+
+    rescored = rescore_edges(edges, sketches)
+    print(
+        f"- Profiled {len(todo)} of {len(wanted)} table(s) in "
+        f"{time.perf_counter() - start:.1f}s; "
+        f"{len(edges) - len(rescored)} edge(s) dropped by value overlap."
+    )
+    return join_graph._save_join_graph(rescored)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Verify heuristic joins with value sketches.")
+    parser.add_argument("--full", action="store_true", help="re-profile every table")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--sample-rows", type=int, default=SAMPLE_ROWS)
+    parser.add_argument("--table-timeout", type=int, default=30)
+    args = parser.parse_args()
+    profile_joins(args.full, args.workers, args.sample_rows, args.table_timeout)
@@ -1,46 +1,260 @@
 # llm_ollama_cloud.py
+import asyncio
 import os
-from ollama import Client
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterator, Optional
+import pandas as pd
+from ollama import AsyncClient, Client
 from dotenv import load_dotenv
-from rag_index import retrieve_schema_snippets
+from rag_index import retrieve_schema_hits
+from context_packer import CONTEXT_TOP_K, pack_context
 from join_graph import suggest_join_hints
+from sql_cache import get_sql_cache, normalize_question
+from semantic_cache import get_semantic_cache
+from services.result_summarizer import summarize_result
+from utils.single_flight import AsyncSingleFlight, SingleFlight
+from utils.timing import StageTimer, maybe_stage
 
 
 load_dotenv()
 
 OLLAMA_API_KEY = os.getenv("OLLAMA_API_KEY") or os.getenv("OLLAMA_CLOUD_KEY")
 
-if not OLLAMA_API_KEY:
-    raise ValueError("OLLAMA_API_KEY / OLLAMA_CLOUD_KEY not found in .env file.")
+MODEL = "gpt-oss:120b-cloud"  # or any other cloud model you have
 
-client = Client(
-    host="https://ollama.com",
-    headers={"Authorization": f"Bearer {OLLAMA_API_KEY}"},
-)
+_client = None
+_async_client = None
 
-MODEL = "gpt-oss:120b-cloud"  # or any other cloud model you have
+# schema retrieval and join hints are independent lookups, run side by side
+_context_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="sql-context")
+
+# concurrent identical questions (e.g. a shared report link) share one
+# cache lookup / LLM call
+_sql_flights = SingleFlight()
+_async_sql_flights = AsyncSingleFlight()
+
+
+def get_client(timeout: Optional[float] = None) -> Client:
+    # built on first call, so importing this module stays cheap; a client
+    # with its own request timeout (seconds) is made fresh each time
+    global _client
+    if _client is None or timeout is not None:
+        if not OLLAMA_API_KEY:
+            raise ValueError("OLLAMA_API_KEY / OLLAMA_CLOUD_KEY not found in .env file.")
+        client = Client(
+            host="https://ollama.com",
+            headers={"Authorization": f"Bearer {OLLAMA_API_KEY}"},
+            **({"timeout": timeout} if timeout is not None else {}),
+        )
+        if timeout is not None:
+            return client
+        _client = client
+    return _client
+
+
+def get_async_client() -> AsyncClient:
+    # for the asyncio API server; bound to the event loop that first uses it
+    global _async_client
+    if _async_client is None:
+        if not OLLAMA_API_KEY:
+            raise ValueError("OLLAMA_API_KEY / OLLAMA_CLOUD_KEY not found in .env file.")
+        _async_client = AsyncClient(
+            host="https://ollama.com",
+            headers={"Authorization": f"Bearer {OLLAMA_API_KEY}"},
+        )
+    return _async_client
 
 
 def call_ollama(prompt: str) -> str:
-    response = client.chat(
+    response = get_client().chat(
         model=MODEL,
         messages=[{"role": "user", "content": prompt}],
     )
     return response["message"]["content"]
 
 
-def nl_to_sql(question: str) -> str:
-    # RAG: get relevant schema descriptions
-    snippets = retrieve_schema_snippets(question, top_k=5)
-    # JOIN hints from graph
+async def call_ollama_async(prompt: str) -> str:
+    response = await get_async_client().chat(
+        model=MODEL,
+        messages=[{"role": "user", "content": prompt}],
+    )
+    return response["message"]["content"]
+
+
+def stream_ollama(prompt: str, timeout: Optional[float] = None) -> Iterator[str]:
+    """
+    Yields the completion piece by piece as the model produces it.
+    Closing the generator early drops the HTTP stream. With `timeout`, no
+    single wait for the server (connect, next piece) exceeds it.
+    """
+    stream = get_client(timeout).chat(
+        model=MODEL,
+        messages=[{"role": "user", "content": prompt}],
+        stream=True,
+    )
     try:
-        join_hints = suggest_join_hints(question)
+        for chunk in stream:
+            piece = chunk["message"]["content"]
+            if piece:
+                yield piece
+    finally:
+        close = getattr(stream, "close", None)
+        if close is not None:
+            close()
+
+
+def nl_to_sql(
+    question: str,
+    use_cache: bool = True,
+    on_partial: Optional[Callable[[str], None]] = None,
+    timer: Optional[StageTimer] = None,
+) -> str:
+    """
+    Generate SQL for the question. Repeated questions (same normalized text,
+    same schema) are answered from the persistent SQL cache, near-duplicate
+    phrasings from the semantic cache.
+
+    With on_partial, the completion is streamed: on_partial(text_so_far) is
+    called as tokens arrive, and generation stops as soon as the SQL block
+    is complete, so the caller can start executing it right away.
+
+    Stage durations are recorded in `timer` when one is passed.
+
+    While a question is being answered, the same (normalized) question from
+    other threads waits for that answer instead of calling the LLM again.
+
+    Generated SQL is not cached here: the caller stores it with remember_sql
+    once it has run (and drops it with forget_sql when it can't be run).
+    """
+    if not use_cache:
+        return _generate_sql(question, on_partial, timer)
+
+    return _sql_flights.do(
+        normalize_question(question), _nl_to_sql_cached, question, on_partial, timer
+    )
+
+
+def _nl_to_sql_cached(question, on_partial, timer) -> str:
+    cached = _cached_sql(question, timer)
+    if cached is not None:
+        return cached
+    return _generate_sql(question, on_partial, timer)
+
+
+async def nl_to_sql_async(
+    question: str,
+    use_cache: bool = True,
+    executor=None,
+    timer: Optional[StageTimer] = None,
+) -> str:
+    """
+    nl_to_sql for asyncio servers: cache lookups and prompt building
+    (embeddings, FAISS, file reads) run in `executor`, the LLM call is
+    awaited on the async client, so the event loop is never blocked.
+    Concurrent identical questions share one call, as in nl_to_sql.
+    """
+    if not use_cache:
+        return await _nl_to_sql_async(question, False, executor, timer)
+    return await _async_sql_flights.do(
+        normalize_question(question), _nl_to_sql_async, question, True, executor, timer
+    )
+
+
+async def _nl_to_sql_async(question, use_cache, executor, timer) -> str:
+    loop = asyncio.get_running_loop()
+    if use_cache:
+        cached = await loop.run_in_executor(executor, _cached_sql, question, timer)
+        if cached is not None:
+            return cached
+
+    prompt = await loop.run_in_executor(executor, build_sql_prompt, question, timer)
+    with maybe_stage(timer, "llm sql"):
+        return _clean_sql(await call_ollama_async(prompt))
+
+
+def _cached_sql(question: str, timer: Optional[StageTimer] = None) -> Optional[str]:
+    cache = get_sql_cache()
+    with maybe_stage(timer, "sql cache"):
+        cached = cache.get(question)
+    if cached is not None:
+        return cached
+
+    # near-duplicate phrasing of a question we already answered
+    with maybe_stage(timer, "semantic cache"):
+        return get_semantic_cache().get(question)
+
+
+def remember_sql(question: str, sql: str):
+    """Cache the SQL for the question once it has run (as repaired, if it was)."""
+    if not sql:
+        return
+    get_sql_cache().put(question, sql)
+    get_semantic_cache().put(question, sql)
+
+
+def forget_sql(question: str, sql: Optional[str] = None):
+    """Drop the cached SQL for the question after `sql` failed to run."""
+    get_sql_cache().delete(question)
+    get_semantic_cache().remove(question, sql)
+
+
+# end of the SQL block: a closing ``` fence, or a ";" ending a line
+_FENCED_RE = re.compile(r"^```(?:sql)?\s*(.*?)\s*(?:```|$)", re.DOTALL | re.IGNORECASE)
+_STATEMENT_END_RE = re.compile(r";[ \t]*\n")
+
+
+def _sql_complete(text: str) -> bool:
+    text = text.lstrip()
+    if text.startswith("```"):
+        return text.count("```") >= 2
+    return _STATEMENT_END_RE.search(text) is not None
+
+
+def _clean_sql(text: str) -> str:
+    sql = text.strip()
+
+    # occasionally models wrap in ```sql ... ```
+    if sql.startswith("```"):
+        return _FENCED_RE.match(sql).group(1).strip()
+
+    # or keep talking after the statement
+    end = _STATEMENT_END_RE.search(sql)
+    if end:
+        sql = sql[: end.start() + 1]
+    return sql
+
+
+def _join_hints(question: str) -> str:
+    try:
+        return suggest_join_hints(question)
     except FileNotFoundError:
-        join_hints = ""
+        return ""
 
-    schema_context = "\n\n".join(snippets)
 
-    prompt = f"""
+def _timed(timer: Optional[StageTimer], name: str, fn):
+    return fn if timer is None else timer.timed(name, fn)
+
+
+def build_sql_prompt(question: str, timer: Optional[StageTimer] = None) -> str:
+    # RAG: relevant schema descriptions, and JOIN hints from the graph,
+    # fetched concurrently
+    hits_job = _context_pool.submit(
+        _timed(timer, "retrieval", retrieve_schema_hits), question, top_k=CONTEXT_TOP_K
+    )
+    hints_job = _context_pool.submit(_timed(timer, "join hints", _join_hints), question)
+    q_emb, hits = hits_job.result()
+    join_hints = hints_job.result()
+
+    # best tables, relevant columns and hints only, within SQL_CONTEXT_BUDGET
+    with maybe_stage(timer, "pack context"):
+        schema_context, join_hints = pack_context(question, q_emb, hits, join_hints)
+
+    return sql_prompt(question, schema_context, join_hints)
+
+
+def sql_prompt(question: str, schema_context: str, join_hints: str) -> str:
+    return f"""
 You are an expert SQL generator for Microsoft SQL Server.
 
 Use ONLY the schema information provided below.
@@ -65,18 +279,40 @@ USER QUESTION:
 
 SQL:
 """
-    sql = call_ollama(prompt).strip()
 
-    # occasionally models wrap in ```sql ... ```
-    if sql.startswith("```"):
-        sql = sql.strip("`")
-        if sql.lower().startswith("sql"):
-            sql = sql[3:].strip()
-    return sql
 
+def _generate_sql(
+    question: str,
+    on_partial: Optional[Callable[[str], None]] = None,
+    timer: Optional[StageTimer] = None,
+) -> str:
+    prompt = build_sql_prompt(question, timer)
 
-def create_report(question: str, data):
-    prompt = f"""
+    with maybe_stage(timer, "llm sql"):
+        if on_partial is None:
+            return _clean_sql(call_ollama(prompt))
+
+        text = ""
+        pieces = stream_ollama(prompt)
+        try:
+            for piece in pieces:
+                text += piece
+                on_partial(text)
+                if _sql_complete(text):
+                    break  # whatever follows the SQL is not needed
+        finally:
+            pieces.close()
+        return _clean_sql(text)
+
+
+def _report_prompt(question: str, data) -> str:
+    # data: DataFrame or list of row dicts; either way the prompt gets a
+    # token-budgeted summary, not the repr of every row
+    if not isinstance(data, pd.DataFrame):
+        data = pd.DataFrame(data)
+    data = summarize_result(data)
+
+    return f"""
 You are a reporting assistant.
 
 Write a clear, concise business-style report answering the user's question
@@ -94,4 +330,19 @@ DATA:
 
 REPORT:
 """
-    return call_ollama(prompt)
+
+
+def create_report(question: str, data):
+    return call_ollama(_report_prompt(question, data))
+
+
+async def create_report_async(question: str, data, executor=None) -> str:
+    """create_report for asyncio servers; the data summary is built in `executor`."""
+    loop = asyncio.get_running_loop()
+    prompt = await loop.run_in_executor(executor, _report_prompt, question, data)
+    return await call_ollama_async(prompt)
+
+
+def create_report_stream(question: str, data) -> Iterator[str]:
+    """Like create_report, but yields the report as it is generated."""
+    return stream_ollama(_report_prompt(question, data))
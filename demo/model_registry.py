@@ -0,0 +1,55 @@
+# model_registry.py
+"""
+One lazily-loaded embedding model per process.
+
+rag_index, semantic_cache and services.semantic_engine all use the same
+all-MiniLM-L6-v2 instance from here. Nothing heavy (torch,
+sentence_transformers) is imported until a model is first needed, so the
+Streamlit page renders right away; warm_up() loads it in a background thread
+before the first question arrives.
+"""
+
+import os
+import threading
+
+os.environ.setdefault("TORCH_DISABLE_TORCH_INDEXING", "1")
+
+EMBED_MODEL = "all-MiniLM-L6-v2"
+
+_models = {}
+_load_lock = threading.Lock()
+_warmup_lock = threading.Lock()
+_warmup_thread = None
+
+
+def get_embedding_model(name: str = EMBED_MODEL):
+    model = _models.get(name)
+    if model is not None:
+        return model
+
+    with _load_lock:
+        if name not in _models:
+            from sentence_transformers import SentenceTransformer
+
+            _models[name] = SentenceTransformer(name)
+        return _models[name]
+
+
+def is_loaded(name: str = EMBED_MODEL) -> bool:
+    return name in _models
+
+
+def warm_up(name: str = EMBED_MODEL) -> threading.Thread:
+    """
+    Start loading the model in a daemon thread (once per process).
+    Callers that need the model before it is ready simply block in
+    get_embedding_model() until the load finishes.
+    """
+    global _warmup_thread
+    with _warmup_lock:
+        if _warmup_thread is None:
+            _warmup_thread = threading.Thread(
+                target=get_embedding_model, args=(name,), name="model-warmup", daemon=True
+            )
+            _warmup_thread.start()
+        return _warmup_thread
@@ -5,59 +5,426 @@ os.environ["TORCH_DISABLE_TORCH_INDEXING"] = "1"
 # rag_index.py
 import os
 import json
+import hashlib
+import threading
 import numpy as np
 import faiss
-from sentence_transformers import SentenceTransformer
+from model_registry import EMBED_MODEL, get_embedding_model
 
 DATA_DIR = "data"
 SCHEMA_JSON = os.path.join(DATA_DIR, "db_schema.json")
 INDEX_PATH = os.path.join(DATA_DIR, "schema.index")
 TEXTS_PATH = os.path.join(DATA_DIR, "schema_texts.json")
+EMBEDDINGS_PATH = os.path.join(DATA_DIR, "schema_embeddings.npy")
+STORE_PATH = os.path.join(DATA_DIR, "schema_store.json")
 
-EMBED_MODEL = "all-MiniLM-L6-v2"
-_model = None
+# Index type: "auto", "flat", "ivf_flat", "hnsw" or "ivf_pq".
+# "auto" picks brute force for small schemas and IVF-Flat for large ones.
+# ivf_pq (compressed vectors, recall ~0.5 on its own) is opt-in only; its
+# candidates are re-ranked against the stored embeddings.
+INDEX_TYPE = os.getenv("RAG_INDEX_TYPE", "auto")
+AUTO_IVF_MIN = 10_000  # below this, flat search is fast enough
+PQ_RERANK_FACTOR = int(os.getenv("RAG_PQ_RERANK", "8"))  # candidates per result
+
+# query-time recall/latency knobs
+NPROBE = int(os.getenv("RAG_NPROBE", "16"))
+EF_SEARCH = int(os.getenv("RAG_EF_SEARCH", "64"))
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 200
+
+# resident (signature, index, texts), reloaded only when the files change
+_index_cache = None
+_index_lock = threading.Lock()
 
 
 def get_model():
-    global _model
-    if _model is None:
-        _model = SentenceTransformer(EMBED_MODEL)
-    return _model
+    # shared with services.semantic_engine, loaded on first use
+    return get_embedding_model(EMBED_MODEL)
+
+
+def _entry_key(entry: dict) -> str:
+    return f"{entry['schema']}.{entry['table']}"
+
+
+def _entry_hash(entry: dict) -> str:
+    payload = json.dumps(entry, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _load_store():
+    """
+    Return the store manifest if it matches the files on disk, else None.
+
+    Manifest layout:
+      { "model": ..., "dim": int, "rows": int,
+        "entries": { "schema.table": {"id": int, "hash": str} },
+        "free": [ids of deleted rows, reusable] }
+
+    Row i of schema_embeddings.npy and texts[i] belong to FAISS id i.
+    """
+    paths = (STORE_PATH, EMBEDDINGS_PATH, INDEX_PATH, TEXTS_PATH)
+    if not all(os.path.exists(p) for p in paths):
+        return None
+    with open(STORE_PATH, "r", encoding="utf-8") as f:
+        store = json.load(f)
+    if store.get("model") != EMBED_MODEL:
+        return None
+    return store
+
+
+def load_embeddings(mmap_mode: str = "r"):
+    """Memory-map the stored table embeddings (rows = FAISS ids)."""
+    return np.load(EMBEDDINGS_PATH, mmap_mode=mmap_mode)
+
+
+def _write_json(path: str, obj):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(obj, f)
+    os.replace(tmp, path)
+
+
+def _write_index(index):
+    tmp = INDEX_PATH + ".tmp"
+    faiss.write_index(index, tmp)
+    os.replace(tmp, INDEX_PATH)
+
+
+def choose_index_type(n: int) -> str:
+    if INDEX_TYPE != "auto":
+        kind = INDEX_TYPE
+    elif n < AUTO_IVF_MIN:
+        kind = "flat"
+    else:
+        kind = "ivf_flat"
+    # PQ codebooks have 256 centroids per sub-quantizer and need data to train
+    if kind == "ivf_pq" and n < 1024:
+        kind = "ivf_flat"
+    return kind
+
+
+def _nlist(n: int) -> int:
+    # ~4*sqrt(n) lists, with enough points per list to train on
+    return max(1, min(int(4 * np.sqrt(n)), n // 39))
+
+
+def _pq_m(dim: int) -> int:
+    # sub-quantizers of ~8 dims each; m must divide dim
+    for m in (dim // 8, 64, 48, 32, 24, 16, 12, 8, 4, 2):
+        if m >= 1 and dim % m == 0:
+            return m
+    return 1
+
+
+def make_index(embeddings: np.ndarray, ids: np.ndarray, kind: str):
+    """
+    Build a FAISS index of the given kind over (embeddings, ids), training
+    it first when the type needs it. All indexes use inner product on
+    normalized vectors (= cosine) and keep the caller's ids.
+    """
+    n, dim = embeddings.shape
+    ip = faiss.METRIC_INNER_PRODUCT
+
+    if kind == "flat":
+        index = faiss.IndexIDMap2(faiss.IndexFlatIP(dim))
+    elif kind == "hnsw":
+        hnsw = faiss.IndexHNSWFlat(dim, HNSW_M, ip)
+        hnsw.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        index = faiss.IndexIDMap2(hnsw)
+    elif kind in ("ivf_flat", "ivf_pq"):
+        nlist = _nlist(n)
+        quantizer = faiss.IndexFlatIP(dim)
+        if kind == "ivf_flat":
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist, ip)
+        else:
+            index = faiss.IndexIVFPQ(quantizer, dim, nlist, _pq_m(dim), 8, ip)
+        train = embeddings
+        max_train = 256 * nlist
+        if n > max_train:
+            pick = np.random.default_rng(0).choice(n, max_train, replace=False)
+            train = embeddings[np.sort(pick)]
+        index.train(np.ascontiguousarray(train, dtype="float32"))
+    else:
+        raise ValueError(f"Unknown index type: {kind}")
+
+    index.add_with_ids(np.ascontiguousarray(embeddings, dtype="float32"), ids)
+    return index
+
+
+def _search_params(index, nprobe=None, ef_search=None):
+    """Per-query parameters for ANN indexes (None for flat)."""
+    inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap) else index
+    if isinstance(inner, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(efSearch=ef_search or EF_SEARCH)
+    if isinstance(inner, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(nprobe=min(nprobe or NPROBE, inner.nlist))
+    return None
+
+
+def _is_pq(index) -> bool:
+    inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap) else index
+    return isinstance(inner, faiss.IndexIVFPQ)
+
+
+def search(index, q_emb: np.ndarray, top_k: int, nprobe=None, ef_search=None, vectors=None):
+    """
+    index.search with the ANN knobs. For IVF-PQ with `vectors` (row i =
+    id i, e.g. the memory-mapped embeddings), PQ_RERANK_FACTOR * top_k
+    candidates are fetched and re-scored on the full vectors.
+    """
+    rerank = vectors is not None and _is_pq(index)
+    k = top_k * PQ_RERANK_FACTOR if rerank else top_k
+    params = _search_params(index, nprobe, ef_search)
+    if params is None:
+        scores, idx = index.search(q_emb, k)
+    else:
+        scores, idx = index.search(q_emb, k, params=params)
+    if not rerank:
+        return scores, idx
+
+    out_scores = np.full((len(q_emb), top_k), -np.inf, dtype="float32")
+    out_idx = np.full((len(q_emb), top_k), -1, dtype="int64")
+    for row, (q, cand) in enumerate(zip(q_emb, idx)):
+        cand = cand[cand >= 0]
+        exact = np.asarray(vectors[np.sort(cand)], dtype="float32") @ q
+        order = np.argsort(-exact)[:top_k]
+        out_scores[row, : len(order)] = exact[order]
+        out_idx[row, : len(order)] = np.sort(cand)[order]
+    return out_scores, out_idx
+
+
+def _encode(texts):
+    model = get_model()
+    embeddings = model.encode(texts, normalize_embeddings=True)
+    return np.asarray(embeddings, dtype="float32")
+
 
+def _full_build(current: dict):
+    keys = list(current)
+    texts = [current[k][1] for k in keys]
+    embeddings = _encode(texts)
 
-def build_index():
+    tmp = EMBEDDINGS_PATH + ".tmp.npy"
+    np.save(tmp, embeddings)
+    os.replace(tmp, EMBEDDINGS_PATH)
+
+    ids = np.arange(len(keys), dtype="int64")
+    kind = choose_index_type(len(keys))
+    index = make_index(embeddings, ids, kind)
+
+    store = {
+        "model": EMBED_MODEL,
+        "index_type": kind,
+        "dim": int(embeddings.shape[1]),
+        "rows": len(keys),
+        "entries": {k: {"id": i, "hash": current[k][0]} for i, k in enumerate(keys)},
+        "free": [],
+    }
+    return index, texts, store
+
+
+def _incremental_build(current: dict, store: dict):
+    index = faiss.read_index(INDEX_PATH)
+    with open(TEXTS_PATH, "r", encoding="utf-8") as f:
+        texts = json.load(f)
+
+    entries = store["entries"]
+    free = list(store["free"])
+
+    dropped = [k for k in entries if k not in current]
+    changed = [k for k in entries if k in current and entries[k]["hash"] != current[k][0]]
+    added = [k for k in current if k not in entries]
+
+    if not (dropped or changed or added):
+        return None
+
+    # HNSW cannot delete vectors, and a corpus that crossed a size threshold
+    # needs a different index type: rebuild those from the stored embeddings
+    kind = choose_index_type(len(current))
+    rebuild = kind == "hnsw" or kind != store.get("index_type", "flat")
+
+    # deletions: free the id, blank the text; the vector row is simply reused later
+    stale_ids = [entries[k]["id"] for k in dropped + changed]
+    if stale_ids and not rebuild:
+        index.remove_ids(np.asarray(stale_ids, dtype="int64"))
+    for k in dropped:
+        i = entries.pop(k)["id"]
+        texts[i] = None
+        free.append(i)
+
+    # updates keep their id; additions take a free id or a new row
+    rows = store["rows"]
+    for k in added:
+        if free:
+            i = free.pop()
+        else:
+            i = rows
+            rows += 1
+        entries[k] = {"id": i, "hash": None}
+
+    todo = changed + added
+    if todo:
+        ids = np.asarray([entries[k]["id"] for k in todo], dtype="int64")
+        vecs = _encode([current[k][1] for k in todo])
+
+        if rows > store["rows"]:
+            # grow the .npy: copy existing rows into a larger memmap
+            old = load_embeddings("r")
+            tmp = EMBEDDINGS_PATH + ".tmp.npy"
+            grown = np.lib.format.open_memmap(
+                tmp, mode="w+", dtype="float32", shape=(rows, store["dim"])
+            )
+            grown[: old.shape[0]] = old
+            grown[ids] = vecs
+            grown.flush()
+            del grown, old
+            os.replace(tmp, EMBEDDINGS_PATH)
+        else:
+            emb = load_embeddings("r+")
+            emb[ids] = vecs
+            emb.flush()
+            del emb
+
+        texts.extend([None] * (rows - len(texts)))
+        for k in todo:
+            i = entries[k]["id"]
+            entries[k]["hash"] = current[k][0]
+            texts[i] = current[k][1]
+
+        if not rebuild:
+            index.add_with_ids(vecs, ids)
+
+    if rebuild:
+        live = np.asarray(sorted(e["id"] for e in entries.values()), dtype="int64")
+        index = make_index(load_embeddings("r")[live], live, kind)
+        print(f"- Rebuilt {kind} index from stored embeddings (no re-embedding).")
+
+    store["index_type"] = kind
+    store["rows"] = rows
+    store["free"] = sorted(free)
+    print(
+        f"- Re-embedded {len(todo)} table(s) "
+        f"({len(added)} new, {len(changed)} changed), removed {len(dropped)}."
+    )
+    return index, texts, store
+
+
+def build_index(full: bool = False):
+    """
+    Build or update the schema vector store.
+
+    Only tables whose db_schema.json entry changed (by content hash) are
+    re-embedded; removed tables are deleted from the ID-mapped FAISS index.
+    Pass full=True to re-embed everything.
+
+    The index type follows RAG_INDEX_TYPE (see choose_index_type); IVF
+    variants are trained here on (a sample of) the stored embeddings.
+    """
+    global _index_cache
     with open(SCHEMA_JSON, "r", encoding="utf-8") as f:
         schema = json.load(f)
 
-    texts = [entry["text"] for entry in schema]
+    # key -> (content hash, text)
+    current = {_entry_key(e): (_entry_hash(e), e["text"]) for e in schema}
 
     os.makedirs(DATA_DIR, exist_ok=True)
-    model = get_model()
-    embeddings = model.encode(texts, normalize_embeddings=True)
-    embeddings = np.asarray(embeddings, dtype="float32")
 
-    dim = embeddings.shape[1]
-    index = faiss.IndexFlatIP(dim)
-    index.add(embeddings)
+    store = None if full else _load_store()
+    if store is None:
+        result = _full_build(current)
+    else:
+        result = _incremental_build(current, store)
+        if result is None:
+            print("FAISS index is up to date.")
+            return
+
+    index, texts, store = result
 
-    faiss.write_index(index, INDEX_PATH)
-    with open(TEXTS_PATH, "w", encoding="utf-8") as f:
-        json.dump(texts, f)
+    _write_index(index)
+    _write_json(TEXTS_PATH, texts)
+    _write_json(STORE_PATH, store)
+
+    with _index_lock:
+        _index_cache = (_files_signature(), index, texts)
 
     print("FAISS index built successfully.")
 
 
+def _files_signature():
+    """
+    Cheap change detector for the on-disk index: (mtime_ns, size, inode) of
+    both files. A rebuild rewrites them, which changes at least one of these.
+    """
+    sig = []
+    for path in (INDEX_PATH, TEXTS_PATH):
+        st = os.stat(path)
+        sig.append((st.st_mtime_ns, st.st_size, st.st_ino))
+    return tuple(sig)
+
+
 def load_index():
+    """Read the index and texts from disk (uncached)."""
     index = faiss.read_index(INDEX_PATH)
     with open(TEXTS_PATH, "r", encoding="utf-8") as f:
         texts = json.load(f)
     return index, texts
 
 
-def retrieve_schema_snippets(question: str, top_k: int = 15):
-    index, texts = load_index()
-    model = get_model()
-    q_emb = model.encode([question], normalize_embeddings=True)
-    q_emb = np.asarray(q_emb, dtype="float32")
-    scores, idx = index.search(q_emb, top_k)
-    return [texts[i] for i in idx[0] if i >= 0]
+def get_index():
+    """
+    Return the resident (index, texts), loading them on first use and
+    reloading only when the files on disk have changed.
+    """
+    global _index_cache
+    sig = _files_signature()
+    cached = _index_cache
+    if cached is not None and cached[0] == sig:
+        return cached[1], cached[2]
+
+    with _index_lock:
+        cached = _index_cache
+        if cached is None or cached[0] != sig:
+            # keep the pre-read signature: if a rebuild lands while we read,
+            # the next call sees a newer signature and reloads again
+            index, texts = load_index()
+            cached = (sig, index, texts)
+            _index_cache = cached
+        return cached[1], cached[2]
+
+
+def embed_question(question: str) -> np.ndarray:
+    q_emb = get_model().encode([question], normalize_embeddings=True)
+    return np.asarray(q_emb, dtype="float32")
+
+
+def retrieve_schema_hits(
+    question: str, top_k: int = 15, nprobe: int = None, ef_search: int = None
+):
+    """
+    Like retrieve_schema_snippets, but returns (query embedding,
+    [(score, text), ...] best first) for callers that rank or trim snippets.
+    """
+    index, texts = get_index()
+    q_emb = embed_question(question)
+    vectors = load_embeddings("r") if _is_pq(index) else None
+    scores, idx = search(
+        index, q_emb, top_k, nprobe=nprobe, ef_search=ef_search, vectors=vectors
+    )
+    hits = [
+        (float(score), texts[i])
+        for score, i in zip(scores[0], idx[0])
+        if i >= 0 and texts[i] is not None
+    ]
+    return q_emb, hits
+
+
+def retrieve_schema_snippets(
+    question: str, top_k: int = 15, nprobe: int = None, ef_search: int = None
+):
+    """
+    nprobe (IVF) and ef_search (HNSW) trade latency for recall on ANN
+    indexes; they default to RAG_NPROBE / RAG_EF_SEARCH and are ignored
+    by the flat index.
+    """
+    _, hits = retrieve_schema_hits(question, top_k, nprobe, ef_search)
+    return [text for _, text in hits]
@@ -0,0 +1,365 @@
+# result_cache.py
+"""
+Query result cache in front of db.run_sql_arrow / db.run_sql.
+
+Entries are keyed by the normalized SQL text (comments, whitespace and
+keyword case don't matter) plus the row / byte caps, and hold the Arrow
+table:
+
+- memory tier: LRU, bounded by RESULT_CACHE_MEMORY_MB of Arrow buffers;
+- disk tier: one Arrow IPC file per entry in data/result_cache/ (zstd
+  compressed), bounded by RESULT_CACHE_DISK_MB, least recently used first.
+
+An entry is served only while it is younger than RESULT_CACHE_TTL and every
+table the SQL reads still has the version it had when the entry was
+stored. A table's version is its sys.tables.modify_date (schema changes)
+plus the last write seen in sys.dm_db_index_usage_stats (data changes;
+needs VIEW SERVER STATE, otherwise only the TTL catches data changes).
+Versions are read in one query for all tables and re-read at most every
+RESULT_CACHE_CHECK_INTERVAL seconds, so a hit costs no database round-trip.
+Queries over tables outside the schema catalog, or table-valued functions,
+are not cached.
+
+    table, truncated = cached_sql_arrow(sql)
+
+Concurrent misses for the same key (a shared dashboard opened by many users
+at once) wait for a single execution instead of each running the query.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Set, Tuple
+
+import pyarrow as pa
+import pyarrow.ipc as ipc
+
+from db import pooled_connection, run_sql_arrow
+from schema_scanner import TABLE_DATES_SQL
+from sql_validator import (
+    SQLValidationError,
+    _collect_sources,
+    _read_name,
+    get_catalog,
+    normalize_sql,
+    tokenize,
+)
+from utils.single_flight import SingleFlight
+
+DATA_DIR = "data"
+CACHE_DIR = os.path.join(DATA_DIR, "result_cache")
+
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", "600"))
+RESULT_CACHE_MEMORY_MB = float(os.getenv("RESULT_CACHE_MEMORY_MB", "256"))
+RESULT_CACHE_DISK_MB = float(os.getenv("RESULT_CACHE_DISK_MB", "2048"))
+RESULT_CACHE_CHECK_INTERVAL = float(os.getenv("RESULT_CACHE_CHECK_INTERVAL", "10"))
+
+TABLE_VERSIONS_SQL = """
+    SELECT s.name, t.name, t.modify_date, MAX(u.last_user_update)
+    FROM sys.tables t
+    JOIN sys.schemas s ON s.schema_id = t.schema_id
+    LEFT JOIN sys.dm_db_index_usage_stats u
+      ON u.database_id = DB_ID() AND u.object_id = t.object_id
+    WHERE t.is_ms_shipped = 0
+    GROUP BY s.name, t.name, t.modify_date
+"""
+
+
+def table_versions() -> Dict[str, str]:
+    """Version string per user table, keyed by lowercase schema.table."""
+    with pooled_connection() as conn:
+        cur = conn.cursor()
+        try:
+            try:
+                cur.execute(TABLE_VERSIONS_SQL)
+            except Exception:
+                # no VIEW SERVER STATE: schema changes only
+                cur.execute(TABLE_DATES_SQL)
+            rows = cur.fetchall()
+        finally:
+            cur.close()
+    return {
+        f"{row[0]}.{row[1]}".lower(): "|".join(str(v) for v in row[2:])
+        for row in rows
+    }
+
+
+def referenced_tables(sql: str) -> Optional[Set[str]]:
+    """Catalog keys of the tables the query reads, or None if unknown."""
+    try:
+        tokens = tokenize(sql)
+        problems = []
+        _, tables, _, refs = _collect_sources(tokens, get_catalog(), problems)
+    except (SQLValidationError, OSError):
+        return None
+    if problems:
+        return None
+    for i in refs:
+        _, after = _read_name(tokens, i)
+        if after < len(tokens) and tokens[after].value == "(":
+            return None  # table-valued function: reads who knows what
+    return tables
+
+
+class ResultCache:
+    def __init__(
+        self,
+        directory: str = CACHE_DIR,
+        ttl: float = RESULT_CACHE_TTL,
+        memory_bytes: float = RESULT_CACHE_MEMORY_MB * 1024 * 1024,
+        disk_bytes: float = RESULT_CACHE_DISK_MB * 1024 * 1024,
+        check_interval: float = RESULT_CACHE_CHECK_INTERVAL,
+        versions: Callable[[], Dict[str, str]] = table_versions,
+    ):
+        self.directory = directory
+        self.ttl = ttl
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.check_interval = check_interval
+        self._versions_fn = versions
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, dict]" = OrderedDict()
+        self._memory_used = 0
+        self._versions: Dict[str, str] = {}
+        self._versions_at = 0.0
+        self._versions_lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+        # key -> file size, least recently used first
+        self._disk: "OrderedDict[str, int]" = OrderedDict()
+        files = [
+            os.path.join(directory, name)
+            for name in os.listdir(directory)
+            if name.endswith(".arrow")
+        ]
+        for path in sorted(files, key=os.path.getmtime):
+            key = os.path.basename(path)[: -len(".arrow")]
+            self._disk[key] = os.path.getsize(path)
+        self._disk_used = sum(self._disk.values())
+
+    @staticmethod
+    def make_key(sql: str, max_rows=None, max_bytes=None) -> str:
+        payload = f"{max_rows}\n{max_bytes}\n{normalize_sql(sql)}"
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + ".arrow")
+
+    def current_versions(self) -> Dict[str, str]:
+        """Table versions, re-read at most every check_interval seconds."""
+        if time.monotonic() - self._versions_at < self.check_interval:
+            return self._versions
+        with self._versions_lock:
+            if time.monotonic() - self._versions_at >= self.check_interval:
+                self._versions = self._versions_fn()
+                self._versions_at = time.monotonic()
+        return self._versions
+
+    def _valid(self, entry: dict) -> bool:
+        if time.time() - entry["created_at"] > self.ttl:
+            return False
+        current = self.current_versions()
+        return all(current.get(t) == v for t, v in entry["tables"].items())
+
+    # --- memory tier -------------------------------------------------------
+
+    def _remember(self, key: str, entry: dict):
+        with self._lock:
+            old = self._memory.pop(key, None)
+            if old is not None:
+                self._memory_used -= old["nbytes"]
+            if entry["nbytes"] > self.memory_bytes:
+                return
+            self._memory[key] = entry
+            self._memory_used += entry["nbytes"]
+            while self._memory_used > self.memory_bytes:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_used -= evicted["nbytes"]
+
+    def _forget(self, key: str):
+        with self._lock:
+            entry = self._memory.pop(key, None)
+            if entry is not None:
+                self._memory_used -= entry["nbytes"]
+            size = self._disk.pop(key, None)
+            if size is not None:
+                self._disk_used -= size
+        if size is not None:
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    # --- disk tier ---------------------------------------------------------
+
+    def _read_disk(self, key: str) -> Optional[dict]:
+        with self._lock:
+            if key not in self._disk:
+                return None
+            self._disk.move_to_end(key)
+        path = self._path(key)
+        try:
+            with pa.memory_map(path, "r") as source:
+                table = ipc.open_file(source).read_all()
+            os.utime(path)
+        except (OSError, pa.ArrowInvalid):
+            self._forget(key)
+            return None
+        meta = json.loads(table.schema.metadata[b"result_cache"])
+        table = table.replace_schema_metadata(None)
+        return {
+            "table": table,
+            "truncated": meta["truncated"],
+            "tables": meta["tables"],
+            "created_at": meta["created_at"],
+            "nbytes": table.nbytes,
+        }
+
+    def _write_disk(self, key: str, entry: dict):
+        table = entry["table"]
+        meta = {k: entry[k] for k in ("truncated", "tables", "created_at")}
+        table = table.replace_schema_metadata({"result_cache": json.dumps(meta)})
+        path = self._path(key)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        options = ipc.IpcWriteOptions(compression="zstd")
+        with pa.OSFile(tmp, "wb") as sink:
+            with ipc.new_file(sink, table.schema, options=options) as writer:
+                writer.write_table(table)
+        os.replace(tmp, path)
+
+        size = os.path.getsize(path)
+        evict = []
+        with self._lock:
+            self._disk_used += size - self._disk.pop(key, 0)
+            self._disk[key] = size
+            while self._disk_used > self.disk_bytes and len(self._disk) > 1:
+                old_key, old_size = self._disk.popitem(last=False)
+                self._disk_used -= old_size
+                evict.append(old_key)
+        for old_key in evict:
+            try:
+                os.remove(self._path(old_key))
+            except OSError:
+                pass
+
+    # --- public ------------------------------------------------------------
+
+    def get(self, sql: str, max_rows=None, max_bytes=None) -> Optional[Tuple[pa.Table, bool]]:
+        key = self.make_key(sql, max_rows, max_bytes)
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+        tier = "memory"
+        if entry is None:
+            entry = self._read_disk(key)
+            tier = "disk"
+        if entry is None or not self._valid(entry):
+            if entry is not None:
+                self._forget(key)
+            self.misses += 1
+            return None
+
+        if tier == "memory":
+            self.memory_hits += 1
+        else:
+            self.disk_hits += 1
+            self._remember(key, entry)
+        return entry["table"], entry["truncated"]
+
+    def put(self, sql: str, table: pa.Table, truncated: bool, max_rows=None, max_bytes=None):
+        tables = referenced_tables(sql)
+        if not tables:
+            return  # nothing to invalidate on (or SELECT GETDATE() style)
+        current = self.current_versions()
+        if any(t not in current for t in tables):
+            return  # no version to check against
+        entry = {
+            "table": table,
+            "truncated": truncated,
+            "tables": {t: current[t] for t in sorted(tables)},
+            "created_at": time.time(),
+            "nbytes": table.nbytes,
+        }
+        key = self.make_key(sql, max_rows, max_bytes)
+        self._remember(key, entry)
+        if table.nbytes <= self.disk_bytes:
+            self._write_disk(key, entry)
+
+    def invalidate(self, tables=None):
+        """Drop entries reading any of `tables` ("schema.table"), or everything."""
+        if tables is not None:
+            tables = {t.lower() for t in tables}
+        with self._lock:
+            keys = set(self._memory) | set(self._disk)
+            self._versions_at = 0.0  # re-read versions on the next lookup
+        for key in keys:
+            if tables is not None:
+                entry = self._memory.get(key) or self._read_disk(key)
+                if entry is None or not tables & set(entry["tables"]):
+                    continue
+            self._forget(key)
+
+    def stats(self) -> dict:
+        total = self.memory_hits + self.disk_hits + self.misses
+        with self._lock:
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.memory_hits + self.disk_hits) / total if total else 0.0,
+                "memory_entries": len(self._memory),
+                "memory_mb": self._memory_used / 1024 / 1024,
+                "disk_entries": len(self._disk),
+                "disk_mb": self._disk_used / 1024 / 1024,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+# concurrent misses for the same normalized SQL share one execution
+_query_flights = SingleFlight()
+
+
+def get_result_cache() -> ResultCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResultCache()
+    return _cache
+
+
+def cached_sql_arrow(query: str, max_rows: Optional[int] = None, max_bytes: Optional[int] = None):
+    """db.run_sql_arrow through the result cache. Returns (table, truncated)."""
+    cache = get_result_cache()
+    hit = cache.get(query, max_rows, max_bytes)
+    if hit is not None:
+        return hit
+    key = cache.make_key(query, max_rows, max_bytes)
+    return _query_flights.do(key, _run_and_store, cache, query, max_rows, max_bytes)
+
+
+def _run_and_store(cache: ResultCache, query: str, max_rows, max_bytes):
+    table, truncated = run_sql_arrow(query, max_rows, max_bytes)
+    cache.put(query, table, truncated, max_rows, max_bytes)
+    return table, truncated
+
+
+def cached_run_sql(query: str):
+    """
+    db.run_sql through the result cache. Returns (columns, rows); values are
+    as the Arrow path converts them (decimals as floats, GUIDs as text).
+    """
+    table, _ = cached_sql_arrow(query, max_rows=float("inf"), max_bytes=float("inf"))
+    rows = list(zip(*(col.to_pylist() for col in table.columns)))
+    return table.column_names, rows
@@ -1,13 +1,46 @@
 # schema_scanner.py
+import argparse
+import hashlib
 import json
 import os
-from db import get_connection
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+from db import get_pool, pooled_connection
 from decimal import Decimal
 from datetime import datetime, date, time
 
 DATA_DIR = "data"
 SCHEMA_JSON = os.path.join(DATA_DIR, "db_schema.json")
 TABLE_LIST_TXT = os.path.join(DATA_DIR, "table_list.txt")
+MANIFEST_JSON = os.path.join(DATA_DIR, "schema_manifest.json")
+SCHEMA_CHANGES_JSON = os.path.join(DATA_DIR, "schema_changes.json")
+
+TABLES_SQL = """
+    SELECT TABLE_SCHEMA, TABLE_NAME
+    FROM INFORMATION_SCHEMA.TABLES
+    WHERE TABLE_TYPE = 'BASE TABLE'
+    ORDER BY TABLE_SCHEMA, TABLE_NAME
+"""
+
+# all column metadata for all base tables in one round-trip
+ALL_COLUMNS_SQL = """
+    SELECT c.TABLE_SCHEMA, c.TABLE_NAME, c.COLUMN_NAME, c.DATA_TYPE, c.IS_NULLABLE
+    FROM INFORMATION_SCHEMA.COLUMNS c
+    JOIN INFORMATION_SCHEMA.TABLES t
+      ON t.TABLE_SCHEMA = c.TABLE_SCHEMA
+     AND t.TABLE_NAME = c.TABLE_NAME
+    WHERE t.TABLE_TYPE = 'BASE TABLE'
+    ORDER BY c.TABLE_SCHEMA, c.TABLE_NAME, c.ORDINAL_POSITION
+"""
+
+# modify_date changes on ALTER TABLE / index / constraint changes
+TABLE_DATES_SQL = """
+    SELECT s.name, t.name, t.modify_date
+    FROM sys.tables t
+    JOIN sys.schemas s ON s.schema_id = t.schema_id
+    WHERE t.is_ms_shipped = 0
+"""
 
 
 def safe_value(v):
@@ -20,91 +53,353 @@ def safe_value(v):
     return str(v)
 
 
-def scan_schema(max_sample_rows: int = 3):
-    os.makedirs(DATA_DIR, exist_ok=True)
+def _fetch_sample_rows(cur, schema, table, col_names, max_sample_rows):
+    cur.execute(f"SELECT TOP ({max_sample_rows}) * FROM [{schema}].[{table}]")
+    rows = cur.fetchall()
+    sample_rows = []
+    for row in rows:
+        safe_row = {}
+        for k, v in zip(col_names, row):
+            safe_row[k] = safe_value(v)
+        sample_rows.append(safe_row)
+    return sample_rows
 
-    conn = get_connection()
-    cur = conn.cursor()
 
-    cur.execute(
-        """
-        SELECT TABLE_SCHEMA, TABLE_NAME
-        FROM INFORMATION_SCHEMA.TABLES
-        WHERE TABLE_TYPE = 'BASE TABLE'
-        ORDER BY TABLE_SCHEMA, TABLE_NAME
-    """
+def _build_entry(schema, table, columns_struct, sample_rows):
+    col_text = ", ".join(
+        f"{c['name']} ({c['type']}){' NULL' if c['nullable'] else ''}"
+        for c in columns_struct
     )
-    tables = cur.fetchall()
 
-    schema_info = []
-    table_list = []
+    text = f"Table [{schema}].[{table}] columns: {col_text}."
+    if table.lower() in ["allowance", "allowances"]:
+        text = "This table stores allowance configuration. " + text
+    if sample_rows:
+        text += f" Example rows: {sample_rows}"
 
-    for schema, table in tables:
-        table_list.append(f"{schema}.{table}")
-
-        cur.execute(
-            """
-            SELECT COLUMN_NAME, DATA_TYPE, IS_NULLABLE
-            FROM INFORMATION_SCHEMA.COLUMNS
-            WHERE TABLE_SCHEMA = ? AND TABLE_NAME = ?
-            ORDER BY ORDINAL_POSITION
-        """,
-            (schema, table),
-        )
-        cols = cur.fetchall()
-
-        columns_struct = [
-            {"name": c[0], "type": c[1], "nullable": (c[2] == "YES")} for c in cols
-        ]
-
-        col_names = [c[0] for c in cols]
-        sample_rows = []
-
-        try:
-            cur.execute(f"SELECT TOP ({max_sample_rows}) * FROM [{schema}].[{table}]")
-            rows = cur.fetchall()
-            for row in rows:
-                safe_row = {}
-                for k, v in zip(col_names, row):
-                    safe_row[k] = safe_value(v)
-                sample_rows.append(safe_row)
-        except:
-            pass
-
-        col_text = ", ".join(
-            f"{c['name']} ({c['type']}){' NULL' if c['nullable'] else ''}"
-            for c in columns_struct
-        )
-
-        text = f"Table [{schema}].[{table}] columns: {col_text}."
-        if table.lower() in ["allowance", "allowances"]:
-            text = "This table stores allowance configuration. " + text
-        if sample_rows:
-            text += f" Example rows: {sample_rows}"
-
-        schema_info.append(
-            {
-                "schema": schema,
-                "table": table,
-                "columns": columns_struct,
-                "sample_rows": sample_rows,
-                "text": text,
-            }
-        )
+    return {
+        "schema": schema,
+        "table": table,
+        "columns": columns_struct,
+        "sample_rows": sample_rows,
+        "text": text,
+    }
 
-    conn.close()
 
-    with open(SCHEMA_JSON, "w", encoding="utf-8") as f:
-        json.dump(schema_info, f, ensure_ascii=False, indent=2)
+def _write_outputs(entries, table_list):
+    """
+    Stream entries into db_schema.json one at a time (entries may be a
+    generator), then write table_list.txt. Files are swapped in atomically.
+    """
+    tmp = SCHEMA_JSON + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write("[")
+        for i, entry in enumerate(entries):
+            f.write(",\n" if i else "\n")
+            f.write(json.dumps(entry, ensure_ascii=False, indent=2))
+        f.write("\n]")
+    os.replace(tmp, SCHEMA_JSON)
 
     with open(TABLE_LIST_TXT, "w", encoding="utf-8") as f:
         for t in table_list:
             f.write(t + "\n")
 
+
+def _build_column_roles():
+    # semantic roles + embeddings per column, used by the chart service
+    try:
+        from services.semantic_engine import build_column_role_index
+    except ImportError as e:
+        print(f"- Skipped column roles: {e}")
+        return
+    build_column_role_index()
+
+
+def _report(n_tables, elapsed):
+    rate = n_tables / elapsed if elapsed > 0 else float("inf")
     print("Schema extracted successfully.")
-    print(f"- Tables: {len(table_list)}")
+    print(f"- Tables: {n_tables}")
+    print(f"- Time: {elapsed:.1f}s ({rate:.1f} tables/s)")
     print(f"- Saved: {SCHEMA_JSON}, {TABLE_LIST_TXT}")
 
 
+def scan_schema(
+    max_sample_rows: int = 3,
+    fast: bool = False,
+    workers: int = 8,
+    table_timeout: int = 10,
+):
+    """
+    Extract table/column metadata plus a few sample rows per table into
+    data/db_schema.json and data/table_list.txt.
+
+    fast=True pulls all column metadata in a single query and fetches sample
+    rows concurrently on `workers` pooled connections, each sample query
+    limited to `table_timeout` seconds.
+    """
+    if fast:
+        return scan_schema_fast(max_sample_rows, workers, table_timeout)
+
+    os.makedirs(DATA_DIR, exist_ok=True)
+    start = perf_counter()
+
+    with pooled_connection() as conn:
+        cur = conn.cursor()
+
+        cur.execute(TABLES_SQL)
+        tables = cur.fetchall()
+
+        schema_info = []
+        table_list = []
+
+        for schema, table in tables:
+            table_list.append(f"{schema}.{table}")
+
+            cur.execute(
+                """
+                SELECT COLUMN_NAME, DATA_TYPE, IS_NULLABLE
+                FROM INFORMATION_SCHEMA.COLUMNS
+                WHERE TABLE_SCHEMA = ? AND TABLE_NAME = ?
+                ORDER BY ORDINAL_POSITION
+            """,
+                (schema, table),
+            )
+            cols = cur.fetchall()
+
+            columns_struct = [
+                {"name": c[0], "type": c[1], "nullable": (c[2] == "YES")} for c in cols
+            ]
+
+            col_names = [c[0] for c in cols]
+            sample_rows = []
+
+            try:
+                sample_rows = _fetch_sample_rows(
+                    cur, schema, table, col_names, max_sample_rows
+                )
+            except:
+                pass
+
+            schema_info.append(_build_entry(schema, table, columns_struct, sample_rows))
+
+    _write_outputs(schema_info, table_list)
+    _report(len(table_list), perf_counter() - start)
+    _build_column_roles()
+
+
+def _sample_table(schema, table, col_names, max_sample_rows, table_timeout):
+    """Fetch sample rows on a pooled connection; [] on error or timeout."""
+    try:
+        with pooled_connection() as conn:
+            conn.timeout = table_timeout
+            try:
+                cur = conn.cursor()
+                rows = _fetch_sample_rows(cur, schema, table, col_names, max_sample_rows)
+                cur.close()
+                return rows
+            finally:
+                conn.timeout = 0  # pooled connection goes back without a timeout
+    except Exception:
+        return []
+
+
+def _worker_count(workers: int) -> int:
+    # more workers than pooled connections would only queue on the pool
+    return max(1, min(workers, get_pool().max_size))
+
+
+def _read_columns(cur) -> dict:
+    """(schema, table) -> [column dicts] from one bulk query."""
+    columns = {}
+    cur.execute(ALL_COLUMNS_SQL)
+    while True:
+        batch = cur.fetchmany(5000)
+        if not batch:
+            break
+        for schema, table, col, dtype, nullable in batch:
+            columns.setdefault((schema, table), []).append(
+                {"name": col, "type": dtype, "nullable": (nullable == "YES")}
+            )
+    return columns
+
+
+def scan_schema_fast(
+    max_sample_rows: int = 3, workers: int = 8, table_timeout: int = 10
+):
+    os.makedirs(DATA_DIR, exist_ok=True)
+    start = perf_counter()
+
+    with pooled_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(TABLES_SQL)
+        tables = [(r[0], r[1]) for r in cur.fetchall()]
+
+        columns = _read_columns(cur)
+        cur.close()
+
+    table_list = [f"{schema}.{table}" for schema, table in tables]
+    workers = _worker_count(workers)
+
+    def entries():
+        # keep a bounded window of sample fetches in flight and emit entries
+        # in table order, so only that window is ever held in memory
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            pending = deque()
+            todo = iter(tables)
+            window = workers * 4
+
+            def submit_next():
+                for schema, table in todo:
+                    cols = columns.pop((schema, table), [])
+                    fut = pool.submit(
+                        _sample_table,
+                        schema,
+                        table,
+                        [c["name"] for c in cols],
+                        max_sample_rows,
+                        table_timeout,
+                    )
+                    pending.append((schema, table, cols, fut))
+                    return True
+                return False
+
+            while len(pending) < window and submit_next():
+                pass
+
+            while pending:
+                schema, table, cols, fut = pending.popleft()
+                sample_rows = fut.result()
+                submit_next()
+                yield _build_entry(schema, table, cols, sample_rows)
+
+    _write_outputs(entries(), table_list)
+    _report(len(table_list), perf_counter() - start)
+    _build_column_roles()
+
+
+def _columns_hash(cols) -> str:
+    payload = json.dumps(cols, sort_keys=True)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def _load_json(path, default):
+    if not os.path.exists(path):
+        return default
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def scan_schema_incremental(
+    max_sample_rows: int = 3, workers: int = 8, table_timeout: int = 10
+) -> dict:
+    """
+    Rescan only tables that were added, altered or dropped since the last run.
+
+    Each table's sys.tables.modify_date and a checksum of its column list are
+    kept in data/schema_manifest.json. db_schema.json and table_list.txt are
+    patched in place, and the affected tables are written to
+    data/schema_changes.json:
+
+        {"added": [...], "changed": [...], "dropped": [...]}
+
+    Follow up with rag_index.build_index() (re-embeds changed entries only)
+    and join_graph.update_join_graph() (patches edges for these tables).
+    The first run, without a manifest, scans every table.
+    """
+    os.makedirs(DATA_DIR, exist_ok=True)
+    start = perf_counter()
+
+    old_manifest = _load_json(MANIFEST_JSON, {})
+    old_entries = {}
+    if old_manifest:
+        for e in _load_json(SCHEMA_JSON, []):
+            old_entries[f"{e['schema']}.{e['table']}"] = e
+
+    with pooled_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(TABLES_SQL)
+        tables = [(r[0], r[1]) for r in cur.fetchall()]
+        columns = _read_columns(cur)
+        cur.execute(TABLE_DATES_SQL)
+        dates = {(r[0], r[1]): r[2] for r in cur.fetchall()}
+        cur.close()
+
+    manifest = {}
+    for schema, table in tables:
+        modified = dates.get((schema, table))
+        manifest[f"{schema}.{table}"] = {
+            "modify_date": safe_value(modified),
+            "columns_hash": _columns_hash(columns.get((schema, table), [])),
+        }
+
+    added = [k for k in manifest if k not in old_manifest]
+    dropped = [k for k in old_manifest if k not in manifest]
+    changed = [
+        k
+        for k in manifest
+        if k in old_manifest
+        and (old_manifest[k] != manifest[k] or k not in old_entries)
+    ]
+
+    rescan = set(added) | set(changed)
+    todo = [(s, t) for s, t in tables if f"{s}.{t}" in rescan]
+
+    with ThreadPoolExecutor(max_workers=_worker_count(workers)) as pool:
+        samples = pool.map(
+            lambda st: _sample_table(
+                st[0],
+                st[1],
+                [c["name"] for c in columns.get(st, [])],
+                max_sample_rows,
+                table_timeout,
+            ),
+            todo,
+        )
+        fresh = {
+            f"{s}.{t}": _build_entry(s, t, columns.get((s, t), []), rows)
+            for (s, t), rows in zip(todo, samples)
+        }
+
+    table_list = [f"{schema}.{table}" for schema, table in tables]
+    entries = (fresh[k] if k in fresh else old_entries[k] for k in table_list)
+    _write_outputs(entries, table_list)
+
+    changes = {"added": added, "changed": changed, "dropped": dropped}
+    with open(MANIFEST_JSON, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    with open(SCHEMA_CHANGES_JSON, "w", encoding="utf-8") as f:
+        json.dump(changes, f, ensure_ascii=False, indent=2)
+
+    _report(len(table_list), perf_counter() - start)
+    _build_column_roles()
+    print(
+        f"- Rescanned: {len(added)} added, {len(changed)} changed, "
+        f"{len(dropped)} dropped (see {SCHEMA_CHANGES_JSON})"
+    )
+    return changes
+
+
 if __name__ == "__main__":
-    scan_schema()
+    parser = argparse.ArgumentParser(description="Extract database schema.")
+    parser.add_argument("--fast", action="store_true", help="bulk + parallel scan")
+    parser.add_argument(
+        "--incremental", action="store_true", help="rescan changed tables only"
+    )
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--table-timeout", type=int, default=10)
+    parser.add_argument("--sample-rows", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.incremental:
+        scan_schema_incremental(
+            max_sample_rows=args.sample_rows,
+            workers=args.workers,
+            table_timeout=args.table_timeout,
+        )
+    else:
+        scan_schema(
+            max_sample_rows=args.sample_rows,
+            fast=args.fast,
+            workers=args.workers,
+            table_timeout=args.table_timeout,
+        )
@@ -0,0 +1,182 @@
+# semantic_cache.py
+"""
+Semantic (embedding-similarity) cache in front of nl_to_sql.
+
+"total sales by region last month" and "sales totals per region for last
+month" are different strings but the same SQL. Questions are embedded with
+the model already used for schema retrieval and kept in a small in-memory
+FAISS index; a new question reuses the SQL of its nearest cached question
+when cosine similarity >= threshold.
+
+- Questions must also agree on their literals (numbers, quoted strings), so
+  "top 5 customers" never reuses the SQL of "top 10 customers".
+- Least recently used entries are evicted above max_entries.
+- Everything is dropped when the schema fingerprint changes.
+"""
+
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+import numpy as np
+import faiss
+
+from rag_index import get_model
+from sql_cache import normalize_question, schema_fingerprint
+
+SEMANTIC_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+SEMANTIC_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "2000"))
+
+_LITERAL_RE = re.compile(r"'[^']*'|\"[^\"]*\"|\d+(?:\.\d+)?")
+
+
+def _literals(question: str) -> Tuple[str, ...]:
+    return tuple(sorted(_LITERAL_RE.findall(question.lower())))
+
+
+class SemanticCache:
+    def __init__(
+        self,
+        threshold: float = SEMANTIC_THRESHOLD,
+        max_entries: int = SEMANTIC_MAX_ENTRIES,
+    ):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._index = None
+        self._entries: "OrderedDict[int, dict]" = OrderedDict()  # LRU order
+        self._next_id = 0
+        self._fingerprint = None
+        # embeddings of recent lookups, reused by put()
+        self._recent: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._recent_lock = threading.Lock()
+
+    def _embed(self, question: str) -> np.ndarray:
+        key = normalize_question(question)
+        with self._recent_lock:
+            emb = self._recent.get(key)
+        if emb is None:
+            emb = get_model().encode([key], normalize_embeddings=True)
+            emb = np.asarray(emb, dtype="float32")
+            with self._recent_lock:
+                self._recent[key] = emb
+                if len(self._recent) > 64:
+                    self._recent.popitem(last=False)
+        return emb
+
+    def _check_schema(self):
+        """Invalidate everything when db_schema.json changed. Caller holds the lock."""
+        fp = schema_fingerprint()
+        if fp != self._fingerprint:
+            self._index = None
+            self._entries.clear()
+            self._fingerprint = fp
+
+    def get(self, question: str) -> Optional[str]:
+        emb = self._embed(question)
+        with self._lock:
+            self._check_schema()
+            if self._index is None or self._index.ntotal == 0:
+                self.misses += 1
+                return None
+
+            scores, ids = self._index.search(emb, 1)
+            score, i = float(scores[0][0]), int(ids[0][0])
+            entry = self._entries.get(i)
+            if (
+                entry is None
+                or score < self.threshold
+                or entry["literals"] != _literals(question)
+            ):
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(i)
+            entry["last_used"] = time.time()
+            self.hits += 1
+            return entry["sql"]
+
+    def put(self, question: str, sql: str):
+        emb = self._embed(question)
+        with self._lock:
+            self._check_schema()
+            if self._index is None:
+                self._index = faiss.IndexIDMap2(faiss.IndexFlatIP(emb.shape[1]))
+
+            # a corrected SQL replaces the one stored for the same question
+            # (same as get() sees it: "Total sales?" == "total sales")
+            key = normalize_question(question)
+            stale = [i for i, e in self._entries.items() if e["key"] == key]
+            if stale:
+                for i in stale:
+                    del self._entries[i]
+                self._index.remove_ids(np.asarray(stale, dtype="int64"))
+
+            i = self._next_id
+            self._next_id += 1
+            self._index.add_with_ids(emb, np.asarray([i], dtype="int64"))
+            self._entries[i] = {
+                "question": question,
+                "key": key,
+                "sql": sql,
+                "literals": _literals(question),
+                "last_used": time.time(),
+            }
+
+            if len(self._entries) > self.max_entries:
+                evict = []
+                while len(self._entries) > self.max_entries:
+                    old_id, _ = self._entries.popitem(last=False)
+                    evict.append(old_id)
+                self._index.remove_ids(np.asarray(evict, dtype="int64"))
+
+    def remove(self, question: str, sql: Optional[str] = None):
+        """
+        Drop the entry for the question, and any entry holding `sql` (a
+        near-duplicate question whose SQL was served and failed to run).
+        """
+        key = normalize_question(question)
+        with self._lock:
+            stale = [
+                i
+                for i, e in self._entries.items()
+                if e["key"] == key or (sql is not None and e["sql"] == sql)
+            ]
+            if stale:
+                for i in stale:
+                    del self._entries[i]
+                self._index.remove_ids(np.asarray(stale, dtype="int64"))
+
+    def invalidate(self):
+        with self._lock:
+            self._index = None
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self._entries),
+            "threshold": self.threshold,
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_semantic_cache() -> SemanticCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = SemanticCache()
+    return _cache
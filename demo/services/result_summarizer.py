@@ -0,0 +1,173 @@
+# services/result_summarizer.py
+"""
+Compact, token-budgeted description of a query result for the report prompt.
+
+Small results are sent whole (as CSV). Larger ones are described by row
+count, column types, per-column statistics, a few pre-aggregations and
+head/tail samples, trimmed to fit the budget, so the prompt size (and the
+report latency) no longer grows with the result.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from utils.column_names import unique_column_names
+
+REPORT_TOKEN_BUDGET = int(os.getenv("REPORT_TOKEN_BUDGET", "3000"))
+
+TOP_K = 5
+MAX_GROUPS = 10
+SAMPLE_ROWS = 5
+MAX_CELL_CHARS = 40
+
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token for English / numbers; good enough for a budget
+    return len(text) // 4 + 1
+
+
+def _fmt(value) -> str:
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return ""
+    if isinstance(value, (float, np.floating)):
+        if float(value).is_integer():
+            return f"{value:.0f}"
+        return f"{value:.4g}" if abs(value) < 1000 else f"{value:.2f}"
+    if isinstance(value, pd.Timestamp) and value == value.normalize():
+        return value.date().isoformat()
+    text = str(value)
+    if len(text) > MAX_CELL_CHARS:
+        text = text[: MAX_CELL_CHARS - 3] + "..."
+    return text
+
+
+def _csv(df: pd.DataFrame) -> str:
+    lines = [",".join(str(c) for c in df.columns)]
+    for row in df.itertuples(index=False, name=None):
+        lines.append(",".join(_fmt(v) for v in row))
+    return "\n".join(lines)
+
+
+def _column_kinds(df: pd.DataFrame):
+    numeric, dates, other = [], [], []
+    for col, dtype in zip(df.columns, df.dtypes):
+        if pd.api.types.is_bool_dtype(dtype):
+            other.append(col)
+        elif pd.api.types.is_numeric_dtype(dtype):
+            numeric.append(col)
+        elif pd.api.types.is_datetime64_any_dtype(dtype):
+            dates.append(col)
+        else:
+            other.append(col)
+    return numeric, dates, other
+
+
+def _numeric_stats(df: pd.DataFrame, numeric) -> list:
+    if not numeric:
+        return []
+    # one vectorized pass over all numeric columns
+    stats = df[numeric].agg(["min", "max", "mean", "sum"]).T
+    nulls = df[numeric].isna().sum()
+    lines = ["NUMERIC COLUMNS (min / max / mean / sum / nulls):"]
+    for col, row in stats.iterrows():
+        lines.append(
+            f"- {col}: {_fmt(row['min'])} / {_fmt(row['max'])} / "
+            f"{_fmt(row['mean'])} / {_fmt(row['sum'])} / {int(nulls[col])}"
+        )
+    return lines
+
+
+def _date_stats(df: pd.DataFrame, dates) -> list:
+    if not dates:
+        return []
+    lines = ["DATE COLUMNS (from / to):"]
+    for col in dates:
+        lines.append(f"- {col}: {_fmt(df[col].min())} / {_fmt(df[col].max())}")
+    return lines
+
+
+def _top_values(df: pd.DataFrame, other) -> list:
+    if not other:
+        return []
+    lines = [f"TEXT COLUMNS (distinct values, top {TOP_K} by count):"]
+    for col in other:
+        counts = df[col].value_counts()
+        top = ", ".join(f"{_fmt(v)} ({n})" for v, n in counts.head(TOP_K).items())
+        lines.append(f"- {col}: {len(counts)} distinct; {top}")
+    return lines
+
+
+def _group_totals(df: pd.DataFrame, numeric, other) -> list:
+    """Sums of numeric columns per value of the few low-cardinality text columns."""
+    if not numeric or not other:
+        return []
+    lines = []
+    for col in other:
+        n = df[col].nunique()
+        if not 1 < n <= 50:
+            continue
+        sums = df.groupby(col, dropna=False, sort=False)[numeric].sum()
+        sums = sums.sort_values(numeric[0], ascending=False).head(MAX_GROUPS)
+        lines.append(f"TOTALS BY {col} (top {len(sums)} of {n}):")
+        lines.append(_csv(sums.reset_index()))
+        if len(lines) >= 6:  # at most three groupings
+            break
+    return lines
+
+
+def summarize_result(
+    df: pd.DataFrame, token_budget: int = REPORT_TOKEN_BUDGET
+) -> str:
+    """
+    Text representation of `df` for an LLM prompt, within ~token_budget tokens.
+    """
+    if df.empty:
+        return f"(no rows; columns: {', '.join(map(str, df.columns))})"
+
+    if not df.columns.is_unique:
+        # df[col] must be a Series below: suffix repeats (Id, Id_1, ...)
+        df = df.set_axis(unique_column_names(map(str, df.columns)), axis=1)
+
+    full = _csv(df) if len(df) <= 500 else None
+    if full is not None and estimate_tokens(full) <= token_budget:
+        return f"{len(df)} rows:\n{full}"
+
+    numeric, dates, other = _column_kinds(df)
+    header = [
+        f"ROWS: {len(df):,}",
+        "COLUMNS: " + ", ".join(f"{c} ({t})" for c, t in zip(df.columns, df.dtypes)),
+    ]
+    sections = [
+        _numeric_stats(df, numeric),
+        _date_stats(df, dates),
+        _group_totals(df, numeric, other),
+        _top_values(df, other),
+    ]
+
+    # sections in priority order while they fit, then as many sample rows as fit
+    parts = ["\n".join(header)]
+    used = estimate_tokens(parts[0])
+    for lines in sections:
+        if not lines:
+            continue
+        text = "\n".join(lines)
+        cost = estimate_tokens(text)
+        if used + cost > token_budget:
+            continue
+        parts.append(text)
+        used += cost
+
+    for n in range(SAMPLE_ROWS, 0, -1):
+        if len(df) > 2 * n:
+            sample = f"FIRST {n} AND LAST {n} ROWS:\n" + _csv(
+                pd.concat([df.head(n), df.tail(n)])
+            )
+        else:
+            sample = "ROWS:\n" + _csv(df)
+        if used + estimate_tokens(sample) <= token_budget:
+            parts.append(sample)
+            break
+
+    return "\n\n".join(parts)
@@ -1,9 +1,33 @@
 # services/semantic_engine.py
+import hashlib
+import json
+import os
+import threading
+from collections import Counter, OrderedDict
+
+import numpy as np
 import pandas as pd
-from sentence_transformers import SentenceTransformer, util
 
-# small + fast embedding model
-_MODEL = SentenceTransformer("all-MiniLM-L6-v2")
+from model_registry import EMBED_MODEL, get_embedding_model
+
+DATA_DIR = "data"
+CONCEPT_CACHE = os.path.join(DATA_DIR, "concept_embeddings.npz")
+SCHEMA_JSON = os.path.join(DATA_DIR, "db_schema.json")
+COLUMN_ROLES_JSON = os.path.join(DATA_DIR, "column_roles.json")
+COLUMN_EMB_NPY = os.path.join(DATA_DIR, "column_embeddings.npy")
+
+NUMERIC_SQL_TYPES = {
+    "tinyint",
+    "smallint",
+    "int",
+    "bigint",
+    "decimal",
+    "numeric",
+    "float",
+    "real",
+    "money",
+    "smallmoney",
+}
 
 # canonical semantic concepts
 DIMENSION_CONCEPTS = [
@@ -33,36 +57,304 @@ METRIC_CONCEPTS = [
 
 DATE_CONCEPTS = ["date", "time", "month", "year"]
 
+_concepts = None
+_concepts_lock = threading.Lock()
+_stacked = None
+
+# column name -> embedding, shared across requests
+NAME_CACHE_SIZE = 10_000
+_name_cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+_name_cache_lock = threading.Lock()
+
+# (file signature, {lowercase column name: role}) from the column-role index
+_roles = None
+
 
 def _embed(texts):
-    return _MODEL.encode(texts, normalize_embeddings=True)
+    # small + fast embedding model, shared with rag_index
+    model = get_embedding_model(EMBED_MODEL)
+    return model.encode(texts, normalize_embeddings=True)
+
+
+def _concepts_key() -> str:
+    payload = json.dumps(
+        [EMBED_MODEL, DIMENSION_CONCEPTS, METRIC_CONCEPTS, DATE_CONCEPTS]
+    )
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def _concept_embeddings():
+    """
+    (dimension, metric, date) concept embeddings, computed once and cached in
+    data/concept_embeddings.npz. The cache is keyed by model + concept lists,
+    so editing a list above recomputes it.
+    """
+    global _concepts
+    if _concepts is not None:
+        return _concepts
+
+    with _concepts_lock:
+        if _concepts is None:
+            key = _concepts_key()
+            loaded = None
+            if os.path.exists(CONCEPT_CACHE):
+                with np.load(CONCEPT_CACHE) as cached:
+                    if str(cached["key"]) == key:
+                        loaded = (cached["dims"], cached["metrics"], cached["dates"])
+
+            if loaded is None:
+                loaded = (
+                    np.asarray(_embed(DIMENSION_CONCEPTS), dtype="float32"),
+                    np.asarray(_embed(METRIC_CONCEPTS), dtype="float32"),
+                    np.asarray(_embed(DATE_CONCEPTS), dtype="float32"),
+                )
+                os.makedirs(DATA_DIR, exist_ok=True)
+                np.savez(
+                    CONCEPT_CACHE,
+                    key=np.asarray(key),
+                    dims=loaded[0],
+                    metrics=loaded[1],
+                    dates=loaded[2],
+                )
+            _concepts = loaded
+    return _concepts
 
 
-_DIM_EMB = _embed(DIMENSION_CONCEPTS)
-_MET_EMB = _embed(METRIC_CONCEPTS)
-_DATE_EMB = _embed(DATE_CONCEPTS)
+def _stacked_concepts():
+    """
+    All concepts in one (n_concepts, dim) matrix plus the row offset of each
+    group (dimension, metric, date), for np.maximum.reduceat.
+    """
+    global _stacked
+    if _stacked is None:
+        groups = _concept_embeddings()
+        offsets = np.cumsum([0] + [len(g) for g in groups[:-1]])
+        _stacked = (np.vstack(groups), offsets)
+    return _stacked
+
+
+def _column_embeddings(names):
+    """
+    Embeddings for column names, memoized across requests in an LRU keyed by
+    name; only names never seen before are sent to the model (in one batch).
+    """
+    with _name_cache_lock:
+        missing = [n for n in dict.fromkeys(names) if n not in _name_cache]
+
+    if missing:
+        fresh = np.asarray(_embed(missing), dtype="float32")
+        with _name_cache_lock:
+            for name, emb in zip(missing, fresh):
+                _name_cache[name] = emb
+
+    with _name_cache_lock:
+        out = []
+        for n in names:
+            emb = _name_cache.get(n)
+            if emb is None:  # evicted by a concurrent request in between
+                emb = np.asarray(_embed([n]), dtype="float32")[0]
+                _name_cache[n] = emb
+            _name_cache.move_to_end(n)
+            out.append(emb)
+        while len(_name_cache) > NAME_CACHE_SIZE:
+            _name_cache.popitem(last=False)
+    return np.vstack(out)
+
+
+def _few_distinct(df: pd.DataFrame, limit: int, head: int = 256) -> np.ndarray:
+    """
+    nunique() <= limit for every column, without a full nunique per column:
+    - most columns show more than `limit` values within their first rows,
+      which settles them on a small slice;
+    - the remaining numeric columns are counted together with one 2-D sort;
+    - only leftover non-numeric columns get an exact nunique().
+    """
+    result = df.iloc[:head].nunique().to_numpy() <= limit
+    undecided = np.flatnonzero(result)
+    if len(df) <= head or not len(undecided):
+        return result
+
+    sub = df.iloc[:, undecided]
+    numeric = np.array([pd.api.types.is_numeric_dtype(t) for t in sub.dtypes])
+
+    if numeric.any():
+        values = sub.iloc[:, np.flatnonzero(numeric)].to_numpy(
+            dtype="float64", na_value=np.nan
+        )
+        values = np.sort(values, axis=0)  # NaNs sort last
+        valid = ~np.isnan(values)
+        distinct = valid[0].astype(int) + (
+            (values[1:] != values[:-1]) & valid[1:]
+        ).sum(axis=0)
+        result[undecided[numeric]] = distinct <= limit
+
+    if (~numeric).any():
+        others = sub.iloc[:, np.flatnonzero(~numeric)]
+        result[undecided[~numeric]] = others.nunique().to_numpy() <= limit
+
+    return result
+
+
+def _concept_similarities(embs: np.ndarray):
+    """Best (dimension, metric, date) similarity per row of `embs`."""
+    concepts, offsets = _stacked_concepts()
+    # one matmul for every column x concept, then the best match per group;
+    # embeddings are normalized, so dot products are cosine similarities
+    sims = embs @ concepts.T
+    return np.maximum.reduceat(sims, offsets, axis=1).T
+
+
+# -----------------------------------------------------
+# Column-role index built from the schema scan
+# -----------------------------------------------------
+def build_column_role_index(schema=None) -> int:
+    """
+    Precompute a semantic role (dimension / metric / date / flag) and an
+    embedding for every column name in db_schema.json, so charts over
+    physical columns need no embedding at request time.
+
+    Names are matched case-insensitively. A name used with several SQL types
+    takes its most common type. Embeddings of names already in the previous
+    index are reused, so only new column names are embedded.
+    Returns the number of indexed names.
+    """
+    if schema is None:
+        with open(SCHEMA_JSON, "r", encoding="utf-8") as f:
+            schema = json.load(f)
+
+    types = {}
+    for entry in schema:
+        for c in entry["columns"]:
+            types.setdefault(c["name"].lower(), Counter())[c["type"].lower()] += 1
+
+    names = sorted(types)
+    key = _concepts_key()
+
+    previous = {}
+    if os.path.exists(COLUMN_ROLES_JSON) and os.path.exists(COLUMN_EMB_NPY):
+        with open(COLUMN_ROLES_JSON, "r", encoding="utf-8") as f:
+            old = json.load(f)
+        if old.get("concepts_key") == key:
+            old_embs = np.load(COLUMN_EMB_NPY)
+            previous = {n: old_embs[i] for i, n in enumerate(old["names"])}
+
+    missing = [n for n in names if n not in previous]
+    if missing:
+        fresh = np.asarray(_embed(missing), dtype="float32")
+        previous.update(zip(missing, fresh))
+
+    if not names:
+        embs = np.zeros((0, _stacked_concepts()[0].shape[1]), dtype="float32")
+        roles = {}
+    else:
+        embs = np.vstack([previous[n] for n in names]).astype("float32")
+        sim_dim, sim_met, sim_date = _concept_similarities(embs)
+        roles = {}
+        for i, name in enumerate(names):
+            sql_type = types[name].most_common(1)[0][0]
+            if sim_date[i] > 0.6:
+                roles[name] = "date"
+            elif sim_met[i] > sim_dim[i] and sql_type in NUMERIC_SQL_TYPES:
+                roles[name] = "metric"
+            elif sql_type == "bit":
+                roles[name] = "flag"
+            else:
+                roles[name] = "dimension"
+
+    os.makedirs(DATA_DIR, exist_ok=True)
+    np.save(COLUMN_EMB_NPY, embs)
+    with open(COLUMN_ROLES_JSON, "w", encoding="utf-8") as f:
+        json.dump(
+            {"concepts_key": key, "names": names, "roles": roles},
+            f,
+            ensure_ascii=False,
+        )
+
+    print(f"Column roles saved to {COLUMN_ROLES_JSON} ({len(missing)} new of {len(names)}).")
+    return len(names)
+
+
+def known_column_roles() -> dict:
+    """lowercase column name -> role, reloaded when the file changes."""
+    global _roles
+    if not os.path.exists(COLUMN_ROLES_JSON):
+        return {}
+    st = os.stat(COLUMN_ROLES_JSON)
+    sig = (st.st_mtime_ns, st.st_size)
+    cached = _roles
+    if cached is not None and cached[0] == sig:
+        return cached[1]
+
+    with open(COLUMN_ROLES_JSON, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    roles = data["roles"] if data.get("concepts_key") == _concepts_key() else {}
+    _roles = (sig, roles)
+    return roles
+
+
+def load_column_embeddings():
+    """(lowercase names, memory-mapped embeddings) from the role index."""
+    if not (os.path.exists(COLUMN_ROLES_JSON) and os.path.exists(COLUMN_EMB_NPY)):
+        return [], None
+    with open(COLUMN_ROLES_JSON, "r", encoding="utf-8") as f:
+        names = json.load(f)["names"]
+    return names, np.load(COLUMN_EMB_NPY, mmap_mode="r")
 
 
 def classify_columns(df: pd.DataFrame):
     """
     Returns semantic roles for columns:
     dimensions, metrics, dates, flags
+
+    Physical columns take their role from the precomputed column-role index;
+    only computed / aliased columns are embedded live.
     """
 
     dims, metrics, dates, flags = [], [], [], []
+    columns = df.columns.tolist()
+    if not columns:
+        return {"dimensions": dims, "metrics": metrics, "dates": dates, "flags": flags}
+
+    n = len(columns)
+    numeric = np.array([pd.api.types.is_numeric_dtype(t) for t in df.dtypes])
+    is_date = np.zeros(n, dtype=bool)
+    semantic_metric = np.zeros(n, dtype=bool)
+    is_flag = np.zeros(n, dtype=bool)
+
+    known = known_column_roles()
+    unknown = []
+    for i, col in enumerate(columns):
+        role = known.get(str(col).lower())
+        if role is None:
+            unknown.append(i)
+        elif role == "date":
+            is_date[i] = True
+        elif role == "metric":
+            semantic_metric[i] = True
+        elif role == "flag":
+            is_flag[i] = True
+
+    if unknown:
+        col_embs = _column_embeddings([str(columns[i]) for i in unknown])
+        sim_dim, sim_met, sim_date = _concept_similarities(col_embs)
+        is_date[unknown] = sim_date > 0.6
+        semantic_metric[unknown] = sim_met > sim_dim
 
-    col_embs = _embed(df.columns.tolist())
+    # the result's dtype still decides: an aliased / cast column may differ
+    is_metric = ~is_date & semantic_metric & numeric
 
-    for i, col in enumerate(df.columns):
-        sim_dim = util.cos_sim(col_embs[i], _DIM_EMB).max().item()
-        sim_met = util.cos_sim(col_embs[i], _MET_EMB).max().item()
-        sim_date = util.cos_sim(col_embs[i], _DATE_EMB).max().item()
+    # cardinality only matters for the remaining columns
+    rest = np.flatnonzero(~is_date & ~is_metric & ~is_flag)
+    few_values = is_flag.copy()
+    if len(rest):
+        few_values[rest] = _few_distinct(df.iloc[:, rest], limit=3)
 
-        if sim_date > 0.6:
+    for i, col in enumerate(columns):
+        if is_date[i]:
             dates.append(col)
-        elif sim_met > sim_dim and pd.api.types.is_numeric_dtype(df[col]):
+        elif is_metric[i]:
             metrics.append(col)
-        elif df[col].nunique() <= 3:
+        elif few_values[i]:
             flags.append(col)
         else:
             dims.append(col)
@@ -0,0 +1,178 @@
+# sql_cache.py
+"""
+Persistent NL -> SQL cache.
+
+Repeated questions skip both schema retrieval and the LLM call. Entries are
+keyed by the normalized question plus a fingerprint of data/db_schema.json,
+so a schema rescan automatically stops old SQL from being served.
+
+Stored in SQLite (data/sql_cache.sqlite) with a TTL and a max entry count
+(least recently used entries are evicted first).
+"""
+
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+DATA_DIR = "data"
+SCHEMA_JSON = os.path.join(DATA_DIR, "db_schema.json")
+CACHE_DB = os.path.join(DATA_DIR, "sql_cache.sqlite")
+
+CACHE_TTL = float(os.getenv("SQL_CACHE_TTL", str(24 * 3600)))
+CACHE_MAX_ENTRIES = int(os.getenv("SQL_CACHE_MAX_ENTRIES", "5000"))
+
+_fingerprint = {"signature": None, "value": "none"}
+_fingerprint_lock = threading.Lock()
+
+
+def normalize_question(question: str) -> str:
+    """Lowercase, collapse whitespace and drop trailing punctuation."""
+    q = re.sub(r"\s+", " ", question.strip().lower())
+    return q.rstrip(" ?!.;")
+
+
+def schema_fingerprint() -> str:
+    """
+    Content hash of db_schema.json, recomputed only when the file changes.
+    """
+    if not os.path.exists(SCHEMA_JSON):
+        return "none"
+    st = os.stat(SCHEMA_JSON)
+    sig = (st.st_mtime_ns, st.st_size)
+    with _fingerprint_lock:
+        if _fingerprint["signature"] != sig:
+            h = hashlib.sha256()
+            with open(SCHEMA_JSON, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    h.update(chunk)
+            _fingerprint.update(signature=sig, value=h.hexdigest()[:16])
+        return _fingerprint["value"]
+
+
+class SQLCache:
+    def __init__(
+        self,
+        path: str = CACHE_DB,
+        ttl: float = CACHE_TTL,
+        max_entries: int = CACHE_MAX_ENTRIES,
+    ):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS sql_cache (
+                key        TEXT PRIMARY KEY,
+                question   TEXT NOT NULL,
+                schema_fp  TEXT NOT NULL,
+                sql        TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used  REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS sql_cache_last_used ON sql_cache (last_used)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(question: str, fingerprint: str) -> str:
+        payload = f"{fingerprint}\n{normalize_question(question)}"
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, question: str) -> Optional[str]:
+        key = self.make_key(question, schema_fingerprint())
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT sql, created_at FROM sql_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                if row is not None:
+                    self._conn.execute("DELETE FROM sql_cache WHERE key = ?", (key,))
+                    self._conn.commit()
+                self.misses += 1
+                return None
+
+            self._conn.execute(
+                "UPDATE sql_cache SET last_used = ? WHERE key = ?", (now, key)
+            )
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, question: str, sql: str):
+        fp = schema_fingerprint()
+        key = self.make_key(question, fp)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT OR REPLACE INTO sql_cache
+                    (key, question, schema_fp, sql, created_at, last_used)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                (key, normalize_question(question), fp, sql, now, now),
+            )
+            # entries for an older schema can never hit again
+            self._conn.execute("DELETE FROM sql_cache WHERE schema_fp != ?", (fp,))
+            self._conn.execute(
+                "DELETE FROM sql_cache WHERE created_at < ?", (now - self.ttl,)
+            )
+            self._conn.execute(
+                """
+                DELETE FROM sql_cache WHERE key IN (
+                    SELECT key FROM sql_cache ORDER BY last_used DESC
+                    LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.max_entries,),
+            )
+            self._conn.commit()
+
+    def delete(self, question: str):
+        """Drop the SQL stored for the question (e.g. it no longer runs)."""
+        key = self.make_key(question, schema_fingerprint())
+        with self._lock:
+            self._conn.execute("DELETE FROM sql_cache WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            size = self._conn.execute("SELECT COUNT(*) FROM sql_cache").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": size,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM sql_cache")
+            self._conn.commit()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_sql_cache() -> SQLCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = SQLCache()
+    return _cache
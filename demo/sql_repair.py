@@ -0,0 +1,483 @@
+# sql_repair.py
+"""
+Bounded repair loop for generated SQL.
+
+run_with_repair() validates and executes the query. When either step fails,
+the error is classified locally (validator problems, or the SQL Server
+message) and then:
+
+- unknown table / column names are replaced by the closest catalog name
+  (difflib) and ambiguous columns are qualified with the right alias,
+  without calling the LLM;
+- anything else (type mismatches, GROUP BY errors, syntax) goes to the LLM
+  with a compact repair prompt: the failing query, the error, and only the
+  columns of the tables it uses.
+
+At most MAX_REPAIR_ATTEMPTS repairs are tried and none is started after
+REPAIR_BUDGET_S seconds; the LLM answer is cut off at the deadline too.
+Timeouts, connection / pool errors and missing permissions are not the
+query's fault: they are re-raised as they are, not retried.
+
+    sql, (table, truncated), repairs = run_with_repair(question, sql, run_sql_arrow)
+
+run_with_repair_async() is the same loop for the API server, with the query
+and the LLM call awaited.
+"""
+
+import asyncio
+import difflib
+import os
+import re
+import time
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+import httpx
+
+from db_pool import PoolTimeout
+from llm_ollama_cloud import _clean_sql, _sql_complete, call_ollama_async, stream_ollama
+from sql_validator import (
+    SchemaCatalog,
+    SQLValidationError,
+    _collect_sources,
+    _read_alias,
+    _read_name,
+    get_catalog,
+    tokenize,
+    validate_sql,
+)
+from utils.timing import maybe_stage
+
+MAX_REPAIR_ATTEMPTS = int(os.getenv("SQL_REPAIR_MAX_ATTEMPTS", "3"))
+REPAIR_BUDGET_S = float(os.getenv("SQL_REPAIR_BUDGET", "20"))
+
+MATCH_CUTOFF = 0.75  # difflib ratio for a local rename
+PROMPT_COLUMNS = 40  # per table in the repair prompt
+PROMPT_ERROR_CHARS = 400
+
+# SQL Server messages -> (kind, captured name)
+_SERVER_ERRORS = [
+    ("unknown_column", re.compile(r"Invalid column name '([^']+)'")),
+    ("unknown_column", re.compile(r'multi-part identifier "([^"]+)" could not be bound')),
+    ("unknown_table", re.compile(r"Invalid object name '([^']+)'")),
+    ("ambiguous_column", re.compile(r"Ambiguous column name '([^']+)'")),
+    ("group_by", re.compile(r"Column '([^']+)' is invalid in the select list")),
+    (
+        "type_mismatch",
+        re.compile(
+            r"Conversion failed|Operand type clash|Error converting data type"
+            r"|Arithmetic overflow|data types \w+ and \w+ are incompatible"
+        ),
+    ),
+    ("syntax", re.compile(r"Incorrect syntax near (?:the keyword )?'([^']*)'")),
+    ("timeout", re.compile(r"timeout expired|HYT00", re.IGNORECASE)),
+    (
+        "connection",
+        re.compile(
+            r"08S01|08001|08003|08004|08007|Communication link failure|TCP Provider"
+            r"|Named Pipes Provider|Login failed|Connection is busy"
+            r"|connection (?:was|has been) (?:closed|reset|forcibly closed)",
+            re.IGNORECASE,
+        ),
+    ),
+    ("permission", re.compile(r"permission was denied|does not have permission", re.IGNORECASE)),
+]
+
+# sql_validator problems -> (kind, captured name)
+_VALIDATOR_PROBLEMS = [
+    ("unknown_column", re.compile(r"^unknown table or alias .+? in (.+)$")),
+    ("unknown_table", re.compile(r"^unknown table (.+)$")),
+    ("unknown_column", re.compile(r"^unknown column (.+)$")),
+]
+
+NOT_RETRIED = {"timeout", "connection", "permission"}
+
+Edit = Tuple[int, int, str]  # (start, end, replacement) in the SQL text
+
+
+class SQLRepairError(Exception):
+    """Repair gave up; .history lists (sql, error message) per failed attempt."""
+
+    def __init__(self, message: str, history: List[Tuple[str, str]]):
+        self.history = history
+        super().__init__(message)
+
+
+def error_message(error: Exception) -> str:
+    """The readable part of a driver error, without SQLSTATE / driver prefixes."""
+    if isinstance(error, SQLValidationError):
+        return str(error)
+    args = getattr(error, "args", ())
+    text = args[1] if len(args) > 1 and isinstance(args[1], str) else str(error)
+    text = re.sub(r"\[[^\]]*\]", "", text)
+    text = re.sub(r"\(\d+\)|\(SQL\w+\)", "", text)
+    return " ".join(text.split())
+
+
+def classify_error(error: Exception) -> List[Tuple[str, Optional[str]]]:
+    """[(kind, name or None)] for every problem recognised in the error."""
+    found = []
+    if isinstance(error, PoolTimeout):
+        return [("connection", None)]
+    if isinstance(error, SQLValidationError):
+        for problem in error.problems:
+            for kind, pattern in _VALIDATOR_PROBLEMS:
+                m = pattern.match(problem)
+                if m:
+                    found.append((kind, m.group(1)))
+                    break
+            else:
+                found.append(("invalid", None))
+        return found
+
+    message = error_message(error)
+    for kind, pattern in _SERVER_ERRORS:
+        for m in pattern.finditer(message):
+            found.append((kind, m.group(1) if pattern.groups else None))
+    return found or [("other", None)]
+
+
+# --- local fixes ---------------------------------------------------------
+
+
+def _sources(tokens, catalog: SchemaCatalog):
+    """[(qualifier lowercase, qualifier as written, table key or None)] in FROM order."""
+    _, _, _, refs = _collect_sources(tokens, catalog, [])
+    out = []
+    for i in sorted(refs):
+        parts, after = _read_name(tokens, i)
+        alias, alias_end = _read_alias(tokens, after)
+        if alias:
+            out.append((alias, tokens[alias_end - 1].value, catalog.resolve(parts)))
+        else:
+            out.append((parts[-1].lower(), parts[-1], catalog.resolve(parts)))
+    return out
+
+
+def _names(tokens, refs):
+    """Yields (token positions of the parts, lowercase parts) of every column-like name."""
+    i = 0
+    while i < len(tokens):
+        t = tokens[i]
+        if t.kind not in ("word", "ident") or (i and tokens[i - 1].value == "."):
+            i += 1
+            continue
+        parts, after = _read_name(tokens, i)
+        is_call = after < len(tokens) and tokens[after].value == "("
+        is_alias = i and tokens[i - 1].is_word("as")
+        if i not in refs and not is_call and not is_alias:
+            yield list(range(i, after, 2)), [p.lower() for p in parts]
+        i = after
+
+
+def _closest(name: str, candidates) -> Optional[str]:
+    match = difflib.get_close_matches(name.lower(), list(candidates), n=1, cutoff=MATCH_CUTOFF)
+    return match[0] if match else None
+
+
+def _split_name(name: str) -> List[str]:
+    return [p.strip("[]\"").lower() for p in name.split(".")]
+
+
+def _fix_column(tokens, catalog, sources, refs, name) -> List[Edit]:
+    parts = _split_name(name)
+    column = parts[-1]
+    qualifier = parts[-2] if len(parts) > 1 else None
+    owners = {q: key for q, _, key in sources}
+    edits = []
+
+    if qualifier is not None and qualifier not in owners:
+        # wrong alias: use the first source that has the column
+        written = next(
+            (w for _, w, key in sources if key and column in catalog.columns[key]), None
+        )
+        if written is None:
+            return []
+        for pos, names in _names(tokens, refs):
+            if len(names) == 2 and names == [qualifier, column]:
+                t = tokens[pos[0]]
+                edits.append((t.start, t.end, written))
+        return edits
+
+    if qualifier is None:
+        keys = [key for _, _, key in sources if key]
+    else:
+        keys = [owners[qualifier]] if owners[qualifier] else []
+    originals = {c.lower(): c for key in keys for c in catalog.column_names[key]}
+    new = _closest(column, originals)
+    if new is None:
+        return []
+    for pos, names in _names(tokens, refs):
+        if names[-1] == column and (
+            (qualifier is None and len(names) == 1)
+            or (qualifier is not None and len(names) >= 2 and names[-2] == qualifier)
+        ):
+            t = tokens[pos[-1]]
+            edits.append((t.start, t.end, f"[{originals[new]}]"))
+    return edits
+
+
+def _fix_table(tokens, catalog, refs, name) -> List[Edit]:
+    parts = _split_name(name)
+    if len(parts) >= 2:
+        key = _closest(".".join(parts[-2:]), catalog.columns)
+    else:
+        table = _closest(parts[0], catalog.by_name)
+        key = catalog.resolve([table]) if table else None
+    if key is None:
+        return []
+    new_table = catalog.display[key].split(".", 1)[1]
+    edits = []
+    for i in refs:
+        ref_parts, after = _read_name(tokens, i)
+        if [p.lower() for p in ref_parts[-len(parts):]] == parts:
+            edits.append((tokens[i].start, tokens[after - 1].end, catalog.display[key]))
+    # the old name used as a qualifier: Salse.Amount
+    for pos, names in _names(tokens, refs):
+        if len(names) >= 2 and names[-2] == parts[-1]:
+            t = tokens[pos[-2]]
+            edits.append((t.start, t.end, new_table))
+    return edits
+
+
+def _fix_ambiguous(tokens, catalog, sources, refs, name) -> List[Edit]:
+    column = _split_name(name)[-1]
+    owner = next(
+        (written for _, written, key in sources if key and column in catalog.columns[key]),
+        None,
+    )
+    if owner is None:
+        return []
+    return [
+        (tokens[pos[0]].start, tokens[pos[0]].end, f"{owner}.{tokens[pos[0]].value}")
+        for pos, names in _names(tokens, refs)
+        if names == [column]
+    ]
+
+
+def fix_locally(sql: str, errors, catalog: SchemaCatalog) -> Optional[str]:
+    """
+    Deterministic fix for unknown / ambiguous names, or None when some error
+    needs the LLM. A query the validator itself trips over (not just
+    SQLValidationError) also goes to the LLM instead of failing the loop.
+    """
+    edits: List[Edit] = []
+    try:
+        tokens = tokenize(sql)
+        _, _, _, refs = _collect_sources(tokens, catalog, [])
+        sources = _sources(tokens, catalog)
+        for kind, name in errors:
+            if kind == "unknown_column" and name:
+                fix = _fix_column(tokens, catalog, sources, refs, name)
+            elif kind == "unknown_table" and name:
+                fix = _fix_table(tokens, catalog, refs, name)
+            elif kind == "ambiguous_column" and name:
+                fix = _fix_ambiguous(tokens, catalog, sources, refs, name)
+            else:
+                fix = []
+            if not fix:
+                return None
+            edits += fix
+    except Exception:
+        return None
+
+    for start, end, text in sorted(set(edits), reverse=True):
+        sql = sql[:start] + text + sql[end:]
+    return sql
+
+
+# --- LLM fallback --------------------------------------------------------
+
+
+def repair_prompt(question: str, sql: str, message: str, errors, catalog: SchemaCatalog) -> str:
+    """Failing query + error + the columns of the tables involved; nothing else."""
+    keys = []
+    try:
+        keys = [key for _, _, key in _sources(tokenize(sql), catalog) if key]
+    except Exception:
+        pass  # prompt without the tables, the error message still helps
+    for kind, name in errors:
+        if kind == "unknown_table" and name:
+            table = _split_name(name)[-1]
+            matches = difflib.get_close_matches(table, list(catalog.by_name), n=3, cutoff=0.5)
+            keys += [key for m in matches for key in catalog.by_name[m]]
+
+    lines = []
+    for key in dict.fromkeys(keys):
+        cols = catalog.column_names[key]
+        more = f", ... (+{len(cols) - PROMPT_COLUMNS})" if len(cols) > PROMPT_COLUMNS else ""
+        lines.append(f"{catalog.display[key]}: {', '.join(cols[:PROMPT_COLUMNS])}{more}")
+    tables = "\n".join(lines) or "(none recognised)"
+
+    return f"""
+The SQL Server (T-SQL) query below failed. Fix it so it answers the question.
+Use only the tables and columns listed. Return only the corrected query in a ```sql block.
+
+Question: {question}
+
+Error: {message[:PROMPT_ERROR_CHARS]}
+
+Query:
+```sql
+{sql}
+```
+
+Tables:
+{tables}
+"""
+
+
+def _llm_fix(prompt: str, deadline: float) -> Optional[str]:
+    """The model's corrected SQL, or None if it ran past the deadline."""
+    text = ""
+    # the client timeout bounds each wait (connect, first piece, next piece),
+    # the check below the whole answer
+    pieces = stream_ollama(prompt, timeout=max(0.1, deadline - time.monotonic()))
+    try:
+        for piece in pieces:
+            text += piece
+            if _sql_complete(text):
+                break
+            if time.monotonic() > deadline:
+                return None
+    except httpx.TimeoutException:
+        return None
+    finally:
+        pieces.close()
+    return _clean_sql(text) or None
+
+
+async def llm_fix_async(prompt: str, deadline: float) -> Optional[str]:
+    """_llm_fix on the async client; None if no answer by the deadline."""
+    try:
+        text = await asyncio.wait_for(
+            call_ollama_async(prompt), max(0.0, deadline - time.monotonic())
+        )
+    except asyncio.TimeoutError:
+        return None
+    return _clean_sql(text) or None
+
+
+# --- loop ----------------------------------------------------------------
+
+
+class _Repair:
+    """Attempt bookkeeping shared by run_with_repair and run_with_repair_async."""
+
+    def __init__(self, question, sql, max_attempts, budget, catalog):
+        self.question = question
+        self.max_attempts = max_attempts
+        self.budget = budget
+        self.catalog = catalog
+        self.history: List[Tuple[str, str]] = []
+        self.seen = {sql.strip()}
+        self.deadline = None
+        self.prompt = None
+        self.error = None
+        self.message = ""
+
+    def failed(self, sql: str, error: Exception) -> Optional[str]:
+        """
+        Record the failure and return a local fix, or None with .prompt set
+        for the LLM. Raises SQLRepairError when it's time to give up.
+        """
+        self.error = error
+        self.message = message = error_message(error)
+        self.history.append((sql, message))
+        errors = classify_error(error)
+        if self.deadline is None:
+            self.deadline = time.monotonic() + self.budget
+
+        if any(kind in NOT_RETRIED for kind, _ in errors):
+            raise error
+        if (
+            len(self.history) > self.max_attempts
+            or time.monotonic() >= self.deadline
+        ):
+            raise SQLRepairError(message, self.history) from error
+
+        fixed = fix_locally(sql, errors, self.catalog)
+        if fixed is not None and fixed.strip() not in self.seen:
+            return fixed
+        self.prompt = repair_prompt(self.question, sql, message, errors, self.catalog)
+        return None
+
+    def retry(self, fixed: Optional[str], how: str, on_repair) -> str:
+        """The SQL for the next attempt; SQLRepairError if there's nothing new."""
+        if not fixed or fixed.strip() in self.seen:
+            raise SQLRepairError(self.message, self.history) from self.error
+        self.seen.add(fixed.strip())
+        if on_repair is not None:
+            on_repair(fixed, self.message, how)
+        return fixed
+
+
+def run_with_repair(
+    question: str,
+    sql: str,
+    execute: Callable[[str], object],
+    max_attempts: int = MAX_REPAIR_ATTEMPTS,
+    budget: float = REPAIR_BUDGET_S,
+    on_repair: Optional[Callable[[str, str, str], None]] = None,
+    timer=None,
+    catalog: Optional[SchemaCatalog] = None,
+):
+    """
+    Validate and execute `sql`, repairing it on failure.
+    Returns (sql that ran, execute() result, number of repairs).
+
+    on_repair(new_sql, error_message, how) is called before each retry.
+    Raises SQLRepairError when the query could not be repaired in time;
+    errors in NOT_RETRIED (timeouts, connection, permissions) as they are.
+    """
+    repair = _Repair(question, sql, max_attempts, budget, catalog or get_catalog())
+
+    while True:
+        try:
+            with maybe_stage(timer, "validate"):
+                checked = validate_sql(sql, catalog=repair.catalog)
+            with maybe_stage(timer, "query"):
+                return sql, execute(checked), len(repair.history)
+        except Exception as e:
+            error = e
+
+        with maybe_stage(timer, "repair"):
+            fixed, how = repair.failed(sql, error), "fixed locally"
+            if fixed is None:
+                fixed, how = _llm_fix(repair.prompt, repair.deadline), "rewritten by the LLM"
+        sql = repair.retry(fixed, how, on_repair)
+
+
+async def run_with_repair_async(
+    question: str,
+    sql: str,
+    execute: Callable[[str], Awaitable],
+    llm_fix: Callable[[str, float], Awaitable[Optional[str]]] = llm_fix_async,
+    max_attempts: int = MAX_REPAIR_ATTEMPTS,
+    budget: float = REPAIR_BUDGET_S,
+    on_repair: Optional[Callable[[str, str, str], None]] = None,
+    timer=None,
+    catalog: Optional[SchemaCatalog] = None,
+):
+    """
+    run_with_repair for asyncio servers: execute(sql) is awaited (e.g. the
+    query in a DB thread pool) and LLM repairs go through llm_fix(prompt,
+    deadline), so the caller can bound them like its other LLM calls.
+    Validation and local fixes are cheap and run on the event loop; pass
+    `catalog` to keep its first load off the loop too.
+    """
+    repair = _Repair(question, sql, max_attempts, budget, catalog or get_catalog())
+
+    while True:
+        try:
+            with maybe_stage(timer, "validate"):
+                checked = validate_sql(sql, catalog=repair.catalog)
+            with maybe_stage(timer, "query"):
+                return sql, await execute(checked), len(repair.history)
+        except Exception as e:
+            error = e
+
+        with maybe_stage(timer, "repair"):
+            fixed, how = repair.failed(sql, error), "fixed locally"
+            if fixed is None:
+                fixed, how = await llm_fix(repair.prompt, repair.deadline), "rewritten by the LLM"
+        sql = repair.retry(fixed, how, on_repair)
@@ -0,0 +1,504 @@
+# sql_validator.py
+"""
+Local checks for generated SQL before it reaches SQL Server.
+
+validate_sql() tokenizes the query (no database round-trip) and rejects it
+unless it is a single read-only SELECT (optionally with CTEs) whose tables
+and qualified columns exist in the catalog built from data/db_schema.json.
+Unqualified names must be a column of one of the query's tables, an alias,
+or a T-SQL keyword / function. The returned SQL has a TOP limit injected
+into the outer SELECT (or a too-large TOP lowered), so a runaway query
+cannot stream millions of rows; db.py adds the query timeout.
+
+    sql = validate_sql(sql)   # raises SQLValidationError
+"""
+
+import json
+import os
+import re
+import threading
+from typing import Dict, List, Optional, Set, Tuple
+
+DATA_DIR = "data"
+SCHEMA_JSON = os.path.join(DATA_DIR, "db_schema.json")
+
+# one row over db.MAX_RESULT_ROWS, so the fetch cap can still tell that the
+# result was truncated
+MAX_ROWS = int(os.getenv("DB_MAX_RESULT_ROWS", "200000")) + 1
+
+FORBIDDEN = {
+    "insert", "update", "delete", "merge", "drop", "alter", "create", "truncate",
+    "exec", "execute", "grant", "revoke", "deny", "into", "backup", "restore",
+    "dbcc", "shutdown", "kill", "reconfigure", "openrowset", "openquery",
+    "opendatasource", "openxml", "bulk", "waitfor", "use", "declare", "set",
+    "begin", "commit", "rollback", "save", "transaction", "go",
+}
+
+# clauses and operators: never a table or column alias
+RESERVED = {
+    "select", "distinct", "all", "top", "percent", "ties", "with", "as", "from",
+    "where", "group", "by", "having", "order", "asc", "desc", "join", "inner",
+    "left", "right", "full", "outer", "cross", "apply", "on", "and", "or", "not",
+    "in", "exists", "between", "like", "escape", "is", "null", "case", "when",
+    "then", "else", "end", "union", "intersect", "except", "offset", "fetch",
+    "next", "first", "rows", "row", "only", "over", "partition", "range",
+    "unbounded", "preceding", "following", "current", "within", "pivot",
+    "unpivot", "for", "collate", "some", "any", "nolock", "readuncommitted",
+    "option", "recompile", "maxdop", "values", "true", "false", "tablesample",
+}
+
+# words that may appear unqualified without being columns
+KEYWORDS = RESERVED | {
+    # types (CAST / CONVERT targets)
+    "int", "bigint", "smallint", "tinyint", "bit", "decimal", "numeric", "money",
+    "smallmoney", "float", "real", "date", "datetime", "datetime2",
+    "smalldatetime", "datetimeoffset", "time", "char", "varchar", "nchar",
+    "nvarchar", "text", "ntext", "binary", "varbinary", "uniqueidentifier", "max",
+    # date parts
+    "year", "yy", "yyyy", "quarter", "qq", "q", "month", "mm", "m", "dayofyear",
+    "dy", "y", "day", "dd", "d", "week", "wk", "ww", "weekday", "dw", "hour",
+    "hh", "minute", "mi", "n", "second", "ss", "s", "millisecond", "ms",
+    "microsecond", "mcs", "nanosecond", "ns", "iso_week", "isowk", "isoww",
+    # niladic functions
+    "current_timestamp", "current_user", "session_user", "system_user", "user",
+}
+
+_CLAUSE_END = {
+    "where", "group", "having", "order", "union", "intersect", "except", "on",
+    "option", "offset", "for", "window",
+}
+_JOIN_WORDS = {"join", "apply"}
+
+_TOKEN_RE = re.compile(
+    r"""
+    (?P<ws>\s+)
+  | (?P<comment>--[^\n]*|/\*.*?\*/)
+  | (?P<string>N?'(?:[^']|'')*')
+  | (?P<bracket>\[(?:[^\]]|\]\])+\])
+  | (?P<dquote>"(?:[^"]|"")+")
+  | (?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+  | (?P<var>@@?\w+)
+  | (?P<temp>\#\#?\w+)
+  | (?P<word>[A-Za-z_][\w$]*)
+  | (?P<op><>|!=|>=|<=|[-+*/%=<>(),.;~&|^!])
+    """,
+    re.VERBOSE | re.DOTALL,
+)
+
+
+class SQLValidationError(ValueError):
+    """The query was rejected locally; .problems lists every reason."""
+
+    def __init__(self, problems: List[str]):
+        self.problems = problems
+        super().__init__("; ".join(problems))
+
+
+class Token:
+    __slots__ = ("kind", "value", "lower", "start", "end")
+
+    def __init__(self, kind, value, start, end):
+        self.kind = kind  # "word", "ident" (quoted), "string", "number", "var", "temp", "op"
+        self.value = value
+        self.lower = value.lower()
+        self.start = start
+        self.end = end
+
+    def is_word(self, *words) -> bool:
+        return self.kind == "word" and self.lower in words
+
+    def is_name(self) -> bool:
+        return self.kind == "ident" or (self.kind == "word" and self.lower not in KEYWORDS)
+
+    def is_alias(self) -> bool:
+        # short aliases such as "s" or "m" double as date parts
+        return self.kind == "ident" or (self.kind == "word" and self.lower not in RESERVED)
+
+
+def tokenize(sql: str) -> List[Token]:
+    tokens = []
+    pos = 0
+    while pos < len(sql):
+        m = _TOKEN_RE.match(sql, pos)
+        if m is None:
+            if sql.startswith(("'", "N'"), pos) or sql.startswith("/*", pos):
+                raise SQLValidationError(["unterminated string or comment"])
+            raise SQLValidationError([f"unexpected character {sql[pos]!r}"])
+        kind = m.lastgroup
+        text = m.group()
+        if kind == "bracket":
+            tokens.append(Token("ident", text[1:-1].replace("]]", "]"), m.start(), m.end()))
+        elif kind == "dquote":
+            tokens.append(Token("ident", text[1:-1].replace('""', '"'), m.start(), m.end()))
+        elif kind not in ("ws", "comment"):
+            tokens.append(Token(kind, text, m.start(), m.end()))
+        pos = m.end()
+    return tokens
+
+
+def normalize_sql(sql: str) -> str:
+    """
+    Canonical text for cache keys: comments, whitespace and a trailing ";"
+    dropped, keywords and names lowercased, literals kept as written.
+    """
+    tokens = tokenize(sql)
+    while tokens and tokens[-1].value == ";":
+        tokens.pop()
+    out = []
+    for t in tokens:
+        if t.kind == "ident":
+            out.append(f"[{t.lower}]")
+        elif t.kind in ("word", "var", "temp"):
+            out.append(t.lower)
+        else:
+            out.append(t.value)
+    return " ".join(out)
+
+
+class SchemaCatalog:
+    """Tables and columns from db_schema.json, lowercase."""
+
+    def __init__(self, schema_entries):
+        self.columns: Dict[str, Set[str]] = {}
+        self.by_name: Dict[str, List[str]] = {}
+        # original spelling, for messages and repairs
+        self.display: Dict[str, str] = {}
+        self.column_names: Dict[str, List[str]] = {}
+        for e in schema_entries:
+            key = f"{e['schema']}.{e['table']}".lower()
+            self.columns[key] = {c["name"].lower() for c in e["columns"]}
+            self.by_name.setdefault(e["table"].lower(), []).append(key)
+            self.display[key] = f"[{e['schema']}].[{e['table']}]"
+            self.column_names[key] = [c["name"] for c in e["columns"]]
+
+    def resolve(self, parts: List[str]) -> Optional[str]:
+        """Catalog key (schema.table) for a 1-3 part name, or None if unknown."""
+        parts = [p.lower() for p in parts]
+        if len(parts) >= 2:
+            key = f"{parts[-2]}.{parts[-1]}"
+            return key if key in self.columns else None
+        keys = self.by_name.get(parts[0], [])
+        if len(keys) == 1:
+            return keys[0]
+        if f"dbo.{parts[0]}" in keys:
+            return f"dbo.{parts[0]}"
+        return None
+
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def get_catalog() -> SchemaCatalog:
+    """The catalog for the current db_schema.json (rebuilt when it changes)."""
+    global _catalog
+    st = os.stat(SCHEMA_JSON)
+    sig = (st.st_mtime_ns, st.st_size)
+    cached = _catalog
+    if cached is not None and cached[0] == sig:
+        return cached[1]
+    with _catalog_lock:
+        cached = _catalog
+        if cached is None or cached[0] != sig:
+            with open(SCHEMA_JSON, "r", encoding="utf-8") as f:
+                cached = (sig, SchemaCatalog(json.load(f)))
+            _catalog = cached
+        return cached[1]
+
+
+def _read_name(tokens, i) -> Tuple[List[str], int]:
+    """Dotted name starting at tokens[i]: (parts, index after it)."""
+    parts = [tokens[i].value]
+    i += 1
+    while i + 1 < len(tokens) and tokens[i].value == "." and tokens[i + 1].kind in ("word", "ident"):
+        parts.append(tokens[i + 1].value)
+        i += 2
+    return parts, i
+
+
+def _matching_paren(tokens, i) -> int:
+    depth = 0
+    for j in range(i, len(tokens)):
+        if tokens[j].value == "(":
+            depth += 1
+        elif tokens[j].value == ")":
+            depth -= 1
+            if depth == 0:
+                return j
+    raise SQLValidationError(["unbalanced parentheses"])
+
+
+def _read_alias(tokens, i) -> Tuple[Optional[str], int]:
+    if i < len(tokens) and tokens[i].is_word("as"):
+        i += 1
+        if i < len(tokens) and tokens[i].kind in ("word", "ident", "string"):
+            return tokens[i].value.strip("'").lower(), i + 1
+        return None, i
+    if i < len(tokens) and tokens[i].is_alias():
+        return tokens[i].lower, i + 1
+    return None, i
+
+
+def _check_statement(tokens, problems):
+    if not tokens:
+        problems.append("empty query")
+        return
+    if not tokens[0].is_word("select", "with"):
+        problems.append("only SELECT queries are allowed")
+
+    for j, t in enumerate(tokens):
+        if t.kind == "word" and t.lower in FORBIDDEN:
+            # SET inside "UPDATE ... SET" is caught by UPDATE; alone it is a statement
+            problems.append(f"{t.value.upper()} is not allowed")
+        elif t.kind == "word" and t.lower.startswith(("xp_", "sp_")):
+            problems.append(f"procedure call {t.value} is not allowed")
+        elif t.kind == "temp":
+            problems.append(f"temporary table {t.value} is not allowed")
+        elif t.value == ";" and any(x.value != ";" for x in tokens[j + 1 :]):
+            problems.append("only one statement is allowed")
+
+
+def _collect_sources(tokens, catalog, problems):
+    """
+    Table references after FROM / JOIN / APPLY (and commas in a FROM list).
+    Returns (alias -> set of table keys or None for CTEs / derived tables,
+    referenced table keys, whether any source has unknown columns, token
+    positions of the table names).
+    """
+    aliases: Dict[str, Set[Optional[str]]] = {}
+    tables: Set[str] = set()
+    refs: Set[int] = set()
+    opaque = False
+
+    # CTE names: WITH name [(cols)] AS ( ... ) [, name AS ( ... )]
+    ctes = set()
+    for j, t in enumerate(tokens):
+        if t.is_alias() and j + 1 < len(tokens):
+            nxt = tokens[j + 1]
+            prev = tokens[j - 1] if j else None
+            if prev is None or not (prev.is_word("with") or prev.value == ","):
+                continue
+            if nxt.value == "(":
+                # name (cols) AS, not a call like ", SUM(Amount)" at the very end
+                close = _matching_paren(tokens, j + 1)
+                is_cte = close + 1 < len(tokens) and tokens[close + 1].is_word("as")
+            else:
+                is_cte = nxt.is_word("as")
+            if is_cte:
+                ctes.add(t.lower)
+
+    in_from: List[bool] = [False]
+    i = 0
+    while i < len(tokens):
+        t = tokens[i]
+        if t.value == "(":
+            in_from.append(False)
+            i += 1
+            continue
+        if t.value == ")":
+            if len(in_from) > 1:
+                in_from.pop()
+            i += 1
+            continue
+        if t.kind == "word" and t.lower in _CLAUSE_END:
+            in_from[-1] = False
+
+        starts_ref = t.is_word("from") or (t.kind == "word" and t.lower in _JOIN_WORDS)
+        if t.is_word("from"):
+            in_from[-1] = True
+        elif t.value == "," and in_from[-1]:
+            starts_ref = True
+        if not starts_ref or i + 1 >= len(tokens):
+            i += 1
+            continue
+
+        i += 1
+        if tokens[i].value == "(":
+            # derived table: its own FROM is checked when the scan gets there
+            close = _matching_paren(tokens, i)
+            alias, _ = _read_alias(tokens, close + 1)
+            if alias:
+                aliases.setdefault(alias, set()).add(None)
+            opaque = True
+            continue
+        if tokens[i].kind not in ("word", "ident"):
+            continue
+
+        parts, after = _read_name(tokens, i)
+        refs.add(i)
+        if after < len(tokens) and tokens[after].value == "(":
+            # table-valued function (APPLY / FROM fn(...))
+            opaque = True
+            close = _matching_paren(tokens, after)
+            alias, _ = _read_alias(tokens, close + 1)
+            if alias:
+                aliases.setdefault(alias, set()).add(None)
+            i = after
+            continue
+
+        if len(parts) > 3:
+            problems.append(f"linked server reference {'.'.join(parts)} is not allowed")
+            key = None
+        elif len(parts) == 1 and parts[0].lower() in ctes:
+            key = None
+            opaque = True
+        else:
+            key = catalog.resolve(parts)
+            if key is None:
+                problems.append(f"unknown table {'.'.join(parts)}")
+            else:
+                tables.add(key)
+
+        aliases.setdefault(parts[-1].lower(), set()).add(key)
+        alias, after = _read_alias(tokens, after)
+        if alias:
+            aliases.setdefault(alias, set()).add(key)
+        # WITH (NOLOCK) style table hints
+        if after + 1 < len(tokens) and tokens[after].is_word("with") and tokens[after + 1].value == "(":
+            after = _matching_paren(tokens, after + 1) + 1
+        i = after
+
+    return aliases, tables, opaque, refs
+
+
+def _top_ends(tokens) -> Set[int]:
+    """Positions of the last token of each TOP n / TOP (n) clause."""
+    ends = set()
+    for k, t in enumerate(tokens):
+        if t.is_word("top") and k + 1 < len(tokens):
+            ends.add(_matching_paren(tokens, k + 1) if tokens[k + 1].value == "(" else k + 1)
+    return ends
+
+
+def _check_columns(tokens, catalog, aliases, tables, opaque, refs, problems):
+    known_columns = set()
+    for key in tables:
+        known_columns |= catalog.columns[key]
+    top_ends = _top_ends(tokens)
+
+    # output / CTE column aliases: "... AS name", "expr name", "name = expr"
+    defined = set()
+    for j, t in enumerate(tokens):
+        if t.is_name():
+            prev = tokens[j - 1] if j else None
+            if prev is not None and j - 1 not in top_ends and (
+                prev.is_word("as")
+                or prev.value == ")"
+                or prev.kind in ("string", "number", "ident")
+                or (prev.kind == "word" and prev.lower not in KEYWORDS)
+            ):
+                defined.add(t.lower)
+            if (
+                j + 1 < len(tokens)
+                and tokens[j + 1].value == "="
+                and prev is not None
+                and (prev.value == "," or prev.is_word("select"))
+            ):
+                defined.add(t.lower)
+        elif t.kind == "string" and j and tokens[j - 1].is_word("as"):
+            defined.add(t.value.strip("'").lower())
+
+    # column lists of CTEs: WITH name (a, b) AS (...)
+    for j, t in enumerate(tokens):
+        if t.value == "(" and j and tokens[j - 1].is_name():
+            close = _matching_paren(tokens, j)
+            if close + 1 < len(tokens) and tokens[close + 1].is_word("as"):
+                defined |= {x.lower for x in tokens[j + 1 : close] if x.is_name()}
+
+    i = 0
+    while i < len(tokens):
+        t = tokens[i]
+        if t.kind not in ("word", "ident"):
+            i += 1
+            continue
+        prev = tokens[i - 1] if i else None
+        if prev is not None and prev.value == ".":
+            i += 1
+            continue
+        parts, after = _read_name(tokens, i)
+        is_call = after < len(tokens) and tokens[after].value == "("
+
+        if i in refs:
+            pass  # a table name, checked with the sources
+        elif len(parts) >= 2 and not is_call:
+            qualifier, column = parts[-2].lower(), parts[-1].lower()
+            owner = aliases.get(qualifier)
+            if owner is None:
+                problems.append(f"unknown table or alias {parts[-2]} in {'.'.join(parts)}")
+            elif column != "*" and None not in owner and not any(
+                column in catalog.columns[k] for k in owner if k is not None
+            ):
+                problems.append(f"unknown column {'.'.join(parts)}")
+        elif len(parts) == 1 and not is_call and t.is_name():
+            name = t.lower
+            if not (
+                name in known_columns
+                or name in defined
+                or name in aliases
+                or opaque
+            ):
+                problems.append(f"unknown column {t.value}")
+        i = after
+
+
+def validate_sql(
+    sql: str, max_rows: int = MAX_ROWS, catalog: Optional[SchemaCatalog] = None
+) -> str:
+    """
+    Check `sql` against the schema catalog and return it with a row limit.
+    Raises SQLValidationError listing every problem found.
+    """
+    tokens = tokenize(sql)
+    problems: List[str] = []
+
+    _check_statement(tokens, problems)
+    if problems:
+        raise SQLValidationError(problems)
+
+    catalog = catalog or get_catalog()
+    aliases, tables, opaque, refs = _collect_sources(tokens, catalog, problems)
+    _check_columns(tokens, catalog, aliases, tables, opaque, refs, problems)
+    if problems:
+        raise SQLValidationError(list(dict.fromkeys(problems)))
+
+    return _limit_rows(sql, tokens, max_rows)
+
+
+def _limit_rows(sql: str, tokens: List[Token], max_rows: int) -> str:
+    """TOP (max_rows) on the outer SELECT, unless it pages or sets (UNION)."""
+    depth = 0
+    outer_select = None
+    for t in tokens:
+        if t.value == "(":
+            depth += 1
+        elif t.value == ")":
+            depth -= 1
+        elif depth == 0 and t.kind == "word":
+            if t.lower in ("union", "intersect", "except", "offset"):
+                return sql
+            if t.lower == "select" and outer_select is None:
+                outer_select = t
+    if outer_select is None:
+        return sql
+
+    i = tokens.index(outer_select) + 1
+    if i < len(tokens) and tokens[i].is_word("distinct", "all"):
+        i += 1
+    if i < len(tokens) and tokens[i].is_word("top"):
+        # lower an existing TOP n / TOP (n) that asks for more
+        j = i + 1
+        paren = j < len(tokens) and tokens[j].value == "("
+        num = tokens[j + 1] if paren else (tokens[j] if j < len(tokens) else None)
+        after = tokens[j + 3] if paren and j + 3 < len(tokens) else (tokens[j + 1] if not paren and j + 1 < len(tokens) else None)
+        if (
+            num is not None
+            and num.kind == "number"
+            and "." not in num.value
+            and int(num.value) > max_rows
+            and not (after is not None and after.is_word("percent"))
+        ):
+            return sql[: num.start] + str(max_rows) + sql[num.end :]
+        return sql
+
+    at = tokens[i - 1].end
+    return f"{sql[:at]} TOP ({max_rows}){sql[at:]}"
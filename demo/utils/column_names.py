@@ -0,0 +1,22 @@
+# utils/column_names.py
+from typing import Iterable, List
+
+
+def unique_column_names(names: Iterable[str]) -> List[str]:
+    """Duplicate names suffixed in order (Id, Id_1, ...), e.g. for SELECT a.Id, b.Id."""
+    names = list(names)
+    seen = set(names)
+    counts = {}
+    out = []
+    for name in names:
+        if name in counts:
+            n = counts[name]
+            while f"{name}_{n}" in seen:
+                n += 1
+            counts[name] = n + 1
+            seen.add(f"{name}_{n}")
+            out.append(f"{name}_{n}")
+        else:
+            counts[name] = 1
+            out.append(name)
+    return out
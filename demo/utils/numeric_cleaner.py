@@ -3,7 +3,9 @@ import pandas as pd
 
 
 def clean_numeric_columns(df: pd.DataFrame):
-    out = df.copy()
+    # shallow copy: only the columns we convert get new data, the rest
+    # (typically already-numeric Arrow-backed columns) are shared, not copied
+    out = df.copy(deep=False)
 
     for col in out.columns:
         if out[col].dtype == object:
@@ -0,0 +1,110 @@
+# utils/single_flight.py
+import asyncio
+import threading
+from typing import Awaitable, Callable, Dict, Hashable
+
+
+class _Call:
+    __slots__ = ("done", "result", "error", "abandoned")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.abandoned = False
+
+
+class SingleFlight:
+    """
+    Request coalescing for threads: while a call for a key is running, other
+    calls with the same key wait for it and get its result (or exception)
+    instead of running fn again.
+
+        flights = SingleFlight()
+        sql = flights.do(normalize_question(q), generate, q)
+
+    Only in-flight calls are shared; nothing is kept once the call returns.
+    Waiters get the same object, so results should be treated as read-only.
+    Only results and Exceptions are shared: if the leader is stopped by a
+    BaseException (st.stop / st.rerun, KeyboardInterrupt), the waiters run
+    the call again themselves.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self.calls = 0
+        self.shared = 0
+
+    def do(self, key: Hashable, fn: Callable, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.calls += 1
+            else:
+                self.shared += 1
+
+        if not leader:
+            call.done.wait()
+            if call.abandoned:
+                return self.do(key, fn, *args, **kwargs)
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        except BaseException:
+            # aimed at the leader's own session / thread, not at the waiters
+            call.abandoned = True
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"calls": self.calls, "shared": self.shared, "in_flight": len(self._calls)}
+
+
+class AsyncSingleFlight:
+    """
+    SingleFlight for coroutines on one event loop:
+
+        sql = await flights.do(key, nl_to_sql_async, q)
+
+    The shared call runs as its own task, so a waiter that is cancelled
+    (client went away) doesn't cancel it for the others.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+        self.calls = 0
+        self.shared = 0
+
+    async def do(self, key: Hashable, fn: Callable[..., Awaitable], *args, **kwargs):
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn(*args, **kwargs))
+            self._calls[key] = task
+
+            def finished(t):
+                self._calls.pop(key, None)
+                if not t.cancelled():
+                    t.exception()  # retrieved, even if every waiter went away
+
+            task.add_done_callback(finished)
+            self.calls += 1
+        else:
+            self.shared += 1
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict:
+        return {"calls": self.calls, "shared": self.shared, "in_flight": len(self._calls)}
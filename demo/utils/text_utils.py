@@ -0,0 +1,78 @@
+# utils/text_utils.py
+from collections import deque
+from typing import Dict, Hashable, Iterable, Iterator, List, Tuple
+
+
+class AhoCorasick:
+    """
+    Multi-pattern substring matcher: one pass over the text finds every
+    occurrence of every pattern, however many patterns there are.
+
+        m = AhoCorasick()
+        m.add("sales", "dbo.sales")
+        m.build()
+        list(m.find("total sales by party"))  # [("dbo.sales", 6, 11)]
+
+    Matching is case-insensitive. A pattern may carry several values (e.g.
+    the same table name in two schemas); each is reported.
+    """
+
+    def __init__(self, patterns: Iterable[Tuple[str, Hashable]] = ()):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._own: List[List[Tuple[Hashable, int]]] = [[]]  # patterns ending here
+        self._out: List[List[Tuple[Hashable, int]]] = [[]]  # ... plus suffix matches
+        self._built = False
+        for pattern, value in patterns:
+            self.add(pattern, value)
+
+    def add(self, pattern: str, value: Hashable):
+        pattern = pattern.lower()
+        if not pattern:
+            return
+        node = 0
+        for ch in pattern:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._own.append([])
+            node = nxt
+        self._own[node].append((value, len(pattern)))
+        self._built = False
+
+    def build(self):
+        """Compute failure links (breadth-first). Call after the last add()."""
+        self._out = [list(own) for own in self._own]
+        queue = deque(self._goto[0].values())
+        for node in queue:
+            self._fail[node] = 0
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                f = self._fail[node]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                self._fail[nxt] = self._goto[f].get(ch, 0)
+                # the fail node is shallower, so its outputs are final already
+                self._out[nxt] += self._out[self._fail[nxt]]
+        self._built = True
+
+    def find(self, text: str) -> Iterator[Tuple[Hashable, int, int]]:
+        """Yields (value, start, end) for every match in `text`."""
+        if not self._built:
+            self.build()
+        node = 0
+        for i, ch in enumerate(text.lower()):
+            while node and ch not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(ch, 0)
+            for value, length in self._out[node]:
+                yield value, i + 1 - length, i + 1
+
+    def values_in(self, text: str) -> List[Hashable]:
+        """Distinct matched values, in order of first occurrence."""
+        return list(dict.fromkeys(value for value, _, _ in self.find(text)))
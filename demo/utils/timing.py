@@ -0,0 +1,54 @@
+# utils/timing.py
+import threading
+from contextlib import contextmanager
+from time import perf_counter
+
+
+class StageTimer:
+    """
+    Wall-clock seconds per pipeline stage. Stages may run in worker threads,
+    so overlapping stages can add up to more than total().
+    """
+
+    def __init__(self):
+        self._start = perf_counter()
+        self._lock = threading.Lock()
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        t0 = perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = perf_counter() - t0
+            with self._lock:
+                self.stages[name] = self.stages.get(name, 0.0) + elapsed
+
+    def timed(self, name: str, fn):
+        """fn wrapped so each call is recorded under `name` (for executor.submit)."""
+
+        def run(*args, **kwargs):
+            with self.stage(name):
+                return fn(*args, **kwargs)
+
+        return run
+
+    def total(self) -> float:
+        return perf_counter() - self._start
+
+    def summary(self) -> str:
+        with self._lock:
+            parts = [f"{name} {secs:.2f}s" for name, secs in self.stages.items()]
+        parts.append(f"total {self.total():.2f}s")
+        return " | ".join(parts)
+
+
+@contextmanager
+def maybe_stage(timer, name: str):
+    """timer.stage(name), or nothing when no timer was passed."""
+    if timer is None:
+        yield
+    else:
+        with timer.stage(name):
+            yield